@@ -1,15 +1,24 @@
 import os
 import sys
-from multiprocessing.managers import SyncManager
 
 import enlighten
 import argparse
 import yaml
 
-from wanda.bgp_dg_generation import main_bgp
+from wanda.bgp_dg_generation import INCONSISTENT_FILTER_GROUPS_EXIT_CODE, main_bgp
 from wanda.filter_list_generation import main_customer_filter_lists
-from wanda.irrd_client import IRRDClient
-from wanda.peeringmanager_client import PeeringManagerClient
+from wanda.generation_delta import DeltaState
+from wanda.http_session import DEFAULT_BACKOFF_FACTOR, DEFAULT_POOL_SIZE, DEFAULT_RETRIES, PooledSession
+from wanda.irrd_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_AGE, DEFAULT_MAX_SIZE_MB, DEFAULT_TTL, IRRDCache
+from wanda.irrd_client import DEFAULT_BATCH_SIZE, DEFAULT_WHOIS_PORT, IRRDClient
+from wanda.irrd_scheduler import QueryCosts
+from wanda.local_irrd_client import LocalIRRDClient
+from wanda.output_state import OutputState
+from wanda.peeringmanager_client import DEFAULT_PAGE_SIZE, PeeringManagerClient
+from wanda.peeringmanager_snapshot import PeeringManagerSnapshot
+from wanda.response_archive import ResponseArchive
+from wanda.rpsl_store import RPSLStore
+from wanda.worker_pool import DEFAULT_JOBS
 
 from wanda.logger import Logger
 
@@ -22,7 +31,14 @@ def main() -> int:
     parser.add_argument('--fast', action='store_true', help='Skips filter list generation')
     parser.add_argument('--limit', default=[], metavar="STRING", action="append", help='List of hosts to generate configurations')
     parser.add_argument('--threads', default=-1, type=int, help='Limits the amount of used threads')
+    parser.add_argument('--jobs', '-j', type=int, help='Number of worker processes writing router files, defaults to the number of CPUs')
     parser.add_argument('--config', '-c', default='wanda.yml', help='Path of the yaml config file to use')
+    parser.add_argument('--no-cache', action='store_true', help='Neither read nor write the local IRRD result cache and Peering Manager snapshot')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached IRRD results and the Peering Manager snapshot, but store the fresh ones')
+    parser.add_argument('--changed-routers', metavar="FILE", help='Write the hostnames of all routers with changed files into FILE')
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument('--record', metavar="DIR", help='Record all IRRD and Peering Manager responses into DIR')
+    archive_group.add_argument('--replay', metavar="DIR", help='Answer all IRRD and Peering Manager requests from responses recorded in DIR')
 
     args = parser.parse_args()
 
@@ -39,6 +55,17 @@ def main() -> int:
     peeringmanager_url = os.environ.get('PEERINGMANAGER_URL')
     peeringmanager_api_token = os.environ.get('PEERINGMANAGER_API_TOKEN')
 
+    response_archive = None
+    if args.record:
+        response_archive = ResponseArchive(args.record, "record")
+    elif args.replay:
+        response_archive = ResponseArchive(args.replay, "replay")
+        # Requests are looked up by their url, so the recorded instances are used unless they are overridden.
+        recorded = response_archive.read_metadata()
+        irrd_url = os.environ.get('IRRD_URL', recorded.get('irrd_url', irrd_url))
+        peeringmanager_url = os.environ.get('PEERINGMANAGER_URL', recorded.get('peeringmanager_url'))
+        peeringmanager_api_token = peeringmanager_api_token or "replay"
+
     wanda_configuration = {}
     with open(args.config, 'r') as cfg_file:
         wanda_configuration = yaml.safe_load(cfg_file)
@@ -50,19 +77,119 @@ def main() -> int:
     if peeringmanager_api_token is None:
         raise Exception("PEERINGMANAGER_API_TOKEN is empty.")
 
-    SyncManager.register("IRRDClient", IRRDClient)
-    SyncManager.register("PeeringManagerClient", PeeringManagerClient)
-    manager = SyncManager()
-    manager.start()
-    irrd_client = manager.IRRDClient(irrd_url=irrd_url)
-    peering_manager_instance = manager.PeeringManagerClient(peeringmanager_url, peeringmanager_api_token)
+    if args.record:
+        response_archive.write_metadata({"irrd_url": irrd_url, "peeringmanager_url": peeringmanager_url})
+
+    # Recorded runs have to send every request and replayed runs must send the same requests, so caches are not used.
+    use_cache = not args.no_cache and response_archive is None
+
+    def http_session():
+        return PooledSession(
+            pool_size=wanda_configuration.get('http_pool_size', DEFAULT_POOL_SIZE),
+            retries=wanda_configuration.get('http_retries', DEFAULT_RETRIES),
+            backoff_factor=wanda_configuration.get('http_backoff_factor', DEFAULT_BACKOFF_FACTOR),
+            archive=response_archive,
+        )
+
+    cache_dir = wanda_configuration.get('cache_dir', DEFAULT_CACHE_DIR)
+
+    # IRRD_URL=file:///path/to/dumps or irr_dumps in the config file answer IRRD queries from local RPSL dumps.
+    irr_dumps = wanda_configuration.get('irr_dumps', [])
+    if irrd_url.startswith("file://"):
+        irr_dumps = [irrd_url[len("file://"):]]
+
+    if irr_dumps:
+        rpsl_store = RPSLStore(os.path.join(cache_dir, 'irr_dumps.sqlite3'))
+        rpsl_store.load(irr_dumps)
+        irrd_client = LocalIRRDClient(
+            rpsl_store,
+            batch_size=wanda_configuration.get('irrd_batch_size', DEFAULT_BATCH_SIZE),
+        )
+    else:
+        irrd_cache = None
+        if use_cache:
+            irrd_cache = IRRDCache(
+                path=os.path.join(cache_dir, 'irrd.sqlite3'),
+                ttl=wanda_configuration.get('irrd_cache_ttl', DEFAULT_TTL),
+                max_size_mb=wanda_configuration.get('irrd_cache_max_size_mb', DEFAULT_MAX_SIZE_MB),
+                refresh=args.refresh,
+                max_age=wanda_configuration.get('irrd_cache_max_age', DEFAULT_MAX_AGE),
+            )
+
+        irrd_client = IRRDClient(
+            irrd_url=irrd_url,
+            batch_size=wanda_configuration.get('irrd_batch_size', DEFAULT_BATCH_SIZE),
+            http_session=http_session(),
+            cache=irrd_cache,
+            incremental=wanda_configuration.get('irrd_incremental', False),
+            whois_port=wanda_configuration.get('irrd_whois_port', DEFAULT_WHOIS_PORT),
+        )
+
+    peeringmanager_snapshot = None
+    if use_cache:
+        peeringmanager_snapshot = PeeringManagerSnapshot(
+            os.path.join(cache_dir, 'peeringmanager.sqlite3'),
+            refresh=args.refresh,
+        )
+
+    peering_manager_instance = PeeringManagerClient(
+        peeringmanager_url,
+        peeringmanager_api_token,
+        http_session=http_session(),
+        page_size=wanda_configuration.get('peeringmanager_page_size', DEFAULT_PAGE_SIZE),
+        snapshot=peeringmanager_snapshot,
+    )
+
+    # Limited runs only transfer the sessions, connections and ASes of the given routers.
+    if hosts:
+        peering_manager_instance.set_router_scope(hosts)
+
+    # Files of routers with unchanged inputs are kept as they are, the state of the previous run lives in the cache.
+    output_state = OutputState(os.path.join(cache_dir, 'outputs.json') if use_cache else None)
+    jobs = args.jobs or wanda_configuration.get('jobs', DEFAULT_JOBS)
+    # Routers are compared with their previous generation, if the deltas are written somewhere.
+    delta_state = DeltaState(wanda_configuration.get('delta_dir'))
 
     if mode == "full":
-        return_code1 = main_customer_filter_lists(enlighten_manager, manager, peering_manager_instance, irrd_client, wanda_configuration, hosts=hosts, max_threads=args.threads)
+        return_code1 = main_customer_filter_lists(
+            enlighten_manager,
+            peering_manager_instance,
+            irrd_client,
+            wanda_configuration,
+            hosts=hosts,
+            max_threads=args.threads,
+            query_costs=QueryCosts(os.path.join(cache_dir, 'irrd_costs.json') if use_cache else None),
+            output_state=output_state,
+            jobs=jobs,
+            delta_state=delta_state,
+        )
     else:
         return_code1 = 0
-    return_code2 = main_bgp(enlighten_manager, manager, peering_manager_instance, wanda_configuration, hosts=hosts)
+    return_code2 = main_bgp(enlighten_manager, peering_manager_instance, wanda_configuration, hosts=hosts,
+                            output_state=output_state, jobs=jobs, delta_state=delta_state)
     return_code = return_code1 + return_code2
+    if return_code2 == INCONSISTENT_FILTER_GROUPS_EXIT_CODE:
+        return_code = return_code2
+
+    output_state.save()
+    delta_state.save()
+    changed_routers = output_state.changed_routers
+    if changed_routers:
+        l.hint(f"Changed routers: {', '.join(changed_routers)}")
+    else:
+        l.hint("No router configuration changed")
+
+    if args.changed_routers:
+        with open(args.changed_routers, 'w') as changed_routers_file:
+            changed_routers_file.write("".join(f"{hostname}\n" for hostname in changed_routers))
+
+    for client_name, client in [("IRRD", irrd_client), ("PeeringManager", peering_manager_instance)]:
+        connection_stats = client.get_connection_stats()
+        l.info(f"{client_name} connections: {connection_stats['new']} new, {connection_stats['reused']} reused")
+
+    cache_stats = irrd_client.get_cache_stats()
+    if cache_stats:
+        l.info(f"IRRD cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
 
     enlighten_manager.stop()
     return return_code
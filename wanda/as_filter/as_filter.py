@@ -1,6 +1,8 @@
 import re
 from functools import cached_property
 
+from wanda.as_filter.prefix_aggregation import collapse_prefixes, compress_route_filters
+from wanda.as_filter.prefix_set import PrefixSet
 from wanda.autonomous_system.autonomous_system import AutonomousSystem
 from wanda.irrd_client import IRRDClient
 from wanda.logger import Logger
@@ -18,29 +20,33 @@ class ASFilter:
     @cached_property
     def prefix_lists(self):
 
-        v4_set = set()
-        v6_set = set()
+        v4_sets = []
+        v6_sets = []
 
         irr_names = self.autos.get_irr_names()
 
         if not irr_names:
             result_entries_v4, result_entries_v6 = self.irrd_client.generate_prefix_lists_for_asn(self.autos.asn)
 
-            v4_set.update(result_entries_v4)
-            v6_set.update(result_entries_v6)
+            v4_sets.append(result_entries_v4)
+            v6_sets.append(result_entries_v6)
         else:
             for irr_name in irr_names:
                 result_entries_v4, result_entries_v6 = self.irrd_client.generate_prefix_lists(irr_name)
 
-                v4_set.update(result_entries_v4)
-                v6_set.update(result_entries_v6)
+                v4_sets.append(result_entries_v4)
+                v6_sets.append(result_entries_v6)
+
+        # Prefixes are kept packed and in numeric order, they are only converted to text when written.
+        v4_set = PrefixSet.union(v4_sets, 4)
+        v6_set = PrefixSet.union(v6_sets, 6)
 
         if len(v4_set) == 0 and len(v6_set) == 0 and self.is_customer:
             raise Exception(f"{self.autos} has neither IPv4, nor IPv6 filter lists. Since AS is our customer, we forbid this for security reasons.")
 
-        return list(v4_set), list(v6_set)
+        return v4_set, v6_set
 
-    def get_filter_lists(self, enable_extended_filters=False):
+    def get_filter_lists(self, enable_extended_filters=False, prefix_aggregation="none"):
 
         irr_names = self.autos.get_irr_names()
         filters = {}
@@ -53,7 +59,16 @@ class ASFilter:
 
         if enable_extended_filters:
             v4_set, v6_set = self.prefix_lists
-            filters['v4_prefixes'] = sorted(v4_set)
-            filters['v6_prefixes'] = sorted(v6_set)
+
+            match prefix_aggregation:
+                case "collapse":
+                    filters['v4_prefixes'] = collapse_prefixes(v4_set, 4)
+                    filters['v6_prefixes'] = collapse_prefixes(v6_set, 6)
+                case "ranges":
+                    filters['v4_route_filters'] = compress_route_filters(v4_set, 4)
+                    filters['v6_route_filters'] = compress_route_filters(v6_set, 6)
+                case _:
+                    filters['v4_prefixes'] = v4_set
+                    filters['v6_prefixes'] = v6_set
 
         return filters
@@ -0,0 +1,89 @@
+import socket
+
+from wanda.as_filter.prefix_set import PrefixSet, format_prefix
+
+PREFIX_AGGREGATION_MODES = ["none", "collapse", "ranges"]
+
+ADDRESS_FAMILIES = {
+    4: (socket.AF_INET, 32),
+    6: (socket.AF_INET6, 128),
+}
+
+
+def parse_prefixes(prefixes, ip_version):
+    _, max_length = ADDRESS_FAMILIES[ip_version]
+    parsed = set()
+
+    for network, length in PrefixSet.from_prefixes(prefixes, ip_version).iter_prefixes():
+        # IRR data may contain host bits, we only keep the network part.
+        network &= ((1 << length) - 1) << (max_length - length)
+        parsed.add((network, length))
+
+    return sorted(parsed)
+
+
+def remove_covered_prefixes(parsed_prefixes, ip_version):
+    # With orlonger matching, a prefix within an already listed prefix does not match any additional route.
+    _, max_length = ADDRESS_FAMILIES[ip_version]
+    result = []
+    covered_until = -1
+
+    for network, length in parsed_prefixes:
+        if network <= covered_until:
+            continue
+        result.append((network, length))
+        covered_until = network | ((1 << (max_length - length)) - 1)
+
+    return result
+
+
+def merge_prefix_ranges(parsed_prefixes, ip_version):
+    # Every entry is (network, length, min_length, max_length) and matches all routes within network/length
+    # with a prefix length in between min_length and max_length. Starting with orlonger entries,
+    # two sibling entries with the same range match exactly the same routes as their parent with that range.
+    _, max_length = ADDRESS_FAMILIES[ip_version]
+    stack = []
+
+    for network, length in parsed_prefixes:
+        stack.append((network, length, length, max_length))
+
+        while len(stack) >= 2:
+            left_network, left_length, left_min, left_max = stack[-2]
+            right_network, right_length, right_min, right_max = stack[-1]
+
+            if left_length != right_length or left_length == 0 or (left_min, left_max) != (right_min, right_max):
+                break
+
+            sibling_bit = 1 << (max_length - left_length)
+            if left_network & sibling_bit or left_network | sibling_bit != right_network:
+                break
+
+            stack[-2:] = [(left_network, left_length - 1, left_min, left_max)]
+
+    return stack
+
+
+def format_route_filter(network, length, min_length, max_length, ip_version):
+    _, family_max_length = ADDRESS_FAMILIES[ip_version]
+    prefix = format_prefix(network, length, ip_version)
+
+    if min_length == length and max_length == family_max_length:
+        return f"{prefix} orlonger"
+    if min_length == length and max_length == length:
+        return f"{prefix} exact"
+    if min_length == length:
+        return f"{prefix} upto /{max_length}"
+    return f"{prefix} prefix-length-range /{min_length}-/{max_length}"
+
+
+def collapse_prefixes(prefixes, ip_version):
+    parsed_prefixes = remove_covered_prefixes(parse_prefixes(prefixes, ip_version), ip_version)
+    return PrefixSet(ip_version, [network << 8 | length for network, length in parsed_prefixes])
+
+
+def compress_route_filters(prefixes, ip_version):
+    parsed_prefixes = remove_covered_prefixes(parse_prefixes(prefixes, ip_version), ip_version)
+    return [
+        format_route_filter(*prefix_range, ip_version)
+        for prefix_range in merge_prefix_ranges(parsed_prefixes, ip_version)
+    ]
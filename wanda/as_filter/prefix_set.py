@@ -0,0 +1,106 @@
+import socket
+from array import array
+
+MAX_LENGTHS = {
+    4: 32,
+    6: 128,
+}
+
+
+def parse_prefix(prefix, ip_version):
+    address, _, length = prefix.partition("/")
+    family = socket.AF_INET if ip_version == 4 else socket.AF_INET6
+    network = int.from_bytes(socket.inet_pton(family, address), "big")
+    return network, int(length) if length else MAX_LENGTHS[ip_version]
+
+
+def format_prefix(network, length, ip_version):
+    if ip_version == 4:
+        return f"{network >> 24}.{(network >> 16) & 255}.{(network >> 8) & 255}.{network & 255}/{length}"
+    return f"{socket.inet_ntop(socket.AF_INET6, network.to_bytes(16, 'big'))}/{length}"
+
+
+class PrefixSet:
+
+    # Sorted, unique prefixes of one address family, packed into machine integers.
+    # Every prefix is stored as key = network << 8 | length, so sorting the keys sorts the prefixes numerically.
+    # IPv4 keys fit into one unsigned 64 bit integer, IPv6 keys are split into a high and a low part and the length.
+
+    def __init__(self, ip_version, keys=()):
+        self.ip_version = ip_version
+
+        if ip_version == 4:
+            self.keys = array("Q", keys)
+        else:
+            self.high = array("Q", (key >> 72 for key in keys))
+            self.low = array("Q", ((key >> 8) & 0xFFFFFFFFFFFFFFFF for key in keys))
+            self.lengths = array("B", (key & 0xFF for key in keys))
+
+    @classmethod
+    def from_prefixes(cls, prefixes, ip_version):
+        if isinstance(prefixes, PrefixSet):
+            return prefixes
+
+        keys = set()
+        for prefix in prefixes:
+            network, length = parse_prefix(prefix, ip_version)
+            keys.add(network << 8 | length)
+        return cls(ip_version, sorted(keys))
+
+    @classmethod
+    def union(cls, prefix_sets, ip_version):
+        prefix_sets = [cls.from_prefixes(prefix_set, ip_version) for prefix_set in prefix_sets]
+        if len(prefix_sets) == 1:
+            return prefix_sets[0]
+
+        keys = set()
+        for prefix_set in prefix_sets:
+            keys.update(prefix_set.iter_keys())
+        return cls(ip_version, sorted(keys))
+
+    def iter_keys(self):
+        if self.ip_version == 4:
+            return iter(self.keys)
+        return (high << 72 | low << 8 | length for high, low, length in zip(self.high, self.low, self.lengths))
+
+    def iter_prefixes(self):
+        return ((key >> 8, key & 0xFF) for key in self.iter_keys())
+
+    def __iter__(self):
+        ip_version = self.ip_version
+        return (format_prefix(network, length, ip_version) for network, length in self.iter_prefixes())
+
+    def to_bytes(self):
+        if self.ip_version == 4:
+            return self.keys.tobytes()
+        return self.high.tobytes() + self.low.tobytes() + self.lengths.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, ip_version):
+        # Reverses to_bytes, the keys are not validated again.
+        prefix_set = cls(ip_version)
+        if ip_version == 4:
+            prefix_set.keys.frombytes(data)
+        else:
+            count = len(data) // 17
+            prefix_set.high.frombytes(data[:8 * count])
+            prefix_set.low.frombytes(data[8 * count:16 * count])
+            prefix_set.lengths.frombytes(data[16 * count:])
+        return prefix_set
+
+    def __len__(self):
+        if self.ip_version == 4:
+            return len(self.keys)
+        return len(self.lengths)
+
+    def __eq__(self, other):
+        if isinstance(other, PrefixSet):
+            return self.ip_version == other.ip_version and list(self.iter_keys()) == list(other.iter_keys())
+        if isinstance(other, (set, frozenset)):
+            return set(self) == other
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"PrefixSet({self.ip_version}, {list(self)})"
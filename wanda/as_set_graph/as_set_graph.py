@@ -0,0 +1,128 @@
+import re
+
+from wanda.logger import Logger
+
+l = Logger("as_set_graph.py")
+
+# recursiveSetMembers is queried with depth 8 by the server side expansion.
+SERVER_EXPANSION_DEPTH = 8
+
+
+class ASSetGraph:
+
+    def __init__(self):
+        self.member_asns = {}
+        self.member_sets = {}
+
+        self.closures = {}
+        self.heights = {}
+        self.cycles = []
+
+    def add_members(self, set_name, members):
+        member_asns = set()
+        member_sets = []
+
+        for member in members:
+            if re.match(r"^AS\d+$", member):
+                member_asns.add(int(member[2:]))
+            else:
+                member_sets.append(member)
+
+        self.member_asns[set_name] = member_asns
+        self.member_sets[set_name] = member_sets
+
+    def get_unknown_sets(self):
+        return sorted({
+            member_set
+            for member_sets in self.member_sets.values()
+            for member_set in member_sets
+            if member_set not in self.member_sets
+        })
+
+    def resolve_component(self, component):
+        # Components are resolved leaves first, so the closures of all referenced sets are known already.
+        component_sets = set(component)
+        asns = set()
+        height = 0
+
+        for set_name in component:
+            asns.update(self.member_asns[set_name])
+            for member_set in self.member_sets[set_name]:
+                if member_set in component_sets or member_set not in self.closures:
+                    continue
+                asns.update(self.closures[member_set])
+                height = max(height, self.heights[member_set])
+
+        if len(component) > 1 or component[0] in self.member_sets[component[0]]:
+            self.cycles.append(sorted(component))
+
+        closure = frozenset(asns)
+        for set_name in component:
+            self.closures[set_name] = closure
+            self.heights[set_name] = height + 1
+
+    def expand(self):
+        # Iterative Tarjan, every strongly connected component (a loop of sets) shares one closure.
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+
+        for root in self.member_sets:
+            if root in index:
+                continue
+
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.member_sets[root]))]
+
+            while work:
+                node, children = work[-1]
+
+                descended = False
+                for child in children:
+                    if child not in self.member_sets:
+                        continue
+                    if child not in index:
+                        index[child] = lowlink[child] = len(index)
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(self.member_sets[child])))
+                        descended = True
+                        break
+                    if child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+
+                if descended:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    self.resolve_component(component)
+
+    def get_origin_asns(self, set_name):
+        return self.closures.get(set_name, frozenset())
+
+    def get_height(self, set_name):
+        return self.heights.get(set_name, 0)
+
+    def report(self, root_sets):
+        for cycle in self.cycles:
+            l.warning(f"AS-SET loop detected: {', '.join(cycle)}")
+
+        for root_set in sorted(root_sets):
+            height = self.get_height(root_set)
+            if height > SERVER_EXPANSION_DEPTH:
+                l.warning(f"{root_set} is nested {height} levels deep, server side expansion with depth {SERVER_EXPANSION_DEPTH} would be truncated")
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from wanda.irrd_client import (
+    IRRDClient, QUERY_AS_SET_PREFIXES, QUERY_ASN_PREFIXES, QUERY_DIRECT_SET_MEMBERS, QUERY_SET_MEMBERS, SET_MEMBERS_DEPTH, is_asn,
+)
+from wanda.irrd_scheduler import AdaptiveLimiter, DEFAULT_BATCH_COST_LIMIT, DEFAULT_LATENCY_THRESHOLD, QueryCosts, RateLimiter, plan_batches
+from wanda.logger import Logger
+
+l = Logger("async_irrd_client.py")
+
+DEFAULT_MAX_IN_FLIGHT = 10
+# A failed batch is split and retried under the reduced in-flight limit, the run only fails after this many attempts.
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class AsyncIRRDClient:
+
+    # Runs the bulk queries of an IRRDClient from asyncio with at most max_in_flight requests at a time.
+    # Every batch is sent by a pooled worker thread, so all AS filters are fetched from a single process.
+    # Batches are started most expensive first, based on the result sizes of the previous run.
+
+    def __init__(self, irrd_client: IRRDClient, max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_rps=None,
+                 latency_threshold=DEFAULT_LATENCY_THRESHOLD, costs: QueryCosts = None,
+                 batch_cost_limit=DEFAULT_BATCH_COST_LIMIT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.irrd_client = irrd_client
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.max_attempts = max(int(max_attempts), 1)
+        self.costs = costs or QueryCosts()
+        self.batch_cost_limit = batch_cost_limit
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="irrd")
+        self.limiter = AdaptiveLimiter(self.max_in_flight, latency_threshold)
+        self.rate_limiter = RateLimiter(max_rps)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def run_in_flight(self, func, *args, cost=0):
+        await self.limiter.acquire(cost)
+
+        start = time.monotonic()
+        failed = True
+        try:
+            await self.rate_limiter.acquire()
+            start = time.monotonic()
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, func, *args)
+            failed = False
+            return result
+        finally:
+            self.limiter.release(time.monotonic() - start, failed)
+
+    async def run_batch(self, query_type, bulk_func, batch, cost=0, on_batch=None, attempt=1):
+        try:
+            batch_results = await self.run_in_flight(bulk_func, batch, cost=cost)
+        except Exception as e:
+            if attempt >= self.max_attempts:
+                raise
+
+            # The failure already reduced the in-flight limit. Halves of the batch are retried, so smaller requests
+            # get through and a single failing key does not take the others down with it.
+            halves = [half for half in [batch[:len(batch) // 2], batch[len(batch) // 2:]] if half]
+            l.warning(f"IRRD batch of {len(batch)} keys failed ({type(e).__name__}: {e}), retrying in {len(halves)} parts")
+            results = {}
+            for half_results in await asyncio.gather(*[
+                self.run_batch(query_type, bulk_func, half, cost // len(halves), on_batch, attempt + 1)
+                for half in halves
+            ]):
+                results.update(half_results)
+            return results
+
+        for key, result in batch_results.items():
+            self.costs.update(self.irrd_client.get_cache_key(query_type, key), result)
+
+        if on_batch:
+            on_batch(batch_results)
+        return batch_results
+
+    async def run_batched(self, query_type, bulk_func, keys, on_batch=None):
+        unique_keys = list(dict.fromkeys(keys))
+        costs = {key: self.costs.get(self.irrd_client.get_cache_key(query_type, key)) for key in unique_keys}
+        batches = plan_batches(unique_keys, costs, self.irrd_client.batch_size, self.batch_cost_limit)
+
+        batch_results = await asyncio.gather(*[
+            self.run_batch(query_type, bulk_func, batch, batch_cost, on_batch)
+            for batch_cost, batch in batches
+        ])
+
+        results = {}
+        for batch_result in batch_results:
+            results.update(batch_result)
+        return results
+
+    async def generate_input_aspath_access_lists_bulk(self, irr_names, on_batch=None):
+        return await self.run_batched(QUERY_SET_MEMBERS, self.irrd_client.generate_input_aspath_access_lists_bulk, irr_names, on_batch)
+
+    async def get_direct_set_members_bulk(self, irr_names, on_batch=None):
+        return await self.run_batched(QUERY_DIRECT_SET_MEMBERS, self.irrd_client.get_direct_set_members_bulk, irr_names, on_batch)
+
+    async def cache_set_dependencies(self, irr_names):
+        # Walks the direct members of the nested sets level by level. Every level runs as batches of its own,
+        # so these requests are rate limited and counted like all others.
+        if not self.irrd_client.caches_set_dependencies():
+            return
+
+        seen = set()
+        pending = set(irr_names)
+        for _ in range(SET_MEMBERS_DEPTH):
+            seen |= pending
+            direct_members = await self.get_direct_set_members_bulk(sorted(pending))
+            pending = {member for members in direct_members.values() for member in members if not is_asn(member)} - seen
+            if not pending:
+                break
+
+    async def generate_prefix_lists_for_asns_bulk(self, asns, on_batch=None):
+        return await self.run_batched(QUERY_ASN_PREFIXES, self.irrd_client.generate_prefix_lists_for_asns_bulk, asns, on_batch)
+
+    async def generate_prefix_lists_bulk(self, irr_names, on_batch=None):
+        return await self.run_batched(QUERY_AS_SET_PREFIXES, self.irrd_client.generate_prefix_lists_bulk, irr_names, on_batch)
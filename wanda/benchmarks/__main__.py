@@ -0,0 +1,142 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+from wanda.benchmarks.cases import BENCHMARK_CASES, DATA_DIR, run_case, run_case_process
+from wanda.benchmarks.synthetic_data import GENERATOR_VERSION, SCALES, SyntheticDataset
+from wanda.logger import Logger
+from wanda.worker_pool import DEFAULT_JOBS
+
+l = Logger("benchmarks")
+
+# Metrics compared between two results, lower is better for all of them.
+COMPARED_METRICS = ["seconds", "cpu_seconds", "peak_rss_mb", "workers_peak_rss_mb", "peeringmanager_requests", "irr_queries"]
+
+
+def get_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(__file__), capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run_isolated(name, work_dir, configuration, jobs):
+    # Every case gets a fresh interpreter, so neither caches nor the peak RSS of earlier cases count.
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_case_process, args=(sender, name, work_dir, configuration, jobs))
+    process.start()
+    sender.close()
+    try:
+        metrics, error = receiver.recv()
+    except EOFError:
+        metrics, error = None, f"benchmark process exited with {process.exitcode}"
+    process.join()
+
+    if error:
+        raise Exception(f"Benchmark {name} failed: {error}")
+    return metrics
+
+
+def run_benchmarks(scale="tiny", seed=1, cases=None, work_dir=None, configuration=None, jobs=1, isolated=True):
+    work_dir = work_dir or tempfile.mkdtemp(prefix="wanda-benchmark-")
+    configuration = configuration or {}
+    cases = cases or list(BENCHMARK_CASES)
+    for name in cases:
+        if name not in BENCHMARK_CASES:
+            raise Exception(f"{name} is not a known benchmark, use one of {', '.join(BENCHMARK_CASES)}")
+
+    dataset = SyntheticDataset(scale, seed)
+    fingerprint = dataset.write(os.path.join(work_dir, DATA_DIR))
+
+    results = {
+        "generator_version": GENERATOR_VERSION,
+        "scale": scale,
+        "seed": seed,
+        "fingerprint": fingerprint,
+        "dataset": dataset.get_summary(),
+        "configuration": configuration,
+        "jobs": jobs,
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "cases": {},
+    }
+
+    # Cases run in the order they are defined in, independent of the order they are given in.
+    for name in [name for name in BENCHMARK_CASES if name in cases]:
+        if isolated:
+            results["cases"][name] = run_isolated(name, work_dir, configuration, jobs)
+        else:
+            results["cases"][name] = run_case(name, work_dir, configuration, jobs)
+        l.info(f"{name}: {format_metrics(results['cases'][name])}")
+        if results["cases"][name].get("return_code"):
+            l.warning(f"{name}: the generation failed, the measurement does not cover a complete run")
+
+    return results
+
+
+def format_metrics(metrics):
+    return ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in metrics.items())
+
+
+def compare_results(baseline, results):
+    # Returns (case, metric, baseline value, value, ratio) for every metric both results have.
+    if baseline.get("fingerprint") != results.get("fingerprint"):
+        l.warning("The results were measured on different datasets, they are not comparable")
+
+    rows = []
+    for name, metrics in results["cases"].items():
+        baseline_metrics = baseline.get("cases", {}).get(name, {})
+        for metric in COMPARED_METRICS:
+            if metric not in metrics or metric not in baseline_metrics:
+                continue
+            old = baseline_metrics[metric]
+            new = metrics[metric]
+            rows.append((name, metric, old, new, new / old if old else None))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark wanda on synthetic Peering Manager and IRR data')
+    parser.add_argument('--scale', default='tiny', choices=list(SCALES), help='Size of the synthetic dataset')
+    parser.add_argument('--seed', default=1, type=int, help='Seed of the synthetic dataset')
+    parser.add_argument('--case', default=[], action='append', choices=list(BENCHMARK_CASES), help='Only run the given benchmarks')
+    parser.add_argument('--mode', default='junos', help='Output mode of the generation')
+    parser.add_argument('--prefix-aggregation', default='none', help='Prefix aggregation of the filter generation')
+    parser.add_argument('--irr-expansion', default='server', help='IRR expansion of the filter generation')
+    parser.add_argument('--jobs', '-j', default=DEFAULT_JOBS, type=int, help='Number of worker processes writing router files')
+    parser.add_argument('--work-dir', metavar="DIR", help='Directory for the dataset and the generated files, a temporary one by default')
+    parser.add_argument('--output', '-o', metavar="FILE", help='Write the results as JSON into FILE')
+    parser.add_argument('--compare', metavar="FILE", help='Compare the results with earlier results from FILE')
+
+    args = parser.parse_args()
+
+    configuration = {
+        "mode": args.mode,
+        "prefix_aggregation": args.prefix_aggregation,
+        "irr_expansion": args.irr_expansion,
+    }
+    results = run_benchmarks(args.scale, args.seed, args.case, args.work_dir, configuration, args.jobs)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        for name, metric, old, new, ratio in compare_results(baseline, results):
+            change = f"{ratio:.2f}x" if ratio is not None else "n/a"
+            l.hint(f"{name:>14} {metric:<24} {old:>12.3f} -> {new:>12.3f} {change}")
+
+    return 1 if any(metrics.get("return_code") for metrics in results["cases"].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
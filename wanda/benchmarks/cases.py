@@ -0,0 +1,252 @@
+import contextlib
+import io
+import json
+import os
+import resource
+import threading
+import time
+
+import enlighten
+
+from wanda.as_filter.as_filter import ASFilter
+from wanda.as_filter.prefix_aggregation import PREFIX_AGGREGATION_MODES
+from wanda.autonomous_system.autonomous_system import AutonomousSystem
+from wanda.benchmarks.peeringmanager_server import PeeringManagerServer
+from wanda.benchmarks.synthetic_data import PEERINGMANAGER_FILE, RPSL_DUMP_FILE
+from wanda.bgp_dg_generation import build_bgp_device_groups_for_direct_peerings, build_bgp_device_groups_for_ix_peerings, main_bgp
+from wanda.filter_list_generation import main_customer_filter_lists
+from wanda.junos_config import write_filter_groups
+from wanda.local_irrd_client import LocalIRRDClient
+from wanda.output_emitter import write_json, write_yaml
+from wanda.peeringmanager_client import PeeringManagerClient
+from wanda.peeringmanager_index import PeeringManagerIndex
+from wanda.rpsl_store import RPSLStore
+
+DATA_DIR = "data"
+OUTPUT_DIR = "output"
+RPSL_STORE_FILE = "irr_dumps.sqlite3"
+
+WRITERS = {
+    "yaml": lambda document, output_file: write_yaml(document, output_file),
+    "json": lambda document, output_file: write_json(document, output_file, indent=2),
+    "junos_config": lambda document, output_file: write_filter_groups(document, output_file, "text"),
+    "junos_set": lambda document, output_file: write_filter_groups(document, output_file, "set"),
+}
+
+
+class CountingIRRDClient(LocalIRRDClient):
+
+    # Counts the IRRD queries, which would have been sent to an IRRD instance.
+
+    def __init__(self, store, **kwargs):
+        super().__init__(store, **kwargs)
+        self.queries = 0
+        self.queries_lock = threading.Lock()
+
+    def query_bulk(self, query_type, keys):
+        keys = list(keys)
+        with self.queries_lock:
+            self.queries += len(set(keys))
+        return super().query_bulk(query_type, keys)
+
+
+class BenchmarkContext:
+
+    # Everything a case needs from the work directory of a benchmark run.
+
+    def __init__(self, work_dir, configuration, jobs):
+        self.work_dir = os.path.abspath(work_dir)
+        self.configuration = configuration
+        self.jobs = jobs
+        with open(os.path.join(self.work_dir, DATA_DIR, PEERINGMANAGER_FILE), "r") as peeringmanager_file:
+            self.lists = json.load(peeringmanager_file)
+
+    def get_rpsl_store(self):
+        rpsl_store = RPSLStore(os.path.join(self.work_dir, RPSL_STORE_FILE))
+        rpsl_store.load([os.path.join(self.work_dir, DATA_DIR, RPSL_DUMP_FILE)])
+        return rpsl_store
+
+    def get_irrd_client(self):
+        return CountingIRRDClient(self.get_rpsl_store())
+
+    def get_wanda_configuration(self):
+        hostnames = [router["hostname"] for router in self.lists["/api/devices/routers/"]]
+        return {"devices": hostnames, **self.configuration}
+
+    def get_index(self):
+        return PeeringManagerIndex(
+            routers=self.lists["/api/devices/routers/"],
+            connections=self.lists["/api/net/connections/"],
+            ix_peerings=self.lists["/api/peering/internet-exchange-peering-sessions/"],
+            direct_peerings=self.lists["/api/peering/direct-peering-sessions/"],
+            routing_policies=self.lists["/api/peering/routing-policies/"],
+        )
+
+    def get_largest_as_filter(self, irrd_client):
+        autonomous_system = self.lists["/api/peering/autonomous-systems/"][0]
+        return ASFilter(irrd_client, AutonomousSystem(autonomous_system["asn"], autonomous_system["name"], autonomous_system["irr_as_set"]))
+
+    @contextlib.contextmanager
+    def output_dir(self):
+        # The generation writes relative to the working directory.
+        output_dir = os.path.join(self.work_dir, OUTPUT_DIR)
+        os.makedirs(output_dir, exist_ok=True)
+        previous_dir = os.getcwd()
+        os.chdir(output_dir)
+        try:
+            yield output_dir
+        finally:
+            os.chdir(previous_dir)
+
+
+def get_directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+def get_enlighten_manager():
+    return enlighten.get_manager(stream=open(os.devnull, "w"), enabled=False)
+
+
+def run_filter_lists(context: BenchmarkContext, peeringmanager_server):
+    peering_manager_instance = PeeringManagerClient(peeringmanager_server.url, "benchmark")
+    irrd_client = context.get_irrd_client()
+    return_code = main_customer_filter_lists(get_enlighten_manager(), peering_manager_instance, irrd_client,
+                                             context.get_wanda_configuration(), jobs=context.jobs)
+    return return_code, irrd_client.queries
+
+
+def case_irr_index(context: BenchmarkContext):
+    rpsl_store_file = os.path.join(context.work_dir, RPSL_STORE_FILE)
+    if os.path.exists(rpsl_store_file):
+        os.remove(rpsl_store_file)
+
+    start = time.perf_counter()
+    context.get_rpsl_store()
+    return {"seconds": time.perf_counter() - start}
+
+
+def case_filter_lists(context: BenchmarkContext):
+    context.get_rpsl_store()
+    with context.output_dir() as output_dir, PeeringManagerServer(context.lists) as peeringmanager_server:
+        start = time.perf_counter()
+        return_code, irr_queries = run_filter_lists(context, peeringmanager_server)
+        seconds = time.perf_counter() - start
+
+        return {
+            "seconds": seconds,
+            "return_code": return_code,
+            "peeringmanager_requests": peeringmanager_server.requests,
+            "irr_queries": irr_queries,
+            "output_bytes": get_directory_size(output_dir),
+        }
+
+
+def case_bgp(context: BenchmarkContext):
+    with context.output_dir() as output_dir, PeeringManagerServer(context.lists) as peeringmanager_server:
+        # The BGP generation checks the filter files, they are only generated if no earlier case did.
+        if not os.path.isdir(os.path.join(output_dir, "generated_vars")):
+            context.get_rpsl_store()
+            run_filter_lists(context, peeringmanager_server)
+            peeringmanager_server.requests = 0
+
+        peering_manager_instance = PeeringManagerClient(peeringmanager_server.url, "benchmark")
+        start = time.perf_counter()
+        return_code = main_bgp(get_enlighten_manager(), peering_manager_instance, context.get_wanda_configuration(), jobs=context.jobs)
+        seconds = time.perf_counter() - start
+
+        return {
+            "seconds": seconds,
+            "return_code": return_code,
+            "peeringmanager_requests": peeringmanager_server.requests,
+        }
+
+
+def case_as_filter(context: BenchmarkContext):
+    as_filter = context.get_largest_as_filter(context.get_irrd_client())
+
+    start = time.perf_counter()
+    v4_set, v6_set = as_filter.prefix_lists
+    metrics = {"expand_seconds": time.perf_counter() - start, "prefixes": len(v4_set) + len(v6_set)}
+
+    for prefix_aggregation in PREFIX_AGGREGATION_MODES:
+        aggregation_start = time.perf_counter()
+        as_filter.get_filter_lists(enable_extended_filters=True, prefix_aggregation=prefix_aggregation)
+        metrics[f"{prefix_aggregation}_seconds"] = time.perf_counter() - aggregation_start
+
+    metrics["seconds"] = time.perf_counter() - start
+    metrics["irr_queries"] = as_filter.irrd_client.queries
+    return metrics
+
+
+def case_to_junos(context: BenchmarkContext):
+    peering_index = context.get_index()
+
+    start = time.perf_counter()
+    groups = 0
+    for router in peering_index.routers_by_id.values():
+        bgp_device_groups = build_bgp_device_groups_for_ix_peerings(peering_index, router)
+        bgp_device_groups.extend(build_bgp_device_groups_for_direct_peerings(peering_index, router))
+        for bgp_device_group in bgp_device_groups:
+            bgp_device_group.to_junos()
+        groups += len(bgp_device_groups)
+
+    return {"seconds": time.perf_counter() - start, "groups": groups}
+
+
+def case_writers(context: BenchmarkContext):
+    as_filter = context.get_largest_as_filter(context.get_irrd_client())
+    document = {f"AS{as_filter.autos.asn}": as_filter.get_filter_lists(enable_extended_filters=True)}
+
+    metrics = {"seconds": 0}
+    for name, write in WRITERS.items():
+        output_file = io.StringIO()
+        start = time.perf_counter()
+        write(document, output_file)
+        seconds = time.perf_counter() - start
+
+        metrics["seconds"] += seconds
+        metrics[f"{name}_seconds"] = seconds
+        metrics[f"{name}_bytes"] = len(output_file.getvalue())
+    return metrics
+
+
+# In the order they run, later cases reuse the store and the files of earlier ones.
+BENCHMARK_CASES = {
+    "irr_index": case_irr_index,
+    "filter_lists": case_filter_lists,
+    "bgp": case_bgp,
+    "as_filter": case_as_filter,
+    "to_junos": case_to_junos,
+    "writers": case_writers,
+}
+
+
+def get_peak_rss_mb(who):
+    # ru_maxrss is given in KiB on Linux.
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def run_case(name, work_dir, configuration, jobs):
+    context = BenchmarkContext(work_dir, configuration, jobs)
+    cpu_start = time.process_time()
+
+    # The progress and log output of the generation would only distort the measurement.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        metrics = BENCHMARK_CASES[name](context)
+
+    return {
+        **metrics,
+        "cpu_seconds": time.process_time() - cpu_start,
+        "peak_rss_mb": get_peak_rss_mb(resource.RUSAGE_SELF),
+        "workers_peak_rss_mb": get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def run_case_process(connection, name, work_dir, configuration, jobs):
+    # Runs in a fresh process, so the peak RSS belongs to this case alone.
+    try:
+        connection.send((run_case(name, work_dir, configuration, jobs), None))
+    except BaseException as e:
+        connection.send((None, f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
@@ -0,0 +1,74 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+MAX_PAGE_SIZE = 1000
+
+
+class PeeringManagerServer:
+
+    # Serves lists of Peering Manager objects on localhost, paginated like the Peering Manager API.
+    # Used by the benchmarks, so the client and its HTTP session are part of the measurement.
+
+    def __init__(self, lists):
+        self.lists = lists
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.get_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.count_request()
+                status, body = server.get_page(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def get_page(self, path):
+        url = urlsplit(path)
+        if url.path not in self.lists:
+            return 404, b'{"detail": "Not found."}'
+
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        objects = self.lists[url.path]
+        limit = min(int(query.get("limit", 50)), MAX_PAGE_SIZE)
+        offset = int(query.get("offset", 0))
+
+        next_url = None
+        if offset + limit < len(objects):
+            next_url = f"{self.url}{url.path}?{urlencode({**query, 'limit': limit, 'offset': offset + limit})}"
+
+        page = {"count": len(objects), "next": next_url, "previous": None, "results": objects[offset:offset + limit]}
+        return 200, json.dumps(page).encode()
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,307 @@
+import hashlib
+import ipaddress
+import json
+import os
+import random
+
+# Bump whenever the generated data changes, results of different generators are not comparable.
+GENERATOR_VERSION = 1
+
+SCALES = {
+    "tiny": {
+        "routers": 4,
+        "internet_exchanges": 2,
+        "ix_sessions": 80,
+        "direct_sessions": 30,
+        "autonomous_systems": 50,
+        "prefixes_per_as": 4,
+        "largest_as_set_prefixes": 2000,
+        "as_set_depth": 4,
+    },
+    "medium": {
+        "routers": 40,
+        "internet_exchanges": 10,
+        "ix_sessions": 4000,
+        "direct_sessions": 1500,
+        "autonomous_systems": 800,
+        "prefixes_per_as": 8,
+        "largest_as_set_prefixes": 50000,
+        "as_set_depth": 8,
+    },
+    "large": {
+        "routers": 300,
+        "internet_exchanges": 40,
+        "ix_sessions": 30000,
+        "direct_sessions": 10000,
+        "autonomous_systems": 5000,
+        "prefixes_per_as": 10,
+        "largest_as_set_prefixes": 500000,
+        "as_set_depth": 12,
+    },
+}
+
+FIRST_ASN = 4200000000
+FIRST_STUB_ASN = 4210000000
+STUB_PREFIXES = 100
+ROUTING_POLICIES = 20
+FIRST_V4_NETWORK = int(ipaddress.IPv4Address("11.0.0.0"))
+FIRST_V6_NETWORK = int(ipaddress.IPv6Address("fc00::"))
+IX_V4_NETWORK = int(ipaddress.IPv4Address("100.64.0.0"))
+DIRECT_V4_NETWORK = int(ipaddress.IPv4Address("198.18.0.0"))
+DIRECT_V6_NETWORK = int(ipaddress.IPv6Address("fd00::"))
+
+PEERINGMANAGER_FILE = "peeringmanager.json"
+RPSL_DUMP_FILE = "bench.db"
+
+
+class SyntheticDataset:
+
+    # Peering Manager objects and RPSL objects of a made up network, the same scale and seed always give the same data.
+    # AS 0 is a customer with the largest AS-SET, a tree of the given depth (including a loop) over stub ASes,
+    # the other customers have nested AS-SETs sharing some sub-sets, a third of the ASes has no AS-SET at all.
+
+    def __init__(self, scale="tiny", seed=1):
+        if scale not in SCALES:
+            raise Exception(f"{scale} is not a known scale, use one of {', '.join(SCALES)}")
+
+        self.scale = scale
+        self.seed = seed
+        self.parameters = SCALES[scale]
+        self.rng = random.Random(f"{scale}:{seed}")
+
+        self.routing_policies = [
+            {"id": i + 1, "name": f"BENCH_POLICY_{i + 1}", "weight": 1000 if i % 5 == 0 else 0}
+            for i in range(ROUTING_POLICIES)
+        ]
+        self.autonomous_systems = self.build_autonomous_systems()
+        self.routers = self.build_routers()
+        self.connections = self.build_connections()
+        self.ix_sessions = self.build_ix_sessions()
+        self.direct_sessions = self.build_direct_sessions()
+
+        # Members of every AS-SET, route objects are only generated while the dump is written.
+        self.as_sets = {}
+        self.build_as_sets()
+
+    def get_lists(self):
+        return {
+            "/api/devices/routers/": self.routers,
+            "/api/net/connections/": self.connections,
+            "/api/peering/autonomous-systems/": self.autonomous_systems,
+            "/api/peering/internet-exchange-peering-sessions/": self.ix_sessions,
+            "/api/peering/direct-peering-sessions/": self.direct_sessions,
+            "/api/peering/routing-policies/": self.routing_policies,
+            "/api/peering/internet-exchanges/": [],
+        }
+
+    def get_router_hostnames(self):
+        return [router["hostname"] for router in self.routers]
+
+    def get_largest_autonomous_system(self):
+        return self.autonomous_systems[0]
+
+    def pick_policies(self):
+        return [{"id": self.rng.randint(1, ROUTING_POLICIES)} for _ in range(self.rng.randint(0, 2))]
+
+    def get_tags(self, is_customer=False):
+        tags = [{"name": "customer"}] if is_customer else []
+        if self.rng.random() < 0.1:
+            tags += [{"name": "bfd_multiplier:3"}, {"name": "bfd_min_interval:300"}]
+        return tags
+
+    def build_autonomous_systems(self):
+        autonomous_systems = []
+        for i in range(self.parameters["autonomous_systems"]):
+            if i == 0:
+                irr_as_set = "AS-BENCH-BIG"
+            elif i % 3:
+                irr_as_set = f"AS-BENCH-{i}"
+            else:
+                irr_as_set = ""
+            autonomous_systems.append({
+                "id": i + 1,
+                "asn": FIRST_ASN + i,
+                "name": f"Bench Network {i}",
+                "irr_as_set": irr_as_set,
+                "ipv4_max_prefixes": self.rng.choice([10, 100, 1000, 10000]),
+                "ipv6_max_prefixes": self.rng.choice([10, 100, 1000]),
+            })
+        return autonomous_systems
+
+    def is_customer(self, autonomous_system):
+        # Every fourth AS is a customer, AS 0 always is.
+        return (autonomous_system["asn"] - FIRST_ASN) % 4 == 0
+
+    def build_routers(self):
+        return [
+            {"id": i + 1, "hostname": f"r{i + 1}.bench.example", "name": f"R{i + 1}", "tags": [{"name": "automated"}]}
+            for i in range(self.parameters["routers"])
+        ]
+
+    def build_connections(self):
+        # Every router is connected to one internet exchange, the first ones to a second one as well.
+        connections = []
+        internet_exchanges = self.parameters["internet_exchanges"]
+        for router in self.routers:
+            ix_ids = [router["id"] % internet_exchanges]
+            if router["id"] <= internet_exchanges and internet_exchanges > 1:
+                ix_ids.append((router["id"] + 1) % internet_exchanges)
+            for ix_id in ix_ids:
+                host = len(connections) + 1
+                connections.append({
+                    "id": host,
+                    "router": {"id": router["id"], "hostname": router["hostname"]},
+                    "internet_exchange_point": {"id": ix_id + 1, "slug": f"bench-ix-{ix_id + 1}"},
+                    "ipv4_address": f"{ipaddress.IPv4Address(IX_V4_NETWORK + (ix_id << 16) + host)}/16",
+                    "ipv6_address": f"2001:db8:{ix_id + 1:x}::{host:x}/64",
+                })
+        return connections
+
+    def build_ix_sessions(self):
+        ix_sessions = []
+        for i in range(self.parameters["ix_sessions"]):
+            connection = self.connections[i % len(self.connections)]
+            autonomous_system = self.autonomous_systems[self.rng.randrange(1, len(self.autonomous_systems))]
+            ix_id = connection["internet_exchange_point"]["id"] - 1
+            host = 1000 + i
+            if i % 2:
+                ip_address = f"2001:db8:{ix_id + 1:x}::{host:x}/64"
+            else:
+                ip_address = f"{ipaddress.IPv4Address(IX_V4_NETWORK + (ix_id << 16) + host % 65000)}/16"
+
+            ix_session = {
+                "id": i + 1,
+                "ixp_connection": {key: connection[key] for key in ["id", "ipv4_address", "ipv6_address"]},
+                "autonomous_system": autonomous_system,
+                "status": {"value": "disabled" if self.rng.random() < 0.02 else "enabled"},
+                "ip_address": ip_address,
+                "tags": self.get_tags(self.is_customer(autonomous_system) and self.rng.random() < 0.5),
+                "is_route_server": self.rng.random() < 0.01,
+                "import_routing_policies": self.pick_policies(),
+                "export_routing_policies": self.pick_policies(),
+            }
+            if self.rng.random() < 0.1:
+                ix_session["password"] = f"bench-secret-{i}"
+            ix_sessions.append(ix_session)
+        return ix_sessions
+
+    def build_direct_sessions(self):
+        direct_sessions = []
+        for i in range(self.parameters["direct_sessions"]):
+            router = self.routers[i % len(self.routers)]
+            if i == 0:
+                autonomous_system = self.get_largest_autonomous_system()
+            else:
+                autonomous_system = self.autonomous_systems[self.rng.randrange(1, len(self.autonomous_systems))]
+
+            if self.is_customer(autonomous_system):
+                relationship = "customer"
+            else:
+                relationship = self.rng.choice(["private-peering", "private-peering", "transit-provider"])
+
+            if i % 3 == 2:
+                ip_address = f"{ipaddress.IPv6Address(DIRECT_V6_NETWORK + 2 * i + 1)}/127"
+                local_ip_address = f"{ipaddress.IPv6Address(DIRECT_V6_NETWORK + 2 * i)}/127"
+            else:
+                ip_address = f"{ipaddress.IPv4Address(DIRECT_V4_NETWORK + 2 * i + 1)}/31"
+                local_ip_address = f"{ipaddress.IPv4Address(DIRECT_V4_NETWORK + 2 * i)}/31"
+
+            direct_session = {
+                "id": i + 1,
+                "router": {"id": router["id"], "hostname": router["hostname"]},
+                "autonomous_system": autonomous_system,
+                "relationship": {"slug": relationship},
+                "status": {"value": "disabled" if self.rng.random() < 0.02 else "enabled"},
+                "ip_address": ip_address,
+                "local_ip_address": local_ip_address,
+                "tags": self.get_tags(),
+                "import_routing_policies": self.pick_policies(),
+                "export_routing_policies": self.pick_policies(),
+            }
+            if self.rng.random() < 0.2:
+                direct_session["password"] = f"bench-secret-dp-{i}"
+            direct_sessions.append(direct_session)
+        return direct_sessions
+
+    def build_as_sets(self):
+        depth = self.parameters["as_set_depth"]
+
+        # The largest AS-SET: every level holds a share of the stub ASes and the next level, the last one loops back.
+        stub_count = max(self.parameters["largest_as_set_prefixes"] // STUB_PREFIXES, 1)
+        stub_asns = [FIRST_STUB_ASN + i for i in range(stub_count)]
+        levels = [f"AS-BENCH-BIG-{level}" if level else "AS-BENCH-BIG" for level in range(depth)]
+        for level, set_name in enumerate(levels):
+            members = [f"AS{asn}" for asn in stub_asns[level::depth]]
+            members.append(levels[level + 1] if level + 1 < depth else levels[0])
+            if level == 0:
+                members.insert(0, f"AS{FIRST_ASN}")
+            self.as_sets[set_name] = members
+
+        # Shared sub-sets of downstream ASes, used by many customers.
+        shared_sets = [f"AS-BENCH-SHARED-{i}" for i in range(20)]
+        for i, set_name in enumerate(shared_sets):
+            self.as_sets[set_name] = [f"AS{FIRST_ASN + j}" for j in range(i + 1, len(self.autonomous_systems), 97)][:5]
+
+        for autonomous_system in self.autonomous_systems[1:]:
+            set_name = autonomous_system["irr_as_set"]
+            if not set_name:
+                continue
+
+            members = [f"AS{autonomous_system['asn']}"]
+            if self.is_customer(autonomous_system):
+                # Customers have nested sets of a random depth with a few downstream ASes each.
+                nested_depth = self.rng.randint(1, depth)
+                nested = [f"{set_name}-L{level}" for level in range(1, nested_depth)]
+                for level, nested_name in enumerate(nested):
+                    downstreams = [f"AS{FIRST_ASN + self.rng.randrange(len(self.autonomous_systems))}" for _ in range(2)]
+                    self.as_sets[nested_name] = downstreams + ([nested[level + 1]] if level + 1 < len(nested) else [])
+                members += nested[:1]
+                members.append(self.rng.choice(shared_sets))
+            self.as_sets[set_name] = members
+
+    def iter_rpsl_objects(self):
+        # Routes are generated while they are written, with their own random generator, so every call yields the same.
+        rng = random.Random(f"{self.scale}:{self.seed}:routes")
+        next_v4_network = FIRST_V4_NETWORK
+        next_v6_network = FIRST_V6_NETWORK
+
+        for set_name, members in self.as_sets.items():
+            yield [("as-set", set_name), ("members", ", ".join(members)), ("source", "BENCH")]
+
+        origins = [(autonomous_system["asn"], self.parameters["prefixes_per_as"]) for autonomous_system in self.autonomous_systems]
+        origins += [(FIRST_STUB_ASN + i, STUB_PREFIXES) for i in range(max(self.parameters["largest_as_set_prefixes"] // STUB_PREFIXES, 1))]
+        for asn, count in origins:
+            # Mostly adjacent /24 networks with a covered /25 now and then, so prefix aggregation has something to do.
+            for _ in range(count):
+                yield [("route", f"{ipaddress.IPv4Address(next_v4_network)}/24"), ("origin", f"AS{asn}"), ("source", "BENCH")]
+                if rng.random() < 0.05:
+                    yield [("route", f"{ipaddress.IPv4Address(next_v4_network)}/25"), ("origin", f"AS{asn}"), ("source", "BENCH")]
+                next_v4_network += 256 * (2 if rng.random() < 0.1 else 1)
+            for _ in range(max(count // 4, 1)):
+                yield [("route6", f"{ipaddress.IPv6Address(next_v6_network)}/48"), ("origin", f"AS{asn}"), ("source", "BENCH")]
+                next_v6_network += 1 << 80
+
+    def write(self, directory):
+        # Writes the Peering Manager lists and the RPSL dump, returns the fingerprint of both.
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256(f"{GENERATOR_VERSION}:{self.scale}:{self.seed}".encode())
+
+        peeringmanager_data = json.dumps(self.get_lists(), sort_keys=True).encode()
+        digest.update(peeringmanager_data)
+        with open(os.path.join(directory, PEERINGMANAGER_FILE), "wb") as peeringmanager_file:
+            peeringmanager_file.write(peeringmanager_data)
+
+        with open(os.path.join(directory, RPSL_DUMP_FILE), "w") as dump_file:
+            for rpsl_object in self.iter_rpsl_objects():
+                text = "".join(f"{attribute + ':':<16}{value}\n" for attribute, value in rpsl_object) + "\n"
+                digest.update(text.encode())
+                dump_file.write(text)
+
+        return digest.hexdigest()
+
+    def get_summary(self):
+        return {
+            **self.parameters,
+            "as_sets": len(self.as_sets),
+            "customers": sum(1 for autonomous_system in self.autonomous_systems if self.is_customer(autonomous_system)),
+        }
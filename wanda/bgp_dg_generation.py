@@ -1,19 +1,32 @@
 import ipaddress
 import os.path
-import pathlib
 import re
 import sys
-from multiprocessing import Pool
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
-import yaml
 import json
 
 from wanda.bgp_device_group.bgp_device_group import BGPDeviceGroup
+from wanda.filter_manifest import FilterGroupsFile
+from wanda.generation_delta import DeltaState, get_bgp_groups_snapshot
+from wanda.junos_config import JUNOS_CONFIG_EXTENSIONS, JUNOS_CONFIG_MODES, parse_filter_groups, write_bgp_groups
 from wanda.logger import Logger
+from wanda.output_emitter import load_yaml, write_json, write_yaml
+from wanda.output_state import OutputState, get_input_hash, write_output
 from wanda.peeringmanager_helpers import get_config_name_from_as, get_bgp_infos_from_tags
+from wanda.peeringmanager_index import PeeringManagerIndex
+from wanda.worker_pool import DEFAULT_JOBS, run_jobs
 
 l = Logger("bgp_dg_generation.py")
 
+# Exit code of a run, in which the filter groups of at least one router have to be regenerated.
+INCONSISTENT_FILTER_GROUPS_EXIT_CODE = 42
+
+
+class InconsistentFilterGroups(Exception):
+    pass
+
 
 def check_for_consistency(bgp_device_groups, filter_groups):
     for bgp_device_group in bgp_device_groups:
@@ -24,25 +37,22 @@ def check_for_consistency(bgp_device_groups, filter_groups):
             as_name = regex_res.group(1)
             if as_name not in filter_groups:
                 return False
-    return True
 
+            # Shared AS filter files have to exist as well.
+            filter_file = filter_groups[as_name]
+            if filter_file and not os.path.exists(filter_file):
+                return False
+    return True
 
-def enrich_routing_policies(group_policies, routing_policies):
-    enriched_policies = []
-    for pol in group_policies:
-        for i in routing_policies:
-            if i['id'] == pol['id']:
-                enriched_policies.append(i)
-    return enriched_policies
 
+def enrich_routing_policies(group_policies, peering_index: PeeringManagerIndex):
+    return peering_index.get_routing_policies(group_policies)
 
-def build_bgp_device_groups_for_ix_peerings(ix_peerings, connections, as_list, routing_policies):
-    bgp_device_groups = []
-    for connection in connections:
-      for ix in ix_peerings:
 
-          if ix['ixp_connection']['id'] is not connection['id']:
-              continue
+def build_bgp_device_groups_for_ix_peerings(peering_index: PeeringManagerIndex, router):
+    bgp_device_groups = {}
+    for connection in peering_index.get_router_connections(router):
+      for ix in peering_index.get_ix_peerings(connection):
 
           if ix['status']['value'] != 'enabled':
               l.info(f'Skipping Internet Exchange Peering Session with id={ix["id"]}, because is not enabled.')
@@ -69,13 +79,8 @@ def build_bgp_device_groups_for_ix_peerings(ix_peerings, connections, as_list, r
               max_prefixes = ix['autonomous_system']['ipv6_max_prefixes']
               own_ip = str(ix['ixp_connection']['ipv6_address']).split("/")[0]
 
-          existing_bgp_device_groups = list(
-              filter(lambda x: x.asn == asn and x.ip_version == ip_version and x.ix_id == connection['internet_exchange_point']['id'], bgp_device_groups))
-
-          if len(existing_bgp_device_groups) > 1:
-              raise Exception("Invalid BGP Device Groupings")
-
-          existing_bgp_device_group = next(iter(existing_bgp_device_groups), None)
+          group_key = (asn, ip_version, connection['internet_exchange_point']['id'])
+          existing_bgp_device_group = bgp_device_groups.get(group_key)
 
           if existing_bgp_device_group:
               existing_bgp_device_group.append_neighbor(peer_ip, own_ip)
@@ -107,8 +112,8 @@ def build_bgp_device_groups_for_ix_peerings(ix_peerings, connections, as_list, r
                   ip_version=ip_version,
                   max_prefixes=max_prefixes,
                   policy_type=policy_type,
-                  import_routing_policies=enrich_routing_policies(ix['import_routing_policies'], routing_policies),
-                  export_routing_policies=enrich_routing_policies(ix['export_routing_policies'], routing_policies),
+                  import_routing_policies=enrich_routing_policies(ix['import_routing_policies'], peering_index),
+                  export_routing_policies=enrich_routing_policies(ix['export_routing_policies'], peering_index),
                   authentication_key=authentication_key,
                   bfd_infos=bfd_infos,
                   is_route_server=ix['is_route_server'],
@@ -116,22 +121,15 @@ def build_bgp_device_groups_for_ix_peerings(ix_peerings, connections, as_list, r
               )
 
               bdg.append_neighbor(peer_ip, own_ip)
-              bgp_device_groups.append(bdg)
+              bgp_device_groups[group_key] = bdg
 
-    return bgp_device_groups
+    return list(bgp_device_groups.values())
 
 
 
-def build_bgp_device_groups_for_direct_peerings(direct_peerings, router, routing_policies):
-    bgp_device_groups = []
-    for dp in direct_peerings:
-
-        if not dp['router']:
-            l.info(f'Skipping Direct Peering Session with id={dp["id"]}, because there is no router attached.')
-            continue
-
-        if dp['router']['id'] is not router['id']:
-            continue
+def build_bgp_device_groups_for_direct_peerings(peering_index: PeeringManagerIndex, router):
+    bgp_device_groups = {}
+    for dp in peering_index.get_direct_peerings(router):
 
         if dp['status']['value'] != 'enabled':
             l.info(f'Skipping Direct Peering Session with id={dp["id"]}, because is not enabled.')
@@ -153,13 +151,8 @@ def build_bgp_device_groups_for_direct_peerings(direct_peerings, router, routing
         elif ip_version == 6:
             max_prefixes = dp['autonomous_system']['ipv6_max_prefixes']
 
-        existing_bgp_device_groups = list(
-            filter(lambda x: x.asn == asn and x.ip_version == ip_version, bgp_device_groups))
-
-        if len(existing_bgp_device_groups) > 1:
-            raise Exception("Invalid BGP Device Groupings")
-
-        existing_bgp_device_group = next(iter(existing_bgp_device_groups), None)
+        group_key = (asn, ip_version)
+        existing_bgp_device_group = bgp_device_groups.get(group_key)
 
         if existing_bgp_device_group:
             existing_bgp_device_group.append_neighbor(peer_ip, own_ip)
@@ -200,19 +193,60 @@ def build_bgp_device_groups_for_direct_peerings(direct_peerings, router, routing
                 max_prefixes=max_prefixes,
                 authentication_key=authentication_key,
                 policy_type=policy_type,
-                import_routing_policies=enrich_routing_policies(dp['import_routing_policies'], routing_policies),
-                export_routing_policies=enrich_routing_policies(dp['export_routing_policies'], routing_policies),
+                import_routing_policies=enrich_routing_policies(dp['import_routing_policies'], peering_index),
+                export_routing_policies=enrich_routing_policies(dp['export_routing_policies'], peering_index),
                 bfd_infos=bfd_infos,
                 is_route_server=False,
             )
 
             bdg.append_neighbor(peer_ip, own_ip)
-            bgp_device_groups.append(bdg)
+            bgp_device_groups[group_key] = bdg
+
+    return list(bgp_device_groups.values())
+
+
+def get_bgp_input_hash(wanda_mode, bgp_device_groups, filter_file_hash):
+    # The filter file is part of the input, the consistency check has to be repeated whenever it changes.
+    return get_input_hash(wanda_mode, [vars(bdg) for bdg in bgp_device_groups], filter_file_hash)
+
+
+def generate_router_config(context, router):
+    # Runs in a worker process, the written file is recorded in the output state by the parent.
+    peering_index, wanda_mode, output_state = context
+
+    bgp_device_groups = build_bgp_device_groups_for_ix_peerings(peering_index, router)
+
+    y = build_bgp_device_groups_for_direct_peerings(peering_index, router)
+    bgp_device_groups.extend(y)
+
+    match wanda_mode:
+        case 'junos':
+            written = write_junos(router, bgp_device_groups, output_state)
+        case 'rtbrick':
+            written = write_rtbrick(router, bgp_device_groups, output_state)
+        case 'junos_config' | 'junos_set':
+            written = write_junos_config(router, bgp_device_groups, output_state, wanda_mode)
+
+    # The groups are compared with the previous generation by the parent.
+    return get_bgp_groups_snapshot(bgp_device_groups), written
+
+
+def write_junos(router, bgp_device_groups, output_state: OutputState):
+    destination_file = f"./generated_vars/bgp_device_groups-{router['hostname']}.yml"
+
+    # wanda might have been called without the filter generation portion.
+    # So, we check the existing file here, if everything is consistent. If not, we abort before changing anything.
+    filter_groups_file = FilterGroupsFile(f"./generated_vars/filter_groups-{router['hostname']}.yml", load_yaml)
 
-    return bgp_device_groups
+    # Authentication keys are encrypted with a random salt, so unchanged routers must not be generated again.
+    input_hash = get_bgp_input_hash('junos', bgp_device_groups, filter_groups_file.file_hash)
+    if output_state.is_current(destination_file, input_hash):
+        return None
 
+    is_consistent = check_for_consistency(bgp_device_groups, filter_groups_file.get_filter_groups())
+    if not is_consistent:
+        raise InconsistentFilterGroups(router['hostname'])
 
-def write_junos(router, e_routers, bgp_device_groups):
     junos_bgp_device_groups = list(map(lambda g: g.to_junos(), bgp_device_groups))
 
     e = {
@@ -220,27 +254,25 @@ def write_junos(router, e_routers, bgp_device_groups):
                                                enumerate(junos_bgp_device_groups)}
     }
 
-    def noop(self, *args, **kw):
-        pass
+    return destination_file, input_hash, write_output(destination_file, partial(write_yaml, e))
 
-    yaml.emitter.Emitter.process_tag = noop
-    pathlib.Path("./generated_vars").mkdir(parents=True, exist_ok=True)
+
+def write_rtbrick(router, bgp_device_groups, output_state: OutputState):
+    path = f"./machines/{router['name'].lower()}"
+    destination_file = path + '/generated-wanda.json'
 
     # wanda might have been called without the filter generation portion.
-    # So, we load the existing file here and check, if everything is consistent. If not, we abort before changing anything.
-    with open(f"./generated_vars/filter_groups-{router['hostname']}.yml", 'r') as yml_filter_file:
-        filter_content = yaml.safe_load(yml_filter_file)
-        is_consistent = check_for_consistency(bgp_device_groups, filter_content)
-        if not is_consistent:
-            l.error(f"Inconsistency within filter groups for {router['hostname']}, need to regenerate filter groups")
-            sys.exit(42)
+    # So, we check the existing file here, if everything is consistent. If not, we abort before changing anything.
+    filter_groups_file = FilterGroupsFile(path + '/generated-wanda-filters.json', json.loads)
 
-    with open('./generated_vars/bgp_device_groups-' + router['hostname'] + '.yml', 'w') as yaml_file:
-        yaml.dump(e, yaml_file, default_flow_style=False)
-        e_routers.update()
+    input_hash = get_bgp_input_hash('rtbrick', bgp_device_groups, filter_groups_file.file_hash)
+    if output_state.is_current(destination_file, input_hash):
+        return None
 
+    is_consistent = check_for_consistency(bgp_device_groups, filter_groups_file.get_filter_groups())
+    if not is_consistent:
+        raise InconsistentFilterGroups(router['hostname'])
 
-def write_rtbrick(router, e_routers, bgp_device_groups):
     rtbrick_bgp_device_groups = list(map(lambda g: g.to_rtbrick(), bgp_device_groups))
 
     e = {
@@ -256,29 +288,43 @@ def write_rtbrick(router, e_routers, bgp_device_groups):
         }
     }
 
-    path = f"./machines/{router['name'].lower()}"
-    pathlib.Path(path).mkdir(parents=True, exist_ok=True)
+    return destination_file, input_hash, write_output(destination_file, partial(write_json, e, indent=4))
+
+
+def write_junos_config(router, bgp_device_groups, output_state: OutputState, wanda_mode):
+    extension = JUNOS_CONFIG_EXTENSIONS[wanda_mode]
+    destination_file = f"./generated_vars/bgp_device_groups-{router['hostname']}.{extension}"
 
     # wanda might have been called without the filter generation portion.
-    # So, we load the existing file here and check, if everything is consistent. If not, we abort before changing anything.
-    with open(path + '/generated-wanda-filters.json', 'r') as json_filter_file:
-        filter_content = json.load(json_filter_file)
-        is_consistent = check_for_consistency(bgp_device_groups, filter_content)
-        if not is_consistent:
-            l.error(f"Inconsistency within filter groups for {router['hostname']}, need to regenerate filter groups")
-            sys.exit(42)
+    # So, we check the existing file here, if everything is consistent. If not, we abort before changing anything.
+    filter_groups_file = FilterGroupsFile(f"./generated_vars/filter_groups-{router['hostname']}.{extension}", parse_filter_groups)
 
-    with open(path + '/generated-wanda.json', 'w') as json_file:
-        json.dump(e, json_file, indent=4)
-        e_routers.update()
+    input_hash = get_bgp_input_hash(wanda_mode, bgp_device_groups, filter_groups_file.file_hash)
+    if output_state.is_current(destination_file, input_hash):
+        return None
+
+    is_consistent = check_for_consistency(bgp_device_groups, filter_groups_file.get_filter_groups())
+    if not is_consistent:
+        raise InconsistentFilterGroups(router['hostname'])
+
+    # The groups are converted one by one while they are written.
+    config_format = JUNOS_CONFIG_MODES[wanda_mode]
+    return destination_file, input_hash, write_output(destination_file, partial(write_bgp_groups, bgp_device_groups, config_format=config_format))
 
 
-def main_bgp(enlighten_manager, sync_manager, peering_manager_instance, wanda_configuration, hosts=None) -> int:
+def main_bgp(enlighten_manager, peering_manager_instance, wanda_configuration, hosts=None,
+             output_state: OutputState = None, jobs=DEFAULT_JOBS, delta_state: DeltaState = None) -> int:
+    # Checked before anything is fetched.
+    wanda_mode = wanda_configuration.get('mode', 'junos')
+    if wanda_mode not in ['junos', 'rtbrick', *JUNOS_CONFIG_MODES]:
+        l.error(f"{wanda_mode} is not a known mode, not able to generate configuration")
+        sys.exit(32)
+
     l.hint(f"Fetching needed data from PeeringManager, make sure VPN is enabled on your system.")
 
     e_targets = enlighten_manager.counter(total=5, desc='Fetching Data', unit='Targets')
 
-    with Pool(processes=6) as fetch_pool:
+    with ThreadPool(processes=6) as fetch_pool:
         ix_peerings_res = fetch_pool.apply_async(peering_manager_instance.get_internet_exchange_peerings, ())
         direct_peerings_res = fetch_pool.apply_async(peering_manager_instance.get_direct_peerings, ())
         routers_res = fetch_pool.apply_async(peering_manager_instance.get_routers, ())
@@ -286,32 +332,31 @@ def main_bgp(enlighten_manager, sync_manager, peering_manager_instance, wanda_co
         as_list_res = fetch_pool.apply_async(peering_manager_instance.get_autonomous_systems, ())
         routing_policies_res = fetch_pool.apply_async(peering_manager_instance.get_routing_policies, ())
 
-        ix_peerings = ix_peerings_res.get()
+        ix_peerings_res.get()
         e_targets.update()
-        direct_peerings = direct_peerings_res.get()
+        direct_peerings_res.get()
         e_targets.update()
         routers = routers_res.get()
         e_targets.update()
-        connections = connections_res.get()
+        connections_res.get()
         e_targets.update()
-        as_list = as_list_res.get()
+        as_list_res.get()
         e_targets.update()
-        routing_policies = routing_policies_res.get()
+        routing_policies_res.get()
         e_targets.update()
 
     e_targets.close()
 
+    peering_index = peering_manager_instance.get_index()
+
+    for dp in peering_index.unattached_direct_peerings:
+        l.info(f'Skipping Direct Peering Session with id={dp["id"]}, because there is no router attached.')
+
     if hosts:
-        router_list = list(map(lambda r: r['hostname'], routers))
         for host in hosts:
-            if host not in router_list:
+            if not peering_index.get_router(host):
                 l.warning(f"{host} is not a known host, ignoring...")
 
-    wanda_mode = wanda_configuration.get('mode', 'junos')
-    if wanda_mode not in ['junos', 'rtbrick']:
-        l.error(f"{wanda_mode} is not a known mode, not able to generate configuration")
-        sys.exit(32)
-
     config_hosts = wanda_configuration.get('devices', [])
 
     enabled_routers = list(
@@ -321,27 +366,39 @@ def main_bgp(enlighten_manager, sync_manager, peering_manager_instance, wanda_co
         )
     )
     e_routers = enlighten_manager.counter(total=len(enabled_routers), desc='Generating Configurations', unit='Router')
+    output_state = output_state or OutputState()
+    delta_state = delta_state or DeltaState()
 
+    automated_routers = []
     for router in enabled_routers:
         automated_tag = next(filter(lambda t: t['name'] == "automated", router['tags']), None)
         if not automated_tag:
             e_routers.update()
             l.info(f"Skipping {router['hostname']}, because there is no 'automated' tag. ")
             continue
+        automated_routers.append(router)
 
-        router_connections = list(filter(lambda c: c['router'] and c['router']['id'] == router['id'], connections))
-
-        bgp_device_groups = build_bgp_device_groups_for_ix_peerings(ix_peerings, router_connections, as_list,
-                                                                    routing_policies)
-
-        y = build_bgp_device_groups_for_direct_peerings(direct_peerings, router, routing_policies)
-        bgp_device_groups.extend(y)
-
-        match wanda_configuration.get('mode', 'junos'):
-            case 'junos':
-                write_junos(router, e_routers, bgp_device_groups)
-            case 'rtbrick':
-                write_rtbrick(router, e_routers, bgp_device_groups)
+    # Every router is generated on its own, a failing router does not stop the others.
+    inconsistent_routers = []
+    failed_routers = []
+    context = (peering_index, wanda_mode, output_state)
+    for router, result, error in run_jobs(generate_router_config, automated_routers, context, jobs):
+        e_routers.update()
+        if isinstance(error, InconsistentFilterGroups):
+            l.error(f"Inconsistency within filter groups for {router['hostname']}, need to regenerate filter groups")
+            inconsistent_routers.append(router['hostname'])
+        elif error:
+            l.error(f"Generating the configuration of {router['hostname']} failed: {type(error).__name__}: {error}")
+            failed_routers.append(router['hostname'])
+        else:
+            bgp_groups, written = result
+            if written:
+                output_state.record(router['hostname'], *written)
+            delta_state.add_bgp_groups(router['hostname'], bgp_groups)
 
     e_routers.close()
-    return 0
+
+    # The state of the other routers is still saved by the caller, so the exit code is only returned.
+    if inconsistent_routers:
+        return INCONSISTENT_FILTER_GROUPS_EXIT_CODE
+    return 1 if failed_routers else 0
@@ -1,51 +1,233 @@
-import pathlib
-import platform
+import asyncio
+import os
+import re
 from collections import defaultdict
-from multiprocessing.pool import Pool
-import json
-import yaml
+from multiprocessing.pool import ThreadPool
 
 from wanda.as_filter.as_filter import ASFilter
+from wanda.as_filter.prefix_aggregation import PREFIX_AGGREGATION_MODES
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.as_set_graph.as_set_graph import ASSetGraph
+from wanda.async_irrd_client import AsyncIRRDClient, DEFAULT_MAX_IN_FLIGHT
 from wanda.autonomous_system.autonomous_system import AutonomousSystem
+from wanda.filter_manifest import write_manifest
+from wanda.generation_delta import DeltaState
+from wanda.filter_store import DEFAULT_FILTER_STORE_DIR, FILTER_OUTPUT_MODES, FilterStore, get_filter_dump, write_filter_file
+from wanda.irrd_client import PrefetchedIRRData, QUERY_AS_SET_PREFIXES, QUERY_ASN_PREFIXES, QUERY_SET_MEMBERS
+from wanda.irrd_scheduler import DEFAULT_BATCH_COST_LIMIT, DEFAULT_LATENCY_THRESHOLD
+from wanda.junos_config import JUNOS_CONFIG_EXTENSIONS, JUNOS_CONFIG_MODES
 from wanda.logger import Logger
+from wanda.output_state import OutputState, get_input_hash, write_output
+from wanda.worker_pool import DEFAULT_JOBS, run_jobs
 
 l = Logger("filter_list_generation.py")
 
+IRR_EXPANSION_MODES = ["server", "local"]
 
-def process_filter_lists_for_as(arg):
-    [irrd_client, autonomous_system, customer_as, filter_lists] = arg
-    asn = autonomous_system.asn
-    is_customer = asn in customer_as
 
-    ass = ASFilter(irrd_client, autonomous_system, is_customer=is_customer)
+def plan_irr_work_items(autonomous_systems):
+    # Collects every distinct IRRD query once, together with the ASes that need its result.
+    work_items = {
+        QUERY_AS_SET_PREFIXES: {},
+        QUERY_ASN_PREFIXES: {},
+        QUERY_SET_MEMBERS: {},
+    }
+    requested_count = 0
+
+    for autonomous_system in autonomous_systems:
+        irr_names = autonomous_system.get_irr_names()
+
+        if irr_names:
+            as_work_items = [(QUERY_AS_SET_PREFIXES, irr_name) for irr_name in irr_names]
+            as_work_items.append((QUERY_SET_MEMBERS, irr_names[0]))
+        else:
+            as_work_items = [(QUERY_ASN_PREFIXES, autonomous_system.asn)]
+
+        requested_count += len(as_work_items)
+        for query_type, key in as_work_items:
+            work_items[query_type].setdefault(key, set()).add(autonomous_system.asn)
+
+    return work_items, requested_count
+
+
+def process_filter_lists_for_as(irrd_data, autonomous_system, is_customer, prefix_aggregation="none"):
+    ass = ASFilter(irrd_data, autonomous_system, is_customer=is_customer)
     v4_set, v6_set = ass.prefix_lists
     extended_filtering = is_customer or len(v4_set) + len(v6_set) < 5000
-    as_filter_list = ass.get_filter_lists(enable_extended_filters=extended_filtering)
+    as_filter_list = ass.get_filter_lists(enable_extended_filters=extended_filtering, prefix_aggregation=prefix_aggregation)
+
+    if extended_filtering and prefix_aggregation != "none":
+        entry_key = "route_filters" if prefix_aggregation == "ranges" else "prefixes"
+        before = len(v4_set) + len(v6_set)
+        after = len(as_filter_list[f'v4_{entry_key}']) + len(as_filter_list[f'v6_{entry_key}'])
+        if after < before:
+            l.info(f"Aggregated filter lists of {autonomous_system} from {before} to {after} entries")
+
+    return as_filter_list
+
+
+async def generate_filter_lists(async_irrd_client, autonomous_systems, customer_as, e_as, prefix_aggregation="none"):
+    work_items, requested_count = plan_irr_work_items(autonomous_systems)
+    distinct_count = sum(len(keys) for keys in work_items.values())
+    l.info(f"Planned {distinct_count} IRR queries for {len(autonomous_systems)} ASes, {requested_count - distinct_count} duplicates eliminated")
+
+    irrd_data = PrefetchedIRRData()
+    results_by_query_type = {
+        QUERY_AS_SET_PREFIXES: (async_irrd_client.generate_prefix_lists_bulk, irrd_data.prefix_lists),
+        QUERY_ASN_PREFIXES: (async_irrd_client.generate_prefix_lists_for_asns_bulk, irrd_data.asn_prefix_lists),
+        QUERY_SET_MEMBERS: (async_irrd_client.generate_input_aspath_access_lists_bulk, irrd_data.aspath_access_lists),
+    }
+
+    autonomous_systems_by_asn = {autonomous_system.asn: autonomous_system for autonomous_system in autonomous_systems}
+    pending_work_items = defaultdict(int)
+    for keys in work_items.values():
+        for asns in keys.values():
+            for asn in asns:
+                pending_work_items[asn] += 1
+
+    filter_lists = {}
+
+    # Every result is fanned out to all ASes that need it, an AS filter is built as soon as all of its results are there.
+    def on_batch(query_type, batch_results):
+        results_by_query_type[query_type][1].update(batch_results)
+
+        for key in batch_results:
+            for asn in work_items[query_type][key]:
+                pending_work_items[asn] -= 1
+                if pending_work_items[asn] == 0:
+                    filter_lists[asn] = process_filter_lists_for_as(
+                        irrd_data, autonomous_systems_by_asn[asn], asn in customer_as, prefix_aggregation
+                    )
+                    e_as.update()
+
+    # The client makes sure that only a bounded amount of batches is in flight at the same time.
+    await asyncio.gather(*[
+        bulk_func(list(work_items[query_type]), on_batch=lambda batch_results, query_type=query_type: on_batch(query_type, batch_results))
+        for query_type, (bulk_func, _) in results_by_query_type.items()
+    ])
+
+    # Only needed by the incremental cache validation of the next run, so it does not hold up the filter lists.
+    await async_irrd_client.cache_set_dependencies(sorted({*work_items[QUERY_AS_SET_PREFIXES], *work_items[QUERY_SET_MEMBERS]}))
+
+    return filter_lists
+
+
+async def fetch_as_set_graph(async_irrd_client, root_sets):
+    graph = ASSetGraph()
+
+    # AS-SET fields may also contain a plain ASN, which expands to itself.
+    for root_set in root_sets:
+        if re.match(r"^AS\d+$", root_set):
+            graph.add_members(root_set, [root_set])
+
+    # Fetch direct members level by level, until every referenced set is known.
+    unknown_sets = sorted(root_set for root_set in root_sets if root_set not in graph.member_sets)
+    while unknown_sets:
+        direct_members = await async_irrd_client.get_direct_set_members_bulk(unknown_sets)
+        for set_name in unknown_sets:
+            graph.add_members(set_name, direct_members.get(set_name, []))
+        unknown_sets = graph.get_unknown_sets()
+
+    graph.expand()
+    graph.report(root_sets)
+    return graph
+
+
+async def generate_filter_lists_locally(async_irrd_client, autonomous_systems, customer_as, e_as, prefix_aggregation="none"):
+    work_items, requested_count = plan_irr_work_items(autonomous_systems)
+    root_sets = list(work_items[QUERY_AS_SET_PREFIXES])
+
+    graph = await fetch_as_set_graph(async_irrd_client, root_sets)
+    l.info(f"Expanded {len(root_sets)} AS-SETs locally, {len(graph.member_sets)} sets in total")
+
+    asns = set(work_items[QUERY_ASN_PREFIXES])
+    for root_set in root_sets:
+        asns.update(graph.get_origin_asns(root_set))
+
+    distinct_count = sum(len(keys) for keys in work_items.values())
+    l.info(f"Planned {len(asns)} IRR queries for {len(autonomous_systems)} ASes, {requested_count - distinct_count} duplicates eliminated")
+
+    asn_prefix_lists = await async_irrd_client.generate_prefix_lists_for_asns_bulk(sorted(asns))
+
+    # Sets with the same expansion, e.g. within a loop, share their prefix lists.
+    prefix_lists_by_closure = {}
+    prefix_lists = {}
+    for root_set in root_sets:
+        closure = graph.get_origin_asns(root_set)
+        if closure not in prefix_lists_by_closure:
+            prefix_lists_by_closure[closure] = (
+                PrefixSet.union([asn_prefix_lists[asn][0] for asn in closure], 4),
+                PrefixSet.union([asn_prefix_lists[asn][1] for asn in closure], 6),
+            )
+        prefix_lists[root_set] = prefix_lists_by_closure[closure]
+
+    if len(prefix_lists_by_closure) < len(root_sets):
+        l.info(f"{len(root_sets) - len(prefix_lists_by_closure)} AS-SETs share the prefix lists of a set with the same expansion")
+
+    irrd_data = PrefetchedIRRData(
+        prefix_lists=prefix_lists,
+        asn_prefix_lists=asn_prefix_lists,
+        aspath_access_lists={root_set: sorted(graph.get_origin_asns(root_set)) for root_set in work_items[QUERY_SET_MEMBERS]},
+    )
+
+    filter_lists = {}
+    for autonomous_system in autonomous_systems:
+        asn = autonomous_system.asn
+        filter_lists[asn] = process_filter_lists_for_as(irrd_data, autonomous_system, asn in customer_as, prefix_aggregation)
+        e_as.update()
+
+    return filter_lists
+
+
+def write_router_filter_groups(context, job):
+    # Runs in a worker process, the written file is recorded in the output state by the parent.
+    # The filter lists of all ASes come with the context, jobs only carry the ASNs of their router.
+    wanda_mode, filter_lists = context
+    _, destination_file, _, router_asns, filter_hashes, filter_files = job
+
+    # Prefix sets stay packed until they are streamed into the file.
+    if filter_files is not None:
+        config_parts = {name: {"filter_file": filter_file} for name, filter_file in filter_files.items()}
+    else:
+        config_parts = {name: filter_lists[asn] for name, asn in router_asns.items()}
 
-    filter_lists[asn] = as_filter_list
+    changed = write_output(destination_file, get_filter_dump(wanda_mode, config_parts))
+    write_manifest(destination_file, filter_hashes, filter_files)
+    return changed
 
 
 def main_customer_filter_lists(
         enlighten_manager,
-        sync_manager,
         peering_manager_instance,
         irrd_client,
         wanda_configuration,
         hosts=None,
         max_threads=-1,
+        query_costs=None,
+        output_state: OutputState = None,
+        jobs=DEFAULT_JOBS,
+        delta_state: DeltaState = None,
 ) -> int:
+    # Checked before anything is fetched, an unknown mode would only fail after all IRR queries.
+    wanda_mode = wanda_configuration.get('mode', 'junos')
+    if wanda_mode not in ['junos', 'rtbrick', *JUNOS_CONFIG_MODES]:
+        l.error(f"{wanda_mode} is not a known mode, not able to generate filter lists")
+        return 1
+
     l.hint(f"Fetching ASes, make sure VPN is enabled on your system.")
 
-    e_targets = enlighten_manager.counter(total=5, desc='Fetching Data', unit='Targets')
+    e_targets = enlighten_manager.counter(total=6, desc='Fetching Data', unit='Targets')
 
-    with Pool(processes=5) as fetch_pool:
+    # The lists are fetched by threads of this process, so the client keeps them cached for the BGP generation.
+    with ThreadPool(processes=6) as fetch_pool:
         routers_res = fetch_pool.apply_async(peering_manager_instance.get_routers, ())
         as_list_res = fetch_pool.apply_async(peering_manager_instance.get_autonomous_systems, ())
         dp_list_res = fetch_pool.apply_async(peering_manager_instance.get_direct_peerings, ())
         ixp_list_res = fetch_pool.apply_async(peering_manager_instance.get_internet_exchange_peerings, ())
         connections_res = fetch_pool.apply_async(peering_manager_instance.get_connections, ())
+        routing_policies_res = fetch_pool.apply_async(peering_manager_instance.get_routing_policies, ())
 
-        routers = routers_res.get()
+        routers_res.get()
         e_targets.update()
         as_list = as_list_res.get()
         e_targets.update()
@@ -53,15 +235,18 @@ def main_customer_filter_lists(
         e_targets.update()
         ixp_list = ixp_list_res.get()
         e_targets.update()
-        connections = connections_res.get()
+        connections_res.get()
+        e_targets.update()
+        routing_policies_res.get()
         e_targets.update()
 
     e_targets.close()
 
+    peering_index = peering_manager_instance.get_index()
+
     if hosts:
-        router_list = list(map(lambda r: r['hostname'], routers))
         for host in hosts:
-            if host not in router_list:
+            if not peering_index.get_router(host):
                 l.warning(f"{host} is not a known host, ignoring...")
 
     router_per_as = {}
@@ -93,8 +278,7 @@ def main_customer_filter_lists(
             router_per_as[router_hostname] = {asn}
 
     for ixp in ixp_list:
-        fc = list(filter(lambda c: c['id'] == ixp['ixp_connection']['id'], connections))
-        connection = fc[0]
+        connection = peering_index.get_connection(ixp['ixp_connection']['id'])
 
         asn = ixp['autonomous_system']['asn']
         router_hostname = connection['router']['hostname']
@@ -120,69 +304,135 @@ def main_customer_filter_lists(
         else:
             router_per_as[router_hostname] = {asn}
 
-    filter_lists = sync_manager.dict()
-
-    prepared_asns = [
-        (
-            irrd_client,
-            AutonomousSystem(asn=ase['asn'], name=ase['name'], irr_as_set=ase['irr_as_set']),
-            extended_filtering_as,
-            filter_lists
-        ) for ase in as_list if ase['asn'] in enabled_asn
+    enabled_autonomous_systems = [
+        AutonomousSystem(asn=ase['asn'], name=ase['name'], irr_as_set=ase['irr_as_set'])
+        for ase in as_list if ase['asn'] in enabled_asn
     ]
 
-    e_as = enlighten_manager.counter(total=len(prepared_asns), desc='Generating Filter Lists for ASes', unit='AS')
+    e_as = enlighten_manager.counter(total=len(enabled_autonomous_systems), desc='Generating Filter Lists for ASes', unit='AS')
 
-    # We want to use as many processes as possible for speeds.
-    # Currently, macOS does funky things if you spawn too many threads, therefore we limit those on 8 threads.
-    # Linux's users can use the maximum amount of threads.
-    # We do not have any Windows user, but we may also want to limit them.
-    system_platform = platform.system()
     if max_threads != -1:
-        n_worker = max_threads
-        l.warning(f"Running with a limited amount of threads, n_worker={max_threads}")
-    elif system_platform == "Linux":
-        n_worker = max(len(prepared_asns), 1)
+        max_in_flight = max_threads
+        l.warning(f"Running with a limited amount of threads, max_in_flight={max_threads}")
     else:
-        l.warning("Running with a limited amount of threads due to OS limitations...")
-        n_worker = 8
+        max_in_flight = wanda_configuration.get('irrd_max_in_flight', DEFAULT_MAX_IN_FLIGHT)
+
+    prefix_aggregation = wanda_configuration.get('prefix_aggregation', 'none')
+    if prefix_aggregation not in PREFIX_AGGREGATION_MODES:
+        l.error(f"{prefix_aggregation} is not a known prefix aggregation, use one of {', '.join(PREFIX_AGGREGATION_MODES)}")
+        return 1
+    if prefix_aggregation == "ranges" and wanda_mode not in ['junos', *JUNOS_CONFIG_MODES]:
+        l.warning("Prefix length ranges are only supported in junos mode, collapsing prefixes instead")
+        prefix_aggregation = "collapse"
+
+    irr_expansion = wanda_configuration.get('irr_expansion', 'server')
+    if irr_expansion not in IRR_EXPANSION_MODES:
+        l.error(f"{irr_expansion} is not a known IRR expansion, use one of {', '.join(IRR_EXPANSION_MODES)}")
+        return 1
+
+    filter_output = wanda_configuration.get('filter_output', 'inline')
+    if filter_output not in FILTER_OUTPUT_MODES:
+        l.error(f"{filter_output} is not a known filter output, use one of {', '.join(FILTER_OUTPUT_MODES)}")
+        return 1
+    if filter_output == "shared" and wanda_mode in JUNOS_CONFIG_MODES:
+        l.warning("Junos configuration files cannot reference shared AS filter files, writing the filters inline instead")
+        filter_output = "inline"
+
+    # Drops cached IRR results that are affected by changes in the IRRD journal since they were fetched.
+    irrd_client.validate_cache()
+
+    async_irrd_client = AsyncIRRDClient(
+        irrd_client,
+        max_in_flight=max_in_flight,
+        max_rps=wanda_configuration.get('irrd_max_rps'),
+        latency_threshold=wanda_configuration.get('irrd_latency_threshold', DEFAULT_LATENCY_THRESHOLD),
+        costs=query_costs,
+        batch_cost_limit=wanda_configuration.get('irrd_batch_cost_limit', DEFAULT_BATCH_COST_LIMIT),
+    )
+    try:
+        generate = generate_filter_lists_locally if irr_expansion == "local" else generate_filter_lists
+        filter_lists = asyncio.run(generate(
+            async_irrd_client,
+            enabled_autonomous_systems,
+            extended_filtering_as,
+            e_as,
+            prefix_aggregation,
+        ))
+    finally:
+        async_irrd_client.close()
+
+    async_irrd_client.costs.save()
+
+    e_as.close()
 
-    with Pool(processes=n_worker) as fetch_pool:
-        for _ in fetch_pool.imap_unordered(process_filter_lists_for_as, prepared_asns):
-            e_as.update()
+    output_state = output_state or OutputState()
+    delta_state = delta_state or DeltaState()
+    filter_store = FilterStore(wanda_configuration.get('filter_store_dir', DEFAULT_FILTER_STORE_DIR), wanda_mode)
 
-        e_as.close()
+    # Every AS filter is hashed once, no matter on how many routers it is used.
+    # The packed filter lists are hashed, so unchanged routers are neither formatted nor dumped again.
+    filter_hashes = {asn: get_input_hash(filter_list) for asn, filter_list in filter_lists.items()}
 
+    filter_jobs = []
+    router_filter_lists = {}
     for router_hostname in router_per_as:
         as_list = router_per_as[router_hostname]
 
-        router = next(filter(lambda r: r['hostname'] == router_hostname, routers), None)
+        router = peering_index.get_router(router_hostname)
         automated_tag = next(filter(lambda t: t['name'] == "automated", router['tags']), None)
         if not automated_tag:
             l.info(f"Skipping {router['hostname']}, because there is no 'automated' tag. ")
             continue
 
-        config_parts = {}
-
-        for asn in as_list:
-            if asn in filter_lists:
-                config_parts[f"AS{asn}"] = filter_lists[asn]
+        router_asns = {f"AS{asn}": asn for asn in as_list if asn in filter_lists}
+        router_filter_hashes = {name: filter_hashes[asn] for name, asn in router_asns.items()}
+        router_filter_lists[router_hostname] = {name: filter_lists[asn] for name, asn in router_asns.items()}
 
         short_router_hostname = router_hostname.split(".")[0]
 
-        match wanda_configuration.get('mode', 'junos'):
+        match wanda_mode:
             case 'junos':
-                destination_path = f"./generated_vars/"
-                pathlib.Path(destination_path).mkdir(parents=True, exist_ok=True)
-                destination_file = f"{destination_path}/filter_groups-{router_hostname}.yml"
-                with open(destination_file, 'w') as yaml_file:
-                    dump = yaml.dump(config_parts, default_flow_style=False)
-                    yaml_file.write(dump)
+                destination_file = f"./generated_vars/filter_groups-{router_hostname}.yml"
             case 'rtbrick':
-                destination_path = f"./machines/{short_router_hostname}"
-                pathlib.Path(destination_path).mkdir(parents=True, exist_ok=True)
-                destination_file = f"{destination_path}/generated-wanda-filters.json"
-                with open(destination_file, 'w') as json_file:
-                    json.dump(config_parts, json_file, indent=2)
+                destination_file = f"./machines/{short_router_hostname}/generated-wanda-filters.json"
+            case 'junos_config' | 'junos_set':
+                destination_file = f"./generated_vars/filter_groups-{router_hostname}.{JUNOS_CONFIG_EXTENSIONS[wanda_mode]}"
+
+        filter_files = None
+        if filter_output == "shared":
+            filter_files = {name: filter_store.add(filter_hashes[asn], filter_lists[asn]) for name, asn in router_asns.items()}
+
+        # Shared router files reference the filter files by their path, so they follow a moved store.
+        store_dir = os.path.normpath(filter_store.store_dir) if filter_output == "shared" else None
+        input_hash = get_input_hash(wanda_mode, filter_output, store_dir, router_filter_hashes)
+        if output_state.is_current(destination_file, input_hash):
+            write_manifest(destination_file, router_filter_hashes, filter_files)
+            delta_state.add_filter_groups(router_hostname, router_filter_lists[router_hostname], router_filter_hashes)
+            continue
+
+        filter_jobs.append((router_hostname, destination_file, input_hash, router_asns, router_filter_hashes, filter_files))
+
+    failed = False
+
+    # Shared AS filter files are written before the router files referencing them.
+    for filter_hash, _, error in run_jobs(write_filter_file, list(filter_store.pending), filter_store, jobs):
+        if error:
+            l.error(f"Writing the AS filter file {filter_store.get_path(filter_hash)} failed: {type(error).__name__}: {error}")
+            failed = True
+
+    for job, changed, error in run_jobs(write_router_filter_groups, filter_jobs, (wanda_mode, filter_lists), jobs):
+        router_hostname, destination_file, input_hash, _, router_filter_hashes, _ = job
+        if error:
+            l.error(f"Writing the filter groups of {router_hostname} failed: {type(error).__name__}: {error}")
+            failed = True
+        else:
+            output_state.record(router_hostname, destination_file, input_hash, changed)
+            delta_state.add_filter_groups(router_hostname, router_filter_lists[router_hostname], router_filter_hashes)
+
+    if failed:
+        return 1
+
+    if filter_output == "shared" and not hosts:
+        filter_store.prune()
 
     return 0
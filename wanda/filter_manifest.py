@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+from wanda.logger import Logger
+from wanda.output_state import get_file_hash, get_file_stat, write_atomic
+
+l = Logger("filter_manifest.py")
+
+# Not a .yml or .json file, so it is not picked up together with the generated variables.
+MANIFEST_SUFFIX = ".manifest"
+
+
+def get_manifest_path(filter_file):
+    return f"{filter_file}{MANIFEST_SUFFIX}"
+
+
+def read_manifest(filter_file):
+    manifest_path = get_manifest_path(filter_file)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except ValueError:
+        l.warning(f"Ignoring unreadable manifest {manifest_path}")
+        return None
+
+
+def write_manifest(filter_file, filter_hashes, filter_files=None):
+    # Records the filter groups of a filter file, so the BGP generation does not have to parse it.
+    manifest = read_manifest(filter_file)
+    filter_file_stat = get_file_stat(filter_file)
+    if manifest and manifest.get("filter_file_stat") == filter_file_stat:
+        return
+
+    filter_file_hash = get_file_hash(filter_file)
+    if not manifest or manifest.get("filter_file_hash") != filter_file_hash:
+        manifest = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "filter_file_hash": filter_file_hash,
+            "filter_groups": dict(sorted(filter_hashes.items())),
+        }
+        if filter_files is not None:
+            manifest["filter_files"] = dict(sorted(filter_files.items()))
+    manifest["filter_file_stat"] = filter_file_stat
+
+    write_atomic(get_manifest_path(filter_file), json.dumps(manifest, indent=2).encode())
+
+
+class FilterGroupsFile:
+
+    # The filter groups of one router as seen by the BGP generation.
+    # The manifest answers for the file as long as the file is the one it was written for,
+    # the file itself is only read when it was touched since and only parsed when its content differs.
+
+    def __init__(self, filter_file, parse):
+        self.filter_file = filter_file
+        self.parse = parse
+        self.content = None
+        self.manifest = read_manifest(filter_file)
+
+        if self.manifest and self.manifest.get("filter_file_stat") == get_file_stat(filter_file):
+            self.file_hash = self.manifest["filter_file_hash"]
+            return
+
+        with open(filter_file, "rb") as filter_groups_file:
+            self.content = filter_groups_file.read()
+        self.file_hash = hashlib.sha256(self.content).hexdigest()
+
+        if self.manifest and self.manifest.get("filter_file_hash") != self.file_hash:
+            self.manifest = None
+
+    def get_filter_groups(self):
+        # Maps the filter group names to the shared AS filter file they reference, if any.
+        if self.manifest:
+            filter_files = self.manifest.get("filter_files", {})
+            return {name: filter_files.get(name) for name in self.manifest["filter_groups"]}
+
+        l.info(f"No manifest for {self.filter_file}, parsing the whole file")
+        filter_groups = self.parse(self.content) or {}
+        return {
+            name: filter_group.get("filter_file") if isinstance(filter_group, dict) else None
+            for name, filter_group in filter_groups.items()
+        }
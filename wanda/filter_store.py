@@ -0,0 +1,75 @@
+import os
+import pathlib
+import re
+from functools import partial
+
+from wanda.junos_config import JUNOS_CONFIG_MODES, write_filter_groups
+from wanda.logger import Logger
+from wanda.output_emitter import write_json, write_yaml
+from wanda.output_state import write_atomic
+
+l = Logger("filter_store.py")
+
+FILTER_OUTPUT_MODES = ["inline", "shared"]
+DEFAULT_FILTER_STORE_DIR = "./generated_filters"
+FILTER_FILE_EXTENSIONS = {"junos": "yml", "rtbrick": "json"}
+FILTER_FILE_NAME = re.compile(r"[0-9a-f]{64}\.(yml|json)")
+
+
+def get_filter_dump(wanda_mode, document):
+    match wanda_mode:
+        case 'junos':
+            return partial(write_yaml, document)
+        case 'rtbrick':
+            return partial(write_json, document, indent=2)
+        case 'junos_config' | 'junos_set':
+            return partial(write_filter_groups, document, config_format=JUNOS_CONFIG_MODES[wanda_mode])
+
+
+class FilterStore:
+
+    # Content addressed AS filter files: every distinct filter list is written once, named by its hash,
+    # and the filter file of a router only references the files of its ASes.
+
+    def __init__(self, store_dir, wanda_mode):
+        self.store_dir = store_dir
+        self.wanda_mode = wanda_mode
+        self.referenced = set()
+        # Filter lists of added files that do not exist yet, written by write_filter_file.
+        self.pending = {}
+
+    def get_path(self, filter_hash):
+        return os.path.normpath(os.path.join(self.store_dir, f"{filter_hash}.{FILTER_FILE_EXTENSIONS[self.wanda_mode]}"))
+
+    def add(self, filter_hash, filter_list):
+        # Existing files already have this content, they are named after it.
+        path = self.get_path(filter_hash)
+        if path not in self.referenced:
+            self.referenced.add(path)
+            if not os.path.exists(path):
+                self.pending[filter_hash] = filter_list
+        return path
+
+    def write(self, filter_hash, filter_list):
+        pathlib.Path(self.store_dir).mkdir(parents=True, exist_ok=True)
+        write_atomic(self.get_path(filter_hash), get_filter_dump(self.wanda_mode, filter_list))
+
+    def prune(self):
+        # Only complete runs know all referenced files.
+        if not os.path.isdir(self.store_dir):
+            return
+
+        removed = 0
+        for name in os.listdir(self.store_dir):
+            path = os.path.normpath(os.path.join(self.store_dir, name))
+            if FILTER_FILE_NAME.fullmatch(name) and path not in self.referenced:
+                os.remove(path)
+                removed += 1
+
+        if removed:
+            l.info(f"Removed {removed} unreferenced AS filter files from {self.store_dir}")
+
+
+def write_filter_file(filter_store: FilterStore, filter_hash):
+    # The pending filter lists reach the workers with the store, the jobs are just their hashes.
+    filter_store.write(filter_hash, filter_store.pending[filter_hash])
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+
+from wanda.as_filter.prefix_set import PrefixSet, format_prefix
+from wanda.logger import Logger
+from wanda.output_state import write_atomic
+
+l = Logger("generation_delta.py")
+
+GENERATION_FILE = "generation.sqlite3"
+PREFIX_FIELDS = ["v4_prefixes", "v6_prefixes", "v4_route_filters", "v6_route_filters"]
+POLICY_FIELDS = ["import", "export"]
+SCALAR_FIELDS = ["peer_as", "max_prefixes", "bfd"]
+
+
+def diff_sorted(old, new):
+    # Sorted merge of two ascending sequences, returns the added and the removed entries.
+    added = []
+    removed = []
+    old = iter(old)
+    new = iter(new)
+    old_entry = next(old, None)
+    new_entry = next(new, None)
+
+    while old_entry is not None and new_entry is not None:
+        if old_entry == new_entry:
+            old_entry = next(old, None)
+            new_entry = next(new, None)
+        elif old_entry < new_entry:
+            removed.append(old_entry)
+            old_entry = next(old, None)
+        else:
+            added.append(new_entry)
+            new_entry = next(new, None)
+
+    while old_entry is not None:
+        removed.append(old_entry)
+        old_entry = next(old, None)
+    while new_entry is not None:
+        added.append(new_entry)
+        new_entry = next(new, None)
+
+    return added, removed
+
+
+def diff_filter_field(old, new):
+    # Prefix sets are compared by their packed keys, only the differing prefixes are formatted.
+    if isinstance(old, PrefixSet) or isinstance(new, PrefixSet):
+        ip_version = (old if isinstance(old, PrefixSet) else new).ip_version
+        added, removed = diff_sorted(
+            old.iter_keys() if old is not None else (),
+            new.iter_keys() if new is not None else (),
+        )
+        return [format_prefix(key >> 8, key & 0xFF, ip_version) for key in added], \
+            [format_prefix(key >> 8, key & 0xFF, ip_version) for key in removed]
+    return diff_sorted(sorted(old or []), sorted(new or []))
+
+
+def get_filter_group_delta(old, new):
+    old = old or {}
+    new = new or {}
+    delta = {}
+    for field in ["origin_asns", *PREFIX_FIELDS]:
+        if field not in old and field not in new:
+            continue
+        added, removed = diff_filter_field(old.get(field), new.get(field))
+        if added or removed:
+            delta[field] = {"added": added, "removed": removed}
+    return delta
+
+
+def get_bgp_groups_snapshot(bgp_device_groups):
+    # Everything of a BGP group the delta is built from, the authentication key is only kept as a hash.
+    return {
+        bdg.name: {
+            "peer_as": bdg.asn,
+            "max_prefixes": bdg.max_prefixes,
+            "bfd": bdg.bfd_infos,
+            "authentication_key": hashlib.sha256(bdg.authentication_key.encode()).hexdigest() if bdg.authentication_key else None,
+            "neighbors": sorted(neighbor["peer"] for neighbor in bdg.neighbors),
+            "import": bdg.get_import_policies(),
+            "export": bdg.get_export_policies(),
+        }
+        for bdg in bgp_device_groups
+    }
+
+
+def get_bgp_group_delta(old, new):
+    old = old or {}
+    new = new or {}
+    delta = {}
+
+    added, removed = diff_sorted(old.get("neighbors", []), new.get("neighbors", []))
+    if added or removed:
+        delta["neighbors"] = {"added": added, "removed": removed}
+
+    # The order of the policies matters, so changed chains are always included as a whole.
+    for field in POLICY_FIELDS:
+        if old.get(field) != new.get(field):
+            added, removed = diff_sorted(sorted(old.get(field, [])), sorted(new.get(field, [])))
+            delta[field] = {"added": added, "removed": removed, "chain": new.get(field, [])}
+
+    for field in SCALAR_FIELDS:
+        if old.get(field) != new.get(field):
+            delta[field] = {"old": old.get(field), "new": new.get(field)}
+
+    if old.get("authentication_key") != new.get("authentication_key"):
+        delta["authentication_key"] = {"changed": True}
+
+    return delta
+
+
+def get_group_deltas(old_groups, new_groups, get_delta):
+    deltas = {}
+    for name in sorted(old_groups.keys() | new_groups.keys()):
+        if name not in old_groups:
+            status = "added"
+        elif name not in new_groups:
+            status = "removed"
+        else:
+            status = "changed"
+
+        delta = get_delta(old_groups.get(name), new_groups.get(name))
+        if delta or status != "changed":
+            deltas[name] = {"status": status, **delta}
+    return deltas
+
+
+def count_changes(group_deltas, fields, key):
+    return sum(len(delta[field][key]) for delta in group_deltas.values() for field in fields if field in delta)
+
+
+def get_summary(filter_group_deltas, bgp_group_deltas):
+    summary = {}
+    for prefix, group_deltas in [("filter_groups", filter_group_deltas), ("bgp_groups", bgp_group_deltas)]:
+        for status in ["added", "removed", "changed"]:
+            summary[f"{prefix}_{status}"] = sum(1 for delta in group_deltas.values() if delta["status"] == status)
+
+    for name, group_deltas, fields in [
+        ("prefixes", filter_group_deltas, PREFIX_FIELDS),
+        ("asns", filter_group_deltas, ["origin_asns"]),
+        ("neighbors", bgp_group_deltas, ["neighbors"]),
+        ("policies", bgp_group_deltas, POLICY_FIELDS),
+    ]:
+        summary[f"{name}_added"] = count_changes(group_deltas, fields, "added")
+        summary[f"{name}_removed"] = count_changes(group_deltas, fields, "removed")
+    return summary
+
+
+class GenerationStore:
+
+    # Keeps the filter lists and BGP groups of the previous generation of every router in a sqlite database.
+    # Filter lists are stored once per content hash, prefix sets in their packed form.
+
+    def __init__(self, path):
+        self.path = str(path)
+        pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        with self.connection as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS filter_lists (
+                    filter_hash TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    ip_version INTEGER,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (filter_hash, field)
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS routers (
+                    hostname TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    groups TEXT NOT NULL,
+                    PRIMARY KEY (hostname, kind)
+                )
+            """)
+
+    def get_router_groups(self, hostname, kind):
+        row = self.connection.execute("SELECT groups FROM routers WHERE hostname = ? AND kind = ?", (hostname, kind)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def set_router_groups(self, hostname, kind, groups):
+        with self.connection as connection:
+            connection.execute("INSERT OR REPLACE INTO routers (hostname, kind, groups) VALUES (?, ?, ?)",
+                               (hostname, kind, json.dumps(groups, sort_keys=True)))
+
+    def get_filter_list(self, filter_hash):
+        filter_list = {}
+        rows = self.connection.execute("SELECT field, ip_version, data FROM filter_lists WHERE filter_hash = ?", (filter_hash,))
+        for field, ip_version, data in rows:
+            filter_list[field] = PrefixSet.from_bytes(data, ip_version) if ip_version else json.loads(data)
+        return filter_list
+
+    def add_filter_list(self, filter_hash, filter_list):
+        rows = []
+        for field, value in filter_list.items():
+            if isinstance(value, PrefixSet):
+                rows.append((filter_hash, field, value.ip_version, value.to_bytes()))
+            else:
+                rows.append((filter_hash, field, None, json.dumps(list(value)).encode()))
+        with self.connection as connection:
+            connection.executemany("INSERT OR IGNORE INTO filter_lists (filter_hash, field, ip_version, data) VALUES (?, ?, ?, ?)", rows)
+
+    def prune(self):
+        # Filter lists are kept as long as any router still uses them.
+        referenced = set()
+        for (groups,) in self.connection.execute("SELECT groups FROM routers WHERE kind = 'filter_groups'"):
+            referenced.update(json.loads(groups).values())
+
+        stored = {filter_hash for (filter_hash,) in self.connection.execute("SELECT DISTINCT filter_hash FROM filter_lists")}
+        with self.connection as connection:
+            connection.executemany("DELETE FROM filter_lists WHERE filter_hash = ?", [(filter_hash,) for filter_hash in stored - referenced])
+
+    def close(self):
+        self.connection.close()
+
+
+class DeltaState:
+
+    # Compares the filter groups and BGP groups of every generated router with the previous generation.
+    # The deltas of a run are written into delta_dir, one file per router, together with the store of the generation.
+
+    def __init__(self, delta_dir=None):
+        self.delta_dir = delta_dir
+        self.store = GenerationStore(os.path.join(delta_dir, GENERATION_FILE)) if delta_dir else None
+        self.deltas = {}
+        # The store only moves to the new generation, once the deltas are written.
+        self.router_groups = {}
+        # Filter lists changing on several routers are only compared once.
+        self.filter_list_deltas = {}
+
+    def get_router_delta(self, hostname):
+        return self.deltas.setdefault(hostname, {"filter_groups": {}, "bgp_groups": {}})
+
+    def get_filter_list_delta(self, old_hash, new_hash, new_filter_list):
+        key = (old_hash, new_hash)
+        if key not in self.filter_list_deltas:
+            old_filter_list = self.store.get_filter_list(old_hash) if old_hash else None
+            self.filter_list_deltas[key] = get_filter_group_delta(old_filter_list, new_filter_list)
+        return self.filter_list_deltas[key]
+
+    def add_filter_groups(self, hostname, filter_lists, filter_hashes):
+        if not self.store:
+            return
+
+        old_hashes = self.store.get_router_groups(hostname, "filter_groups")
+        deltas = {}
+        for name in sorted(old_hashes.keys() | filter_hashes.keys()):
+            old_hash = old_hashes.get(name)
+            new_hash = filter_hashes.get(name)
+            # Filter lists with the same hash have the same content, so they are not compared at all.
+            if old_hash == new_hash:
+                continue
+
+            if new_hash:
+                self.store.add_filter_list(new_hash, filter_lists[name])
+                delta = self.get_filter_list_delta(old_hash, new_hash, filter_lists[name])
+            else:
+                delta = get_filter_group_delta(self.store.get_filter_list(old_hash), None)
+
+            status = "changed" if old_hash and new_hash else "added" if new_hash else "removed"
+            if delta or status != "changed":
+                deltas[name] = {"status": status, **delta}
+
+        self.get_router_delta(hostname)["filter_groups"] = deltas
+        self.router_groups[(hostname, "filter_groups")] = filter_hashes
+
+    def add_bgp_groups(self, hostname, bgp_groups):
+        if not self.store:
+            return
+
+        old_groups = self.store.get_router_groups(hostname, "bgp_groups")
+        self.get_router_delta(hostname)["bgp_groups"] = get_group_deltas(old_groups, bgp_groups, get_bgp_group_delta)
+        self.router_groups[(hostname, "bgp_groups")] = bgp_groups
+
+    def save(self):
+        if not self.store:
+            return
+
+        for (hostname, kind), groups in self.router_groups.items():
+            self.store.set_router_groups(hostname, kind, groups)
+        self.store.prune()
+        self.store.close()
+
+        # Deltas of routers that were not generated in this run are outdated.
+        for name in os.listdir(self.delta_dir):
+            if name.endswith(".json") and name[:-len(".json")] not in self.deltas:
+                os.remove(os.path.join(self.delta_dir, name))
+
+        empty_routers = 0
+        for hostname, delta in self.deltas.items():
+            summary = get_summary(delta["filter_groups"], delta["bgp_groups"])
+            empty = not delta["filter_groups"] and not delta["bgp_groups"]
+            empty_routers += empty
+            router_delta = {"router": hostname, "empty": empty, "summary": summary, **delta}
+            write_atomic(os.path.join(self.delta_dir, f"{hostname}.json"), json.dumps(router_delta, indent=2).encode())
+
+        l.info(f"Wrote deltas for {len(self.deltas)} routers to {self.delta_dir}, {empty_routers} without changes")
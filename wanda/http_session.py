@@ -0,0 +1,88 @@
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from wanda.response_archive import ArchiveAdapter
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                   archive=None):
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        # IRRD queries are sent as POST, but they are read-only, so retrying them is safe.
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    if archive:
+        adapter = ArchiveAdapter(archive, pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+def get_connection_stats(session):
+    new_connections = 0
+    total_requests = 0
+
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            new_connections += pool.num_connections
+            total_requests += pool.num_requests
+
+    return {
+        "new": new_connections,
+        "reused": max(total_requests - new_connections, 0),
+    }
+
+
+class PooledSession:
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF_FACTOR,
+                 archive=None):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.archive = archive
+
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self):
+        # Connection pools must not be shared with forked workers, every process gets its own.
+        if self._session is None or self._session_pid != os.getpid():
+            self._session = create_session(self.pool_size, self.retries, self.backoff_factor, self.archive)
+            self._session_pid = os.getpid()
+        return self._session
+
+    def get_connection_stats(self):
+        if self._session is None or self._session_pid != os.getpid():
+            return {"new": 0, "reused": 0}
+        return get_connection_stats(self._session)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_session'] = None
+        state['_session_pid'] = None
+        return state
@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+import zlib
+
+from wanda.logger import Logger
+from wanda.sqlite_database import SqliteDatabase
+
+l = Logger("irrd_cache.py")
+
+DEFAULT_CACHE_DIR = "./.wanda_cache"
+DEFAULT_TTL = 12 * 60 * 60
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+DEFAULT_MAX_SIZE_MB = 1024
+
+
+class IRRDCache(SqliteDatabase):
+
+    # Persists results of IRRD queries in a sqlite database, so they can be shared by concurrent workers and runs.
+
+    def __init__(self, path, ttl=DEFAULT_TTL, max_size_mb=DEFAULT_MAX_SIZE_MB, refresh=False, max_age=DEFAULT_MAX_AGE):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.refresh = refresh
+        self.snapshot_id = None
+
+        self.hits = 0
+        self.misses = 0
+
+        self._stats_lock = threading.Lock()
+
+        with self.connection as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS irrd_results (
+                    query_key TEXT PRIMARY KEY,
+                    result BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    validated_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    snapshot_id INTEGER
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS irrd_results_last_used ON irrd_results (last_used)")
+            connection.execute("CREATE INDEX IF NOT EXISTS irrd_results_snapshot_id ON irrd_results (snapshot_id)")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS serial_snapshots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    serials TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    host TEXT
+                )
+            """)
+            # Snapshots of caches created before they were kept per IRRD host are never validated again.
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(serial_snapshots)")]
+            if "host" not in columns:
+                connection.execute("ALTER TABLE serial_snapshots ADD COLUMN host TEXT")
+
+    def count(self, hits, misses):
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def get_many(self, query_keys):
+        if self.refresh or not query_keys:
+            self.count(0, len(query_keys))
+            return {}
+
+        now = time.time()
+        results = {}
+
+        with self.connection as connection:
+            for query_key in query_keys:
+                row = connection.execute(
+                    "SELECT result FROM irrd_results WHERE query_key = ? AND validated_at >= ? AND fetched_at >= ?",
+                    (query_key, now - self.ttl, now - self.max_age),
+                ).fetchone()
+                if row:
+                    results[query_key] = json.loads(zlib.decompress(row[0]))
+
+            connection.executemany(
+                "UPDATE irrd_results SET last_used = ? WHERE query_key = ?",
+                [(now, query_key) for query_key in results],
+            )
+
+        self.count(len(results), len(query_keys) - len(results))
+        return results
+
+    def set_many(self, results):
+        if not results:
+            return
+
+        now = time.time()
+        rows = []
+        for query_key, result in results.items():
+            blob = zlib.compress(json.dumps(result).encode())
+            rows.append((query_key, blob, len(blob), now, now, now, self.snapshot_id))
+
+        with self.connection as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO irrd_results (query_key, result, size, fetched_at, validated_at, last_used, snapshot_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.evict(connection)
+
+    def evict(self, connection):
+        total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM irrd_results").fetchone()[0]
+        if total_size <= self.max_size:
+            return
+
+        # Drop least recently used entries until the cache fits into max_size again.
+        evicted_keys = []
+        rows = connection.execute("SELECT query_key, size FROM irrd_results ORDER BY last_used").fetchall()
+        for query_key, size in rows:
+            if total_size <= self.max_size:
+                break
+            evicted_keys.append((query_key,))
+            total_size -= size
+
+        connection.executemany("DELETE FROM irrd_results WHERE query_key = ?", evicted_keys)
+
+    def load_many(self, query_keys):
+        # Reads entries regardless of their age and without touching the statistics, used for validation.
+        results = {}
+        with self.connection as connection:
+            for query_key in query_keys:
+                row = connection.execute("SELECT result FROM irrd_results WHERE query_key = ?", (query_key,)).fetchone()
+                if row:
+                    results[query_key] = json.loads(zlib.decompress(row[0]))
+        return results
+
+    def create_snapshot(self, serials, host=None):
+        with self.connection as connection:
+            cursor = connection.execute(
+                "INSERT INTO serial_snapshots (serials, created_at, host) VALUES (?, ?, ?)",
+                (json.dumps(serials), time.time(), host),
+            )
+            self.snapshot_id = cursor.lastrowid
+        return self.snapshot_id
+
+    def get_snapshots(self, host=None):
+        # Serials of different IRRD instances can not be compared, so only the snapshots of the host are returned.
+        with self.connection as connection:
+            rows = connection.execute("""
+                SELECT id, serials FROM serial_snapshots
+                WHERE id IN (SELECT DISTINCT snapshot_id FROM irrd_results) AND host IS ?
+            """, (host,)).fetchall()
+        return {snapshot_id: json.loads(serials) for snapshot_id, serials in rows if snapshot_id != self.snapshot_id}
+
+    def get_snapshot_keys(self, snapshot_id):
+        with self.connection as connection:
+            rows = connection.execute("SELECT query_key FROM irrd_results WHERE snapshot_id = ?", (snapshot_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def promote_snapshot(self, snapshot_id, stale_keys):
+        # Entries of the snapshot that were not touched by any change are valid for the current serials as well.
+        with self.connection as connection:
+            connection.executemany("DELETE FROM irrd_results WHERE query_key = ?", [(key,) for key in stale_keys])
+            cursor = connection.execute(
+                "UPDATE irrd_results SET snapshot_id = ?, validated_at = ? WHERE snapshot_id = ?",
+                (self.snapshot_id, time.time(), snapshot_id),
+            )
+            connection.execute(
+                "DELETE FROM serial_snapshots WHERE id NOT IN (SELECT DISTINCT snapshot_id FROM irrd_results WHERE snapshot_id IS NOT NULL) AND id != ?",
+                (self.snapshot_id,),
+            )
+        return cursor.rowcount
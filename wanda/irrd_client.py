@@ -1,51 +1,349 @@
-import requests
 import json
 import re
+import socket
 
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.http_session import PooledSession
 from wanda.logger import Logger
 
 l = Logger("irrd_client.py")
 
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_WHOIS_PORT = 43
+
+QUERY_AS_SET_PREFIXES = "asSetPrefixes"
+QUERY_ASN_PREFIXES = "asnPrefixes"
+QUERY_SET_MEMBERS = "recursiveSetMembers"
+QUERY_DIRECT_SET_MEMBERS = "directSetMembers"
+
+# Nesting depth of AS-SETs expanded by IRRD, and walked to find the sets an expansion depends on.
+SET_MEMBERS_DEPTH = 8
+
+
+def is_asn(member):
+    return re.match(r"^AS\d+$", member) is not None
+
+
+def parse_nrtm_changes(lines):
+    # Extracts the keys that IRR expansions depend on from a NRTMv3 response:
+    # changed as-sets, aut-nums and their member-of sets, as well as the origins of changed route objects.
+    changes = []
+    serial = None
+
+    for line in lines:
+        line = line.rstrip("\n")
+
+        if line.startswith("%ERROR") or line.startswith("%% ERROR"):
+            raise Exception(f"IRRD journal request failed: {line}")
+
+        operation = re.match(r"^(ADD|DEL) (\d+)$", line)
+        if operation:
+            serial = int(operation.group(2))
+            continue
+
+        attribute = re.match(r"^(as-set|aut-num|origin|member-of):\s*(.+)$", line, re.IGNORECASE)
+        if serial is None or not attribute:
+            continue
+
+        for value in re.split(r"[\s,]+", attribute.group(2).strip()):
+            if value and not value.startswith("#"):
+                changes.append((serial, value.upper()))
+
+    return changes
+
 
 class IRRDClient:
 
-    def __init__(self, irrd_url):
+    def __init__(self, irrd_url, batch_size=DEFAULT_BATCH_SIZE, http_session=None, cache=None, incremental=False,
+                 whois_port=DEFAULT_WHOIS_PORT):
         self.irrdURL = f"https://{irrd_url}/graphql/"
+        self.irrd_host = irrd_url.split("/")[0]
+        self.batch_size = max(int(batch_size), 1)
+        self.http = http_session or PooledSession()
+        self.cache = cache
+        self.incremental = incremental
+        self.whois_port = whois_port
 
     def fetch_graphql_data(self, query):
-        response = requests.post(url=self.irrdURL, json={"query": query})
+        response = self.http.session.post(url=self.irrdURL, json={"query": query})
         response.raise_for_status()
         return response.json()["data"]
 
+    def get_connection_stats(self):
+        return self.http.get_connection_stats()
+
+    def get_cache_stats(self):
+        if not self.cache:
+            return None
+        return self.cache.get_stats()
+
+    def get_cache_key(self, query_type, key):
+        # Different IRRD instances may answer differently, so their results are cached apart.
+        match query_type:
+            case "asSetPrefixes" | "asnPrefixes":
+                return f"{query_type}|{key}|ipVersion=4,6|{self.irrd_host}"
+            case "recursiveSetMembers":
+                return f"{query_type}|{key}|depth=8|{self.irrd_host}"
+            case "directSetMembers":
+                return f"{query_type}|{key}|depth=1|{self.irrd_host}"
+        raise Exception(f"Unknown IRRD query type {query_type}")
+
+    def build_query_fields(self, query_type, alias, key):
+        # Keys come from Peering Manager, they are quoted as JSON strings, which GraphQL string literals accept as well.
+        names = json.dumps([str(key)])
+        match query_type:
+            case "asSetPrefixes":
+                return f"""
+                  {alias}_v4: asSetPrefixes(setNames: {names}, ipVersion: 4) {{ prefixes }}
+                  {alias}_v6: asSetPrefixes(setNames: {names}, ipVersion: 6) {{ prefixes }}
+                """
+            case "asnPrefixes":
+                return f"""
+                  {alias}_v4: asnPrefixes(asns: {names}, ipVersion: 4) {{ prefixes }}
+                  {alias}_v6: asnPrefixes(asns: {names}, ipVersion: 6) {{ prefixes }}
+                """
+            case "recursiveSetMembers":
+                return f"""
+                  {alias}: recursiveSetMembers(setNames: {names}, depth: 8) {{ members }}
+                """
+            case "directSetMembers":
+                return f"""
+                  {alias}: recursiveSetMembers(setNames: {names}, depth: 1) {{ members }}
+                """
+        raise Exception(f"Unknown IRRD query type {query_type}")
+
+    def parse_query_result(self, query_type, alias, data):
+        match query_type:
+            case "asSetPrefixes" | "asnPrefixes":
+                return {
+                    "v4": data[f"{alias}_v4"][0]["prefixes"] if data[f"{alias}_v4"] else [],
+                    "v6": data[f"{alias}_v6"][0]["prefixes"] if data[f"{alias}_v6"] else [],
+                }
+            case "recursiveSetMembers" | "directSetMembers":
+                return data[alias][0]["members"] if data[alias] else []
+        raise Exception(f"Unknown IRRD query type {query_type}")
+
+    def query_bulk(self, query_type, keys):
+        # Every key becomes an aliased field, so one POST answers up to batch_size keys at once.
+        unique_keys = list(dict.fromkeys(keys))
+        results = {}
+
+        if self.cache:
+            cache_keys = {self.get_cache_key(query_type, key): key for key in unique_keys}
+            cached_results = self.cache.get_many(list(cache_keys))
+            results = {cache_keys[cache_key]: result for cache_key, result in cached_results.items()}
+            unique_keys = [key for key in unique_keys if key not in results]
+
+        for start in range(0, len(unique_keys), self.batch_size):
+            batch = unique_keys[start:start + self.batch_size]
+            fields = "".join(
+                self.build_query_fields(query_type, f"q{index}", key) for index, key in enumerate(batch)
+            )
+            data = self.fetch_graphql_data(f"{{{fields}}}")
+
+            batch_results = {
+                key: self.parse_query_result(query_type, f"q{index}", data) for index, key in enumerate(batch)
+            }
+            results.update(batch_results)
+
+            if self.cache:
+                self.cache.set_many({
+                    self.get_cache_key(query_type, key): result for key, result in batch_results.items()
+                })
+
+        return results
+
+    def get_database_serials(self):
+        data = self.fetch_graphql_data("{ databaseStatus { source serialNewestJournal } }")
+        return {status["source"]: status["serialNewestJournal"] for status in data["databaseStatus"]}
+
+    def fetch_journal_changes(self, source, first_serial, last_serial):
+        with socket.create_connection((self.irrd_host, self.whois_port), timeout=60) as connection:
+            connection.sendall(f"-g {source}:3:{first_serial}-{last_serial}\n".encode())
+            with connection.makefile("r", encoding="utf-8", errors="replace") as response:
+                return parse_nrtm_changes(response)
+
+    def get_changed_keys(self, snapshot_serials, serials, journals):
+        changed_keys = set()
+
+        for source in set(snapshot_serials) | set(serials):
+            old_serial = snapshot_serials.get(source)
+            serial = serials.get(source)
+            # Without a serial, e.g. for sources without a journal, changes of the source cannot be tracked.
+            if old_serial is None or serial is None:
+                return None
+            if old_serial == serial:
+                continue
+
+            if old_serial > serial or source not in journals:
+                return None
+
+            changed_keys.update(key for change_serial, key in journals[source] if change_serial > old_serial)
+
+        return changed_keys
+
+    def load_direct_set_members(self, irr_names):
+        # Reads the cached direct members level by level, the same way cache_set_dependencies fetched them.
+        # Sets without cached members map to None.
+        direct_members = {}
+        pending = set(irr_names)
+        for _ in range(SET_MEMBERS_DEPTH):
+            cache_keys = {self.get_cache_key(QUERY_DIRECT_SET_MEMBERS, name): name for name in pending}
+            loaded = self.cache.load_many(list(cache_keys))
+            for cache_key, name in cache_keys.items():
+                direct_members[name] = {member.upper() for member in loaded[cache_key]} if cache_key in loaded else None
+
+            pending = {
+                member for name in cache_keys.values() for member in direct_members[name] or []
+                if not is_asn(member)
+            } - direct_members.keys()
+            if not pending:
+                break
+        return direct_members
+
+    def get_set_dependencies(self, irr_name, direct_members):
+        # All sets and ASNs within the expansion of irr_name, None if the members of one of the sets are unknown.
+        dependencies = {irr_name.upper()}
+        pending = [irr_name]
+        while pending:
+            name = pending.pop()
+            if name not in direct_members:
+                # Nested deeper than the expansion reaches.
+                continue
+            if direct_members[name] is None:
+                return None
+            for member in direct_members[name]:
+                if member not in dependencies:
+                    dependencies.add(member)
+                    pending.append(member)
+        return dependencies
+
+    def get_stale_cache_keys(self, query_keys, changed_keys):
+        set_names = set()
+        for query_key in query_keys:
+            query_type, key, _ = query_key.split("|", 2)
+            if query_type in [QUERY_AS_SET_PREFIXES, QUERY_SET_MEMBERS]:
+                set_names.add(key)
+
+        # The recursive members only contain the leaves, so changes of nested sets are found through the direct members.
+        direct_members = self.load_direct_set_members(set_names)
+
+        stale_keys = []
+        for query_key in query_keys:
+            query_type, key, _ = query_key.split("|", 2)
+
+            if query_type in [QUERY_AS_SET_PREFIXES, QUERY_SET_MEMBERS]:
+                dependencies = self.get_set_dependencies(key, direct_members)
+                # Without the members we cannot tell what the expansion depends on.
+                if dependencies is None:
+                    stale_keys.append(query_key)
+                    continue
+            elif query_type == QUERY_DIRECT_SET_MEMBERS:
+                dependencies = {key.upper()}
+            else:
+                dependencies = {f"AS{key}"}
+
+            if dependencies & changed_keys:
+                stale_keys.append(query_key)
+
+        return stale_keys
+
+    def validate_cache(self):
+        if not self.cache or not self.incremental:
+            return
+
+        try:
+            serials = self.get_database_serials()
+        except Exception as e:
+            l.warning(f"Could not fetch IRRD database serials, falling back to time based caching: {e}")
+            return
+
+        snapshots = self.cache.get_snapshots(self.irrd_host)
+        self.cache.create_snapshot(serials, self.irrd_host)
+
+        # Fetch the journal of every changed source once, starting at the oldest serial we still have results for.
+        journals = {}
+        for source, serial in serials.items():
+            old_serials = [s[source] for s in snapshots.values() if s.get(source) is not None and s[source] < (serial or 0)]
+            if not old_serials:
+                continue
+            try:
+                journals[source] = self.fetch_journal_changes(source, min(old_serials) + 1, serial)
+            except Exception as e:
+                l.warning(f"Could not fetch IRRD journal of {source}: {e}")
+
+        reused_count = 0
+        stale_count = 0
+        for snapshot_id, snapshot_serials in snapshots.items():
+            changed_keys = self.get_changed_keys(snapshot_serials, serials, journals)
+            if changed_keys is None:
+                continue
+
+            stale_keys = self.get_stale_cache_keys(self.cache.get_snapshot_keys(snapshot_id), changed_keys)
+            reused_count += self.cache.promote_snapshot(snapshot_id, stale_keys)
+            stale_count += len(stale_keys)
+
+        if snapshots:
+            l.info(f"IRRD serials: {reused_count} cached results are unchanged, {stale_count} need to be refreshed")
+
+    def generate_input_aspath_access_lists_bulk(self, irr_names):
+        results = self.query_bulk(QUERY_SET_MEMBERS, irr_names)
+        return {
+            irr_name: [int(i[2:]) for i in set(members) if is_asn(i)]
+            for irr_name, members in results.items()
+        }
+
+    def get_direct_set_members_bulk(self, irr_names):
+        results = self.query_bulk(QUERY_DIRECT_SET_MEMBERS, irr_names)
+        return {irr_name: sorted({member.upper() for member in members}) for irr_name, members in results.items()}
+
+    def caches_set_dependencies(self):
+        # The direct members of all nested sets tell which changes affect an expansion, the incremental validation
+        # needs them cached. AsyncIRRDClient.cache_set_dependencies fetches them.
+        return bool(self.cache) and self.incremental
+
+    def generate_prefix_lists_for_asns_bulk(self, asns):
+        results = self.query_bulk(QUERY_ASN_PREFIXES, asns)
+        return {
+            asn: (PrefixSet.from_prefixes(result["v4"], 4), PrefixSet.from_prefixes(result["v6"], 6))
+            for asn, result in results.items()
+        }
+
+    def generate_prefix_lists_bulk(self, irr_names):
+        results = self.query_bulk(QUERY_AS_SET_PREFIXES, irr_names)
+
+        return {
+            irr_name: (PrefixSet.from_prefixes(result["v4"], 4), PrefixSet.from_prefixes(result["v6"], 6))
+            for irr_name, result in results.items()
+        }
+
+
+    # Single key lookups, as used by ASFilter, go through the bulk methods, so they are cached and batched alike.
+
     def generate_input_aspath_access_list(self, asn, irr_name):
-        body = f"""
-          {{
-              recursiveSetMembers(setNames: ["{irr_name}"], depth: 8) {{ members }}
-          }}
-        """
-        result = self.fetch_graphql_data(body)
+        return self.generate_input_aspath_access_lists_bulk([irr_name])[irr_name]
+
+    def generate_prefix_lists_for_asn(self, asn):
+        return self.generate_prefix_lists_for_asns_bulk([asn])[asn]
+
+    def generate_prefix_lists(self, irr_name):
+        return self.generate_prefix_lists_bulk([irr_name])[irr_name]
+
 
-        # return unique members that are ASNs
-        members = set(result["recursiveSetMembers"][0]["members"])
-        return [int(i[2:]) for i in members if re.match(r"^AS\d+$", i)]
+class PrefetchedIRRData:
+
+    # Answers the IRRDClient lookups used by ASFilter from results fetched in bulk beforehand.
+
+    def __init__(self, prefix_lists=None, asn_prefix_lists=None, aspath_access_lists=None):
+        self.prefix_lists = prefix_lists or {}
+        self.asn_prefix_lists = asn_prefix_lists or {}
+        self.aspath_access_lists = aspath_access_lists or {}
+
+    def generate_input_aspath_access_list(self, asn, irr_name):
+        return self.aspath_access_lists[irr_name]
 
     def generate_prefix_lists_for_asn(self, asn):
-        body = f"""
-          {{
-            v4: asnPrefixes(asns: ["{asn}"], ipVersion: 4) {{ prefixes }}
-            v6: asnPrefixes(asns: ["{asn}"], ipVersion: 6) {{ prefixes }}
-          }}
-       """
-        result = self.fetch_graphql_data(body)
-        return set(result["v4"][0]["prefixes"]), set(result["v6"][0]["prefixes"])
+        return self.asn_prefix_lists[asn]
 
     def generate_prefix_lists(self, irr_name):
-        body = f"""
-          {{
-            v4: asSetPrefixes(setNames: ["{irr_name}"], ipVersion: 4) {{ prefixes }}
-            v6: asSetPrefixes(setNames: ["{irr_name}"], ipVersion: 6) {{ prefixes }}
-          }}
-        """
-        result = self.fetch_graphql_data(body)
-
-        return set(result["v4"][0]["prefixes"]), set(result["v6"][0]["prefixes"])
+        return self.prefix_lists[irr_name]
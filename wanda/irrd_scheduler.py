@@ -0,0 +1,149 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import pathlib
+
+from wanda.logger import Logger
+from wanda.output_state import write_atomic
+
+l = Logger("irrd_scheduler.py")
+
+# Batches are closed once their expected amount of prefixes and members exceeds this limit,
+# so a few giant AS-SETs do not end up in the same request.
+DEFAULT_BATCH_COST_LIMIT = 100000
+DEFAULT_LATENCY_THRESHOLD = 30
+# Queries without a previous result are expected to be cheap.
+DEFAULT_COST = 1
+
+
+def get_result_cost(result):
+    # Prefix queries return a (v4, v6) tuple, member queries a list of members.
+    if isinstance(result, tuple):
+        return sum(len(prefixes) for prefixes in result)
+    if isinstance(result, (list, set)):
+        return len(result)
+    return DEFAULT_COST
+
+
+def plan_batches(keys, costs, batch_size, batch_cost_limit=DEFAULT_BATCH_COST_LIMIT):
+    # Returns (cost, keys) batches, the most expensive keys first.
+    batches = []
+    batch = []
+    batch_cost = 0
+
+    for key in sorted(keys, key=lambda k: costs[k], reverse=True):
+        if batch and (len(batch) >= batch_size or batch_cost + costs[key] > batch_cost_limit):
+            batches.append((batch_cost, batch))
+            batch = []
+            batch_cost = 0
+        batch.append(key)
+        batch_cost += costs[key]
+
+    if batch:
+        batches.append((batch_cost, batch))
+    return batches
+
+
+class QueryCosts:
+
+    # Remembers the result size of every IRRD query, so the next run can start with the most expensive ones.
+
+    def __init__(self, path=None):
+        self.path = str(path) if path else None
+        self.costs = {}
+
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as costs_file:
+                    self.costs = json.load(costs_file)
+            except ValueError:
+                l.warning(f"Ignoring unreadable IRRD query costs in {self.path}")
+
+    def get(self, query_key):
+        return self.costs.get(query_key, DEFAULT_COST)
+
+    def update(self, query_key, result):
+        self.costs[query_key] = get_result_cost(result)
+
+    def save(self):
+        if not self.path:
+            return
+        pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.path, json.dumps(self.costs))
+
+
+class RateLimiter:
+
+    # Spaces requests evenly, so at most max_rps requests are started per second.
+
+    def __init__(self, max_rps=None):
+        self.interval = 1 / max_rps if max_rps else 0
+        self.next_start = 0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.next_start)
+        self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class AdaptiveLimiter:
+
+    # Grants in-flight slots to the most expensive waiting batch first.
+    # The limit grows by one after every fast batch and is halved after an error or a slow batch.
+
+    def __init__(self, max_in_flight, latency_threshold=DEFAULT_LATENCY_THRESHOLD):
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self.latency_threshold = latency_threshold
+        self.limit = self.max_in_flight
+        self.in_flight = 0
+
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.wake_scheduled = False
+
+    async def acquire(self, cost=0):
+        # Slots are granted from a later loop iteration, so all batches queued at once are ordered by their cost.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self.waiters, (-cost, next(self.sequence), future))
+        if not self.wake_scheduled:
+            self.wake_scheduled = True
+            loop.call_soon(self.wake)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # A slot granted right before the cancellation has to be handed on.
+            if future.done() and not future.cancelled():
+                self.in_flight -= 1
+                self.wake()
+            raise
+
+    def release(self, latency, failed=False):
+        self.in_flight -= 1
+
+        if failed or latency > self.latency_threshold:
+            limit = max(self.limit // 2, 1)
+            if limit < self.limit:
+                l.warning(f"IRRD {'request failed' if failed else f'responded after {latency:.1f}s'}, reducing in-flight requests to {limit}")
+            self.limit = limit
+        elif self.limit < self.max_in_flight:
+            self.limit += 1
+
+        self.wake()
+
+    def wake(self):
+        self.wake_scheduled = False
+        while self.waiters and self.in_flight < self.limit:
+            _, _, future = heapq.heappop(self.waiters)
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
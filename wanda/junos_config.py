@@ -0,0 +1,141 @@
+import re
+from contextlib import contextmanager
+
+# Both modes write the same configuration, either as Junos configuration text or as set commands.
+JUNOS_CONFIG_MODES = {"junos_config": "text", "junos_set": "set"}
+JUNOS_CONFIG_EXTENSIONS = {"junos_config": "conf", "junos_set": "set"}
+
+INDENT = "    "
+UNQUOTED_WORD = re.compile(r'[^\s;{}"#]+')
+FILTER_GROUP_NAME = re.compile(rb"as-path-group (AS\d+)")
+
+
+def quote(word):
+    word = str(word)
+    if UNQUOTED_WORD.fullmatch(word):
+        return word
+    return '"' + word.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class JunosConfigWriter:
+
+    # Streams a configuration hierarchy into a file, statement by statement.
+    # In set format every statement becomes a set command with the path of its enclosing blocks.
+
+    def __init__(self, output_file, config_format):
+        self.output_file = output_file
+        self.config_format = config_format
+        self.path = []
+        # Amount of statements written within every open block, empty blocks still have to be created.
+        self.written = []
+
+    def statement(self, *words):
+        line = " ".join(map(quote, words))
+        if self.config_format == "set":
+            self.output_file.write(f"set {' '.join(self.path + [line])}\n")
+        else:
+            self.output_file.write(f"{INDENT * len(self.path)}{line};\n")
+        if self.written:
+            self.written[-1] += 1
+
+    @contextmanager
+    def block(self, *words):
+        line = " ".join(map(quote, words))
+        if self.config_format != "set":
+            self.output_file.write(f"{INDENT * len(self.path)}{line} {{\n")
+        if self.written:
+            self.written[-1] += 1
+
+        self.path.append(line)
+        self.written.append(0)
+        yield self
+        self.path.pop()
+        empty = self.written.pop() == 0
+
+        if self.config_format == "set":
+            if empty:
+                self.output_file.write(f"set {' '.join(self.path + [line])}\n")
+        else:
+            self.output_file.write(f"{INDENT * len(self.path)}}}\n")
+
+    def list_statement(self, keyword, values):
+        self.statement(keyword, "[", *values, "]")
+
+
+def write_filter_group(writer: JunosConfigWriter, name, filter_list):
+    with writer.block("as-path-group", name):
+        for origin_asn in filter_list["origin_asns"]:
+            writer.statement("as-path", f"AS{origin_asn}", f".* {origin_asn}")
+
+    for ip_suffix, prefixes_key, route_filters_key in [("V4", "v4_prefixes", "v4_route_filters"), ("V6", "v6_prefixes", "v6_route_filters")]:
+        if prefixes_key in filter_list:
+            with writer.block("prefix-list", f"{name}_{ip_suffix}"):
+                for prefix in filter_list[prefixes_key]:
+                    writer.statement(prefix)
+        elif route_filters_key in filter_list:
+            with writer.block("route-filter-list", f"{name}_{ip_suffix}"):
+                for route_filter in filter_list[route_filters_key]:
+                    writer.statement(*route_filter.split(" "))
+
+        with writer.block("policy-statement", f"POLICY_{name}_{ip_suffix}"):
+            with writer.block("term", "FILTER_LISTS"):
+                with writer.block("from"):
+                    writer.statement("as-path-group", name)
+                    if prefixes_key in filter_list:
+                        writer.statement("prefix-list-filter", f"{name}_{ip_suffix}", "orlonger")
+                    elif route_filters_key in filter_list:
+                        writer.statement("route-filter-list", f"{name}_{ip_suffix}")
+                with writer.block("then"):
+                    writer.statement("next", "policy")
+            with writer.block("then"):
+                writer.statement("reject")
+
+
+def write_filter_groups(filter_groups, output_file, config_format):
+    # Every AS is written as soon as it is formatted, the prefix sets are never converted as a whole.
+    writer = JunosConfigWriter(output_file, config_format)
+    with writer.block("policy-options"):
+        for name, filter_list in filter_groups.items():
+            write_filter_group(writer, name, filter_list)
+
+
+def write_bgp_group(writer: JunosConfigWriter, bgp_device_group):
+    junos_elem = bgp_device_group.to_junos()
+    family_name = "inet" if bgp_device_group.ip_version == 4 else "inet6"
+
+    with writer.block("group", junos_elem["name"]):
+        writer.statement("type", junos_elem["type"])
+        writer.list_statement("import", junos_elem["import"])
+        with writer.block("family", family_name):
+            family = junos_elem["family"].get(f"ipv{bgp_device_group.ip_version}_unicast", {})
+            if family.get("max_prefixes"):
+                with writer.block("unicast"):
+                    with writer.block("prefix-limit"):
+                        writer.statement("maximum", family["max_prefixes"])
+            else:
+                writer.statement("unicast")
+        if "authentication_key" in junos_elem:
+            writer.statement("authentication-key", junos_elem["authentication_key"])
+        writer.list_statement("export", junos_elem["export"])
+        if junos_elem["remove_private"]:
+            writer.statement("remove-private")
+        writer.statement("peer-as", junos_elem["peer_as"])
+        if "bfd" in junos_elem:
+            with writer.block("bfd-liveness-detection"):
+                writer.statement("minimum-interval", junos_elem["bfd"]["min_interval"])
+                writer.statement("multiplier", junos_elem["bfd"]["multiplier"])
+        for neighbor in junos_elem["neighbors"]:
+            writer.statement("neighbor", neighbor["peer"])
+
+
+def write_bgp_groups(bgp_device_groups, output_file, config_format):
+    writer = JunosConfigWriter(output_file, config_format)
+    with writer.block("protocols"):
+        with writer.block("bgp"):
+            for bgp_device_group in bgp_device_groups:
+                write_bgp_group(writer, bgp_device_group)
+
+
+def parse_filter_groups(content):
+    # Only the names of the filter groups are needed to check the BGP groups against a file without manifest.
+    return {name.decode(): None for name in FILTER_GROUP_NAME.findall(content)}
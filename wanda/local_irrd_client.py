@@ -0,0 +1,35 @@
+from wanda.as_set_graph.as_set_graph import SERVER_EXPANSION_DEPTH
+from wanda.irrd_client import DEFAULT_BATCH_SIZE, IRRDClient
+from wanda.logger import Logger
+from wanda.rpsl_store import RPSLStore
+
+l = Logger("local_irrd_client.py")
+
+
+class LocalIRRDClient(IRRDClient):
+
+    # Answers the IRRD queries used by wanda from RPSL dumps indexed in an RPSLStore,
+    # so filter lists can be generated without reaching an IRRD instance.
+
+    def __init__(self, store: RPSLStore, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(irrd_url=f"file://{store.path}", batch_size=batch_size)
+        self.store = store
+
+    def fetch_graphql_data(self, query):
+        raise Exception("IRRD queries are answered from local RPSL dumps, there is no IRRD instance to ask")
+
+    def query(self, query_type, key):
+        match query_type:
+            case "asSetPrefixes":
+                # Like IRRD, prefixes of a set are resolved without a depth limit.
+                return self.store.get_prefixes(self.store.get_recursive_asns(key))
+            case "asnPrefixes":
+                return self.store.get_prefixes([int(key)])
+            case "recursiveSetMembers":
+                return [f"AS{asn}" for asn in sorted(self.store.get_recursive_asns(key, SERVER_EXPANSION_DEPTH))]
+            case "directSetMembers":
+                return self.store.get_direct_members([key.upper()])[key.upper()]
+        raise Exception(f"Unknown IRRD query type {query_type}")
+
+    def query_bulk(self, query_type, keys):
+        return {key: self.query(query_type, key) for key in dict.fromkeys(keys)}
@@ -0,0 +1,187 @@
+import io
+import json
+import re
+from functools import lru_cache
+
+import yaml
+
+from wanda.as_filter.prefix_set import PrefixSet
+
+# libyaml parses the generated files a lot faster, the pure python loader is only used without it.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Formatted prefixes and route filters are always emitted as plain scalars, so they are not analyzed one by one.
+PLAIN_PREFIX = re.compile(r"[0-9a-f.:]+/[0-9]+")
+PLAIN_ROUTE_FILTER = re.compile(r"[0-9a-f.:]+/[0-9]+ (?:exact|orlonger|upto /[0-9]+|prefix-length-range /[0-9]+-/[0-9]+)")
+# PyYAML folds plain scalars with spaces at this column.
+BEST_WIDTH = 80
+MAX_SIMPLE_KEY_LENGTH = 128
+STR_TAG = "tag:yaml.org,2002:str"
+
+RESOLVER = yaml.resolver.Resolver()
+ANALYZER = yaml.emitter.Emitter(io.StringIO())
+
+
+class UnsupportedValue(Exception):
+    pass
+
+
+class UntaggedDumper(yaml.Dumper):
+
+    # Replaces the former global monkeypatch of yaml.emitter.Emitter.process_tag.
+
+    def process_tag(self):
+        pass
+
+
+@lru_cache(maxsize=65536)
+def is_plain_scalar(value):
+    # Same decision as yaml.Dumper: the text has to read back as a string and must not need any quoting.
+    if not value or RESOLVER.resolve(yaml.ScalarNode, value, (True, False)) != STR_TAG:
+        return False
+    analysis = ANALYZER.analyze_scalar(value)
+    return analysis.allow_block_plain and not analysis.multiline
+
+
+def represent_scalar(value, column):
+    if isinstance(value, str):
+        if not is_plain_scalar(value) or (" " in value and column + len(value) > BEST_WIDTH):
+            raise UnsupportedValue(value)
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if value is None:
+        return "null"
+    raise UnsupportedValue(value)
+
+
+def represent_key(key, column):
+    if not isinstance(key, str) or len(key) >= MAX_SIMPLE_KEY_LENGTH:
+        raise UnsupportedValue(key)
+    return represent_scalar(key, column)
+
+
+class BlockEmitter:
+
+    # Writes the block style yaml.dump(default_flow_style=False) produces for the wanda output schemas:
+    # mappings with sorted string keys, sequences, strings, integers and prefix sets.
+    # Anything else raises UnsupportedValue and the document is dumped by PyYAML instead.
+
+    def __init__(self):
+        # Containers that show up twice would become anchors and aliases in PyYAML.
+        self.seen = set()
+
+    def check_alias(self, value):
+        if id(value) in self.seen:
+            raise UnsupportedValue(value)
+        self.seen.add(id(value))
+
+    def iter_mapping(self, mapping, indent, inline=False):
+        self.check_alias(mapping)
+        try:
+            items = sorted(mapping.items())
+        except TypeError:
+            raise UnsupportedValue(mapping)
+
+        for index, (key, value) in enumerate(items):
+            # The first key of a mapping within a sequence follows the dash.
+            prefix = "" if inline and index == 0 else " " * indent
+            key_text = represent_key(key, indent)
+            line = f"{prefix}{key_text}:"
+
+            if isinstance(value, dict) and value:
+                yield f"{line}\n"
+                yield from self.iter_mapping(value, indent + 2)
+            elif isinstance(value, (list, PrefixSet)) and len(value):
+                # Sequences within mappings are not indented.
+                yield f"{line}\n"
+                yield from self.iter_sequence(value, indent)
+            else:
+                yield f"{line} {self.represent_leaf(value, indent + len(key_text) + 2)}\n"
+
+    def iter_sequence(self, sequence, indent):
+        prefix = " " * indent + "- "
+
+        if isinstance(sequence, PrefixSet):
+            # One chunk for the whole set, these are the huge parts of the filter groups.
+            yield "".join(f"{prefix}{prefix_text}\n" for prefix_text in sequence)
+            return
+
+        self.check_alias(sequence)
+        for item in sequence:
+            if isinstance(item, dict) and item:
+                yield prefix
+                yield from self.iter_mapping(item, indent + 2, inline=True)
+            elif isinstance(item, (list, PrefixSet)) and len(item):
+                raise UnsupportedValue(item)
+            elif isinstance(item, str) and PLAIN_PREFIX.fullmatch(item):
+                yield f"{prefix}{item}\n"
+            elif isinstance(item, str) and len(prefix) + len(item) <= BEST_WIDTH and PLAIN_ROUTE_FILTER.fullmatch(item):
+                yield f"{prefix}{item}\n"
+            else:
+                yield f"{prefix}{self.represent_leaf(item, len(prefix))}\n"
+
+    def represent_leaf(self, value, column):
+        if isinstance(value, dict):
+            return "{}"
+        if isinstance(value, (list, PrefixSet)):
+            return "[]"
+        return represent_scalar(value, column)
+
+    def iter_document(self, document):
+        if not isinstance(document, dict):
+            raise UnsupportedValue(document)
+        if not document:
+            yield "{}\n"
+            return
+        yield from self.iter_mapping(document, 0)
+
+
+def to_plain(value, converted=None):
+    # Shared containers stay shared, so PyYAML emits the same aliases as for the original document.
+    converted = {} if converted is None else converted
+    if isinstance(value, PrefixSet):
+        return list(value)
+    if isinstance(value, (dict, list)) and id(value) in converted:
+        return converted[id(value)]
+    if isinstance(value, dict):
+        converted[id(value)] = {key: to_plain(item, converted) for key, item in value.items()}
+        return converted[id(value)]
+    if isinstance(value, list):
+        converted[id(value)] = [to_plain(item, converted) for item in value]
+        return converted[id(value)]
+    return value
+
+
+def write_yaml(document, output_file):
+    # Produces the same bytes as yaml.dump(document, default_flow_style=False) without building the node tree.
+    start = output_file.tell()
+    try:
+        output_file.writelines(BlockEmitter().iter_document(document))
+    except UnsupportedValue:
+        output_file.seek(start)
+        output_file.truncate()
+        yaml.dump(to_plain(document), output_file, Dumper=UntaggedDumper, default_flow_style=False)
+
+
+def dump_yaml(document):
+    output = io.StringIO()
+    write_yaml(document, output)
+    return output.getvalue()
+
+
+def encode_json_value(value):
+    if isinstance(value, PrefixSet):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def write_json(document, output_file, indent):
+    # Streams the same text as json.dumps(document, indent=indent), prefix sets are written as lists.
+    output_file.writelines(json.JSONEncoder(indent=indent, default=encode_json_value).iterencode(document))
+
+
+def load_yaml(content):
+    return yaml.load(content, Loader=SafeLoader)
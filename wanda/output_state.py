@@ -0,0 +1,129 @@
+import filecmp
+import hashlib
+import json
+import os
+import pathlib
+
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.logger import Logger
+
+l = Logger("output_state.py")
+
+# Part of every input hash. Raise it whenever the generators write different output for the same input,
+# so files of an older release are regenerated instead of being kept as current.
+OUTPUT_FORMAT_VERSION = 1
+
+
+def encode_input(value):
+    # Prefix sets are hashed in their packed form, so unchanged filter lists never have to be formatted.
+    if isinstance(value, PrefixSet):
+        return f"{value.ip_version}:{hashlib.sha256(value.to_bytes()).hexdigest()}"
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} can not be hashed as generator input")
+
+
+def get_input_hash(*inputs):
+    serialized = json.dumps([OUTPUT_FORMAT_VERSION, *inputs], sort_keys=True, default=encode_input)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def get_file_stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def get_file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as hashed_file:
+        for block in iter(lambda: hashed_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_content(path, content):
+    # content is either the text of the file or a function streaming it into the file.
+    with open(path, "wb" if isinstance(content, bytes) else "w") as output_file:
+        if callable(content):
+            content(output_file)
+        else:
+            output_file.write(content)
+
+
+def remove_temp_file(temp_path):
+    # A failed write must not leave its temp file next to the outputs.
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
+
+def write_atomic(path, content):
+    # Readers of the file either see the old or the new content, never a partially written file.
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write_content(temp_path, content)
+        os.replace(temp_path, path)
+    except BaseException:
+        remove_temp_file(temp_path)
+        raise
+
+
+def write_output(output_path, content):
+    # Returns whether the file changed, files with the same content are left untouched.
+    pathlib.Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        write_content(temp_path, content)
+
+        if os.path.exists(output_path) and filecmp.cmp(temp_path, output_path, shallow=False):
+            os.remove(temp_path)
+            return False
+
+        os.replace(temp_path, output_path)
+        return True
+    except BaseException:
+        remove_temp_file(temp_path)
+        raise
+
+
+class OutputState:
+
+    # Remembers the input hash of every generated file, so unchanged routers are neither regenerated nor rewritten.
+    # Files are only replaced when their content changes and the routers of replaced files are collected.
+
+    def __init__(self, path=None):
+        self.path = str(path) if path else None
+        self.outputs = {}
+        self.changed_routers = []
+
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as state_file:
+                    self.outputs = json.load(state_file)
+            except ValueError:
+                l.warning(f"Ignoring unreadable output state in {self.path}")
+
+    def is_current(self, output_path, input_hash):
+        # Files changed by someone else since we wrote them are regenerated.
+        entry = self.outputs.get(os.path.abspath(output_path))
+        return bool(entry) and entry["input"] == input_hash and entry["stat"] == get_file_stat(output_path)
+
+    def write(self, router_hostname, output_path, content, input_hash):
+        self.record(router_hostname, output_path, input_hash, write_output(output_path, content))
+
+    def record(self, router_hostname, output_path, input_hash, changed):
+        # Files written by worker processes are recorded by the parent.
+        if changed and router_hostname not in self.changed_routers:
+            self.changed_routers.append(router_hostname)
+
+        self.outputs[os.path.abspath(output_path)] = {"input": input_hash, "stat": get_file_stat(output_path)}
+
+    def save(self):
+        if not self.path:
+            return
+        pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(self.path, json.dumps(self.outputs).encode())
@@ -1,9 +1,33 @@
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from wanda.http_session import PooledSession
+from wanda.logger import Logger
+from wanda.peeringmanager_index import PeeringManagerIndex
+from wanda.peeringmanager_snapshot import PeeringManagerSnapshot, get_newest_timestamp
+
+l = Logger("peeringmanager_client.py")
+
+DEFAULT_PAGE_SIZE = 100
+# Objects saved while the last sync ran may carry a slightly older last_updated than the newest one we have seen.
+SYNC_MARGIN = timedelta(minutes=5)
+# Keeps the query string of filtered requests short, long id lists are requested in chunks.
+FILTER_CHUNK_SIZE = 100
+
+
+def update_nested_object(nested, objects_by_id):
+    # Nested objects only carry a few fields of the object, just these are taken from the full one.
+    fresh = objects_by_id.get(nested['id']) if nested else None
+    if fresh:
+        nested.update({key: fresh[key] for key in nested.keys() & fresh.keys()})
 
 
 class PeeringManagerClient:
 
-    def __init__(self, peering_manager_url, peering_manager_api_token):
+    def __init__(self, peering_manager_url, peering_manager_api_token, http_session=None, page_size=DEFAULT_PAGE_SIZE,
+                 snapshot: PeeringManagerSnapshot = None):
 
         if not peering_manager_url:
             raise Exception("peering_manager_url is not defined.")
@@ -14,6 +38,12 @@ class PeeringManagerClient:
         self.data = []
         self.peeringManagerAPIUrl = peering_manager_url
         self.peeringManagerAPIToken = peering_manager_api_token
+        self.http = http_session or PooledSession()
+        self.page_size = max(int(page_size), 1)
+        self.snapshot = snapshot
+        # Lists are fetched by several threads, each of them fetching pages concurrently. All of them share the pool
+        # of the session, so the requests in flight are limited to its size and every request reuses a connection.
+        self.request_slots = threading.BoundedSemaphore(self.http.pool_size)
 
         self.cached_internet_exchanges = None
         self.cached_routers = None
@@ -22,64 +52,187 @@ class PeeringManagerClient:
         self.cached_direct_peerings = None
         self.cached_autonomous_systems = None
         self.cached_routing_policies = None
+        self.cached_index = None
+
+        # The lists are fetched by several threads at once, every cache has its own lock, so each list is only fetched
+        # once while the other lists are still fetched in parallel.
+        self.cache_locks = {name: threading.Lock() for name in vars(self) if name.startswith("cached_")}
+
+        self.router_ids = None
+
+    def fetch_page(self, url, headers, params=None):
+        with self.request_slots:
+            r = self.http.session.get(url, headers=headers, params=params)
+        r.raise_for_status()
+        return r.json()
 
-    def make_request_list(self, url):
+    def fetch_request_list(self, url, filters=None):
         headers = {
             "authorization": "Token " + self.peeringManagerAPIToken
         }
 
         fetch_url = self.peeringManagerAPIUrl + url
-        needs_another_fetch = True
 
-        results = []
+        filters = filters or {}
 
-        while needs_another_fetch:
-            r = requests.get(fetch_url, headers=headers)
-            json = r.json()
+        first_page = self.fetch_page(fetch_url, headers, {**filters, "limit": self.page_size, "offset": 0})
+        pages = [first_page]
 
-            results.extend(json['results'])
+        # The server may cap the page size, so the remaining offsets follow the size of the first page.
+        page_size = len(first_page['results'])
+        if first_page['next'] and page_size:
+            offsets = range(page_size, first_page['count'], page_size)
+            with ThreadPoolExecutor(max_workers=max(min(self.http.pool_size, len(offsets)), 1)) as executor:
+                pages.extend(executor.map(
+                    lambda offset: self.fetch_page(fetch_url, headers, {**filters, "limit": page_size, "offset": offset}),
+                    offsets,
+                ))
 
-            if json['next']:
-                fetch_url = json['next']
-            else:
-                needs_another_fetch = False
+        # Objects created while fetching can add pages beyond the initial count.
+        next_url = pages[-1]['next']
+        while next_url:
+            page = self.fetch_page(next_url, headers)
+            pages.append(page)
+            next_url = page['next']
 
-        results = sorted(results, key=lambda x: x['id'])
+        # Objects can move between pages while fetching, every id is only kept once.
+        results = {result['id']: result for page in pages for result in page['results']}
+        results = sorted(results.values(), key=lambda x: x['id'])
 
         return results
 
+    def make_request_list(self, url, filters=None):
+        if self.snapshot:
+            return self.sync_request_list(url, filters or {})
+        return self.fetch_request_list(url, filters)
+
+    def sync_request_list(self, url, filters):
+        list_key = f"{url}?{urlencode(sorted(filters.items()), doseq=True)}"
+        watermark = self.snapshot.get_watermark(list_key)
+
+        if watermark is None:
+            results = self.fetch_request_list(url, filters)
+            self.snapshot.update(list_key, results, [], get_newest_timestamp(results), replace=True)
+            return results
+
+        # Deletions show up in the brief id listing, changes by their last_updated.
+        ids = {o['id'] for o in self.fetch_request_list(url, {**filters, "brief": "true"})}
+        changed = self.fetch_request_list(url, {**filters, "last_updated__gte": (watermark - SYNC_MARGIN).isoformat()})
+
+        stored_ids = self.snapshot.get_ids(list_key)
+        changed_ids = {o['id'] for o in changed}
+        deleted_ids = stored_ids - ids
+
+        # Objects we have never seen, but with an older last_updated, are fetched by their id.
+        missing_ids = sorted(ids - stored_ids - changed_ids)
+        for start in range(0, len(missing_ids), FILTER_CHUNK_SIZE):
+            changed.extend(self.fetch_request_list(url, {**filters, "id": missing_ids[start:start + FILTER_CHUNK_SIZE]}))
+
+        self.snapshot.update(list_key, changed, deleted_ids, get_newest_timestamp(changed, watermark))
+        if changed or deleted_ids:
+            l.info(f"{url}: {len(changed)} changed and {len(deleted_ids)} deleted objects since the last sync")
+
+        return self.snapshot.get_objects(list_key)
+
+    def make_filtered_request_list(self, url, filter_name, values):
+        values = sorted(set(values))
+        results = []
+        for start in range(0, len(values), FILTER_CHUNK_SIZE):
+            results.extend(self.make_request_list(url, {filter_name: values[start:start + FILTER_CHUNK_SIZE]}))
+        return sorted(results, key=lambda x: x['id'])
+
+    def set_router_scope(self, hostnames):
+        # Only objects related to these routers are fetched from now on, used when hosts are limited.
+        self.router_ids = [router['id'] for router in self.get_routers() if router['hostname'] in hostnames]
+
+        self.cached_connections = None
+        self.cached_internet_exchange_peerings = None
+        self.cached_direct_peerings = None
+        self.cached_autonomous_systems = None
+        self.cached_index = None
+
+    def get_cached(self, name, fetch):
+        with self.cache_locks[name]:
+            if getattr(self, name) is None:
+                setattr(self, name, fetch())
+            return getattr(self, name)
+
+    def get_connection_stats(self):
+        return self.http.get_connection_stats()
+
     def get_internet_exchanges(self):
-        if not self.cached_internet_exchanges:
-            self.cached_internet_exchanges = self.make_request_list('/api/peering/internet-exchanges/')
-        return self.cached_internet_exchanges
+        return self.get_cached('cached_internet_exchanges',
+                               lambda: self.make_request_list('/api/peering/internet-exchanges/'))
 
     def get_routers(self):
-        if not self.cached_routers:
-            self.cached_routers = self.make_request_list('/api/devices/routers/')
-        return self.cached_routers
+        return self.get_cached('cached_routers', lambda: self.make_request_list('/api/devices/routers/'))
+
+    def fetch_connections(self):
+        if self.router_ids is not None:
+            return self.make_filtered_request_list('/api/net/connections/', 'router_id', self.router_ids)
+        return self.make_request_list('/api/net/connections/')
 
     def get_connections(self):
-        if not self.cached_connections:
-            self.cached_connections = self.make_request_list('/api/net/connections/')
-        return self.cached_connections
+        return self.get_cached('cached_connections', self.fetch_connections)
+
+    def fetch_internet_exchange_peerings(self):
+        if self.router_ids is not None:
+            return self.make_filtered_request_list(
+                '/api/peering/internet-exchange-peering-sessions/', 'ixp_connection_id',
+                [connection['id'] for connection in self.get_connections()])
+        return self.make_request_list('/api/peering/internet-exchange-peering-sessions/')
 
     def get_internet_exchange_peerings(self):
-        if not self.cached_internet_exchange_peerings:
-            self.cached_internet_exchange_peerings = self.make_request_list(
-                '/api/peering/internet-exchange-peering-sessions/')
-        return self.cached_internet_exchange_peerings
+        return self.get_cached('cached_internet_exchange_peerings', self.fetch_internet_exchange_peerings)
+
+    def fetch_direct_peerings(self):
+        if self.router_ids is not None:
+            return self.make_filtered_request_list('/api/peering/direct-peering-sessions/', 'router_id', self.router_ids)
+        return self.make_request_list('/api/peering/direct-peering-sessions/')
 
     def get_direct_peerings(self):
-        if not self.cached_direct_peerings:
-            self.cached_direct_peerings = self.make_request_list('/api/peering/direct-peering-sessions/')
-        return self.cached_direct_peerings
+        return self.get_cached('cached_direct_peerings', self.fetch_direct_peerings)
+
+    def fetch_autonomous_systems(self):
+        if self.router_ids is not None:
+            sessions = self.get_direct_peerings() + self.get_internet_exchange_peerings()
+            return self.make_filtered_request_list(
+                '/api/peering/autonomous-systems/', 'id',
+                [session['autonomous_system']['id'] for session in sessions])
+        return self.make_request_list('/api/peering/autonomous-systems/')
 
     def get_autonomous_systems(self):
-        if not self.cached_autonomous_systems:
-            self.cached_autonomous_systems = self.make_request_list('/api/peering/autonomous-systems/')
-        return self.cached_autonomous_systems
+        return self.get_cached('cached_autonomous_systems', self.fetch_autonomous_systems)
 
     def get_routing_policies(self):
-        if not self.cached_routing_policies:
-            self.cached_routing_policies = self.make_request_list('/api/peering/routing-policies/')
-        return self.cached_routing_policies
+        return self.get_cached('cached_routing_policies',
+                               lambda: self.make_request_list('/api/peering/routing-policies/'))
+
+    def resolve_nested_objects(self):
+        # Synced objects only change with their own last_updated, so a session kept in the snapshot still carries
+        # the nested autonomous system, connection and router of its last change. They are taken from the synced lists.
+        autonomous_systems = {o['id']: o for o in self.get_autonomous_systems()}
+        connections = {o['id']: o for o in self.get_connections()}
+        routers = {o['id']: o for o in self.get_routers()}
+
+        for connection in connections.values():
+            update_nested_object(connection.get('router'), routers)
+        for session in self.get_internet_exchange_peerings() + self.get_direct_peerings():
+            update_nested_object(session.get('autonomous_system'), autonomous_systems)
+            update_nested_object(session.get('ixp_connection'), connections)
+            update_nested_object(session.get('router'), routers)
+
+    def build_index(self):
+        if self.snapshot:
+            self.resolve_nested_objects()
+        return PeeringManagerIndex(
+            routers=self.get_routers(),
+            connections=self.get_connections(),
+            ix_peerings=self.get_internet_exchange_peerings(),
+            direct_peerings=self.get_direct_peerings(),
+            routing_policies=self.get_routing_policies(),
+        )
+
+    def get_index(self):
+        # Built once and shared by the filter list and the BGP generation.
+        return self.get_cached('cached_index', self.build_index)
@@ -0,0 +1,52 @@
+def group_by(objects, get_key):
+    # Keeps the order of the objects within every group.
+    groups = {}
+    for obj in objects:
+        key = get_key(obj)
+        if key is None:
+            continue
+        groups.setdefault(key, []).append(obj)
+    return groups
+
+
+def get_object_id(obj):
+    return obj['id'] if obj else None
+
+
+class PeeringManagerIndex:
+
+    # Id keyed lookups over the lists fetched from Peering Manager, built in a single pass over each list.
+    # Both the filter list and the BGP generation work on these, so they stay linear in the amount of sessions.
+
+    def __init__(self, routers, connections, ix_peerings, direct_peerings, routing_policies=()):
+        self.routers_by_id = {router['id']: router for router in routers}
+        self.routers_by_hostname = {router['hostname']: router for router in routers}
+        self.connections_by_id = {connection['id']: connection for connection in connections}
+        self.routing_policies_by_id = {policy['id']: policy for policy in routing_policies}
+
+        self.connections_by_router = group_by(connections, lambda c: get_object_id(c['router']))
+        self.ix_peerings_by_connection = group_by(ix_peerings, lambda ix: get_object_id(ix['ixp_connection']))
+        self.direct_peerings_by_router = group_by(direct_peerings, lambda dp: get_object_id(dp['router']))
+        self.unattached_direct_peerings = [dp for dp in direct_peerings if not dp['router']]
+
+    def get_router(self, hostname):
+        return self.routers_by_hostname.get(hostname)
+
+    def get_connection(self, connection_id):
+        return self.connections_by_id.get(connection_id)
+
+    def get_router_connections(self, router):
+        return self.connections_by_router.get(router['id'], [])
+
+    def get_ix_peerings(self, connection):
+        return self.ix_peerings_by_connection.get(connection['id'], [])
+
+    def get_direct_peerings(self, router):
+        return self.direct_peerings_by_router.get(router['id'], [])
+
+    def get_routing_policies(self, group_policies):
+        return [
+            self.routing_policies_by_id[policy['id']]
+            for policy in group_policies
+            if policy['id'] in self.routing_policies_by_id
+        ]
@@ -0,0 +1,90 @@
+import json
+import time
+import zlib
+from datetime import datetime, timezone
+
+from wanda.logger import Logger
+from wanda.sqlite_database import SqliteDatabase
+
+l = Logger("peeringmanager_snapshot.py")
+
+
+def parse_timestamp(value):
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def get_newest_timestamp(objects, timestamp=None):
+    # Returns None, if any object has no last_updated, incremental syncs are not possible then.
+    for o in objects:
+        if not o.get('last_updated'):
+            return None
+        object_timestamp = parse_timestamp(o['last_updated'])
+        if timestamp is None or object_timestamp > timestamp:
+            timestamp = object_timestamp
+    return timestamp
+
+
+class PeeringManagerSnapshot(SqliteDatabase):
+
+    # Persists the Peering Manager lists of the last run in a sqlite database,
+    # so later runs only need to fetch the objects that changed since then.
+
+    def __init__(self, path, refresh=False):
+        super().__init__(path)
+        self.refresh = refresh
+
+        with self.connection as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS pm_objects (
+                    list_key TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (list_key, id)
+                ) WITHOUT ROWID
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS pm_lists (
+                    list_key TEXT PRIMARY KEY,
+                    watermark TEXT,
+                    synced_at REAL NOT NULL
+                )
+            """)
+
+    def get_watermark(self, list_key):
+        if self.refresh:
+            return None
+        row = self.connection.execute("SELECT watermark FROM pm_lists WHERE list_key = ?", (list_key,)).fetchone()
+        if not row or not row[0]:
+            return None
+        return parse_timestamp(row[0])
+
+    def get_ids(self, list_key):
+        rows = self.connection.execute("SELECT id FROM pm_objects WHERE list_key = ?", (list_key,)).fetchall()
+        return {row[0] for row in rows}
+
+    def get_objects(self, list_key):
+        rows = self.connection.execute(
+            "SELECT data FROM pm_objects WHERE list_key = ? ORDER BY id", (list_key,)
+        ).fetchall()
+        return [json.loads(zlib.decompress(row[0])) for row in rows]
+
+    def update(self, list_key, changed_objects, deleted_ids, watermark, replace=False):
+        # Everything of a list is written in one transaction, an interrupted run keeps the previous snapshot.
+        with self.connection as connection:
+            if replace:
+                connection.execute("DELETE FROM pm_objects WHERE list_key = ?", (list_key,))
+            connection.executemany(
+                "DELETE FROM pm_objects WHERE list_key = ? AND id = ?",
+                [(list_key, object_id) for object_id in deleted_ids],
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO pm_objects (list_key, id, data) VALUES (?, ?, ?)",
+                [(list_key, o['id'], zlib.compress(json.dumps(o).encode())) for o in changed_objects],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO pm_lists (list_key, watermark, synced_at) VALUES (?, ?, ?)",
+                (list_key, watermark.isoformat() if watermark else None, time.time()),
+            )
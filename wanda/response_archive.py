@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from wanda.logger import Logger
+
+l = Logger("response_archive.py")
+
+ARCHIVE_MODES = ["record", "replay"]
+# Only headers that describe the body are kept, the body itself is stored decoded.
+RECORDED_HEADERS = ["Content-Type"]
+
+
+def get_request_key(request):
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode()
+
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.url}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class ResponseArchive:
+
+    # Stores upstream responses as one gzipped file per request, keyed by method, url and body.
+    # Every file starts with a json line describing the response, followed by the raw body.
+
+    def __init__(self, directory, mode):
+        if mode not in ARCHIVE_MODES:
+            raise Exception(f"{mode} is not a known archive mode, use one of {', '.join(ARCHIVE_MODES)}")
+
+        self.directory = str(directory)
+        self.mode = mode
+
+        if mode == "record":
+            pathlib.Path(self.directory).mkdir(parents=True, exist_ok=True)
+        elif not os.path.isdir(self.directory):
+            raise Exception(f"Response archive {self.directory} does not exist")
+
+    def get_path(self, key):
+        return os.path.join(self.directory, f"{key}.gz")
+
+    def write(self, key, request, response):
+        header = {
+            "method": request.method,
+            "url": request.url,
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+        }
+
+        # Concurrent writers of the same request must not see half written files.
+        path = self.get_path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(temp_path, "wb") as archive_file:
+            archive_file.write(json.dumps(header).encode() + b"\n")
+            archive_file.write(response.content)
+        os.replace(temp_path, path)
+
+    def read(self, key, request):
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            raise Exception(f"No recorded response for {request.method} {request.url} in {self.directory}")
+
+        with gzip.open(path, "rb") as archive_file:
+            header, _, body = archive_file.read().partition(b"\n")
+        header = json.loads(header)
+
+        response = requests.Response()
+        response.status_code = header["status"]
+        response.reason = header["reason"]
+        response.headers = CaseInsensitiveDict(header["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response._content = body
+        return response
+
+    def write_metadata(self, metadata):
+        with open(os.path.join(self.directory, "archive.json"), "w") as metadata_file:
+            json.dump(metadata, metadata_file, indent=2)
+
+    def read_metadata(self):
+        path = os.path.join(self.directory, "archive.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as metadata_file:
+            return json.load(metadata_file)
+
+
+class ArchiveAdapter(HTTPAdapter):
+
+    # Records every response passing through the session or answers requests from the archive without network.
+
+    def __init__(self, archive: ResponseArchive, **kwargs):
+        self.archive = archive
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        key = get_request_key(request)
+
+        if self.archive.mode == "replay":
+            response = self.archive.read(key, request)
+            response.connection = self
+            return response
+
+        response = super().send(request, **kwargs)
+        self.archive.write(key, request, response)
+        return response
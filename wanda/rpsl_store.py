@@ -0,0 +1,281 @@
+import gzip
+import json
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+
+from wanda.logger import Logger
+from wanda.sqlite_database import SqliteDatabase
+
+l = Logger("rpsl_store.py")
+
+RPSL_OBJECT_CLASSES = ["route", "route6", "as-set", "aut-num"]
+
+# Keeps the number of bound parameters below the sqlite limit.
+QUERY_CHUNK_SIZE = 500
+INSERT_CHUNK_SIZE = 10000
+
+
+def open_dump(path):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def find_dump_files(paths):
+    dump_files = []
+    for path in paths:
+        path = pathlib.Path(path)
+        if path.is_dir():
+            dump_files.extend(sorted(p for p in path.iterdir() if p.is_file()))
+        elif path.is_file():
+            dump_files.append(path)
+        else:
+            raise Exception(f"RPSL dump {path} does not exist")
+    return dump_files
+
+
+def split_values(values):
+    return [value for value in re.split(r"[\s,]+", " ".join(values)) if value]
+
+
+def parse_rpsl_objects(lines, object_classes=RPSL_OBJECT_CLASSES):
+    # Yields (object class, {attribute: [values]}) for every object of the given classes in a dump.
+    # Objects are separated by blank lines, continuation lines start with whitespace or '+'.
+    attributes = None
+    object_class = None
+    attribute = None
+    skipping = False
+
+    for line in lines:
+        if not line or line.isspace():
+            if attributes is not None:
+                yield object_class, attributes
+            attributes = None
+            attribute = None
+            skipping = False
+            continue
+
+        if skipping or line[0] in "%#":
+            continue
+
+        if line[0] in " \t+":
+            if attribute is not None:
+                attributes[attribute][-1] += " " + line[1:].split("#", 1)[0].strip()
+            continue
+
+        attribute, _, value = line.partition(":")
+        attribute = attribute.strip().lower()
+        value = value.split("#", 1)[0].strip()
+
+        if attributes is None:
+            if attribute not in object_classes:
+                skipping = True
+                attribute = None
+                continue
+            object_class = attribute
+            attributes = {}
+
+        attributes.setdefault(attribute, []).append(value)
+
+    if attributes is not None:
+        yield object_class, attributes
+
+
+def parse_asn(value):
+    match = re.match(r"^AS(\d+)$", value.strip(), re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+
+class RPSLStore(SqliteDatabase):
+
+    # Indexes route, route6, as-set and aut-num objects of RPSL dumps in a sqlite database,
+    # so IRRD queries can be answered without reaching an IRRD instance.
+    # Queries only read the store, it is built into a separate file by load.
+
+    def __init__(self, path):
+        super().__init__(path, read_only=True)
+
+    def get_fingerprint(self, dump_files):
+        return json.dumps([[str(path), path.stat().st_size, path.stat().st_mtime] for path in dump_files])
+
+    def get_stored_fingerprint(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        return row[0] if row else None
+
+    def load(self, paths):
+        # The dumps are only ingested again, if one of them changed since the store was built.
+        dump_files = find_dump_files(paths)
+        if not dump_files:
+            raise Exception("No RPSL dumps given")
+
+        fingerprint = self.get_fingerprint(dump_files)
+        if self.get_stored_fingerprint() == fingerprint:
+            l.info(f"Using RPSL store {self.path}")
+            return
+
+        start = time.time()
+        pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        build_path = f"{self.path}.build"
+        if os.path.exists(build_path):
+            os.remove(build_path)
+
+        connection = sqlite3.connect(build_path)
+        try:
+            counts = self.build(connection, dump_files, fingerprint)
+        finally:
+            connection.close()
+
+        # Readers of the old store keep their file until they are done.
+        os.replace(build_path, self.path)
+        if getattr(self._local, "connection", None) is not None:
+            self._local.connection.close()
+        self._local = threading.local()
+
+        l.info(f"Loaded {counts['routes']} route objects and {counts['as_sets']} as-sets from {len(dump_files)} RPSL dumps in {time.time() - start:.1f}s")
+
+    def build(self, connection, dump_files, fingerprint):
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        connection.execute("""
+            CREATE TABLE route_origins (
+                origin INTEGER NOT NULL,
+                ip_version INTEGER NOT NULL,
+                prefix TEXT NOT NULL,
+                PRIMARY KEY (origin, ip_version, prefix)
+            ) WITHOUT ROWID
+        """)
+        connection.execute("""
+            CREATE TABLE set_members (
+                set_name TEXT NOT NULL,
+                member TEXT NOT NULL,
+                PRIMARY KEY (set_name, member)
+            ) WITHOUT ROWID
+        """)
+        # aut-num objects can join an as-set by member-of, if the set accepts them by mbrs-by-ref.
+        connection.execute("CREATE TEMP TABLE member_of (asn INTEGER, set_name TEXT, mntner TEXT)")
+        connection.execute("CREATE TEMP TABLE mbrs_by_ref (set_name TEXT, mntner TEXT)")
+
+        counts = {"routes": 0, "as_sets": 0}
+        rows = {"route_origins": [], "set_members": [], "member_of": [], "mbrs_by_ref": []}
+        statements = {
+            "route_origins": "INSERT OR IGNORE INTO route_origins VALUES (?, ?, ?)",
+            "set_members": "INSERT OR IGNORE INTO set_members VALUES (?, ?)",
+            "member_of": "INSERT INTO member_of VALUES (?, ?, ?)",
+            "mbrs_by_ref": "INSERT INTO mbrs_by_ref VALUES (?, ?)",
+        }
+
+        def flush(table):
+            connection.executemany(statements[table], rows[table])
+            rows[table].clear()
+
+        def add(table, row):
+            rows[table].append(row)
+            if len(rows[table]) >= INSERT_CHUNK_SIZE:
+                flush(table)
+
+        for dump_file in dump_files:
+            with open_dump(dump_file) as lines:
+                for object_class, attributes in parse_rpsl_objects(lines):
+                    match object_class:
+                        case "route" | "route6":
+                            origin = parse_asn(attributes.get("origin", [""])[0])
+                            if origin is None:
+                                continue
+                            ip_version = 4 if object_class == "route" else 6
+                            add("route_origins", (origin, ip_version, attributes[object_class][0]))
+                            counts["routes"] += 1
+                        case "as-set":
+                            set_name = attributes["as-set"][0].upper()
+                            for member in split_values(attributes.get("members", [])):
+                                add("set_members", (set_name, member.upper()))
+                            for mntner in split_values(attributes.get("mbrs-by-ref", [])):
+                                add("mbrs_by_ref", (set_name, mntner.upper()))
+                            counts["as_sets"] += 1
+                        case "aut-num":
+                            asn = parse_asn(attributes["aut-num"][0])
+                            if asn is None:
+                                continue
+                            mntners = split_values(attributes.get("mnt-by", []))
+                            for set_name in split_values(attributes.get("member-of", [])):
+                                for mntner in mntners:
+                                    add("member_of", (asn, set_name.upper(), mntner.upper()))
+
+        for table in rows:
+            flush(table)
+
+        connection.execute("""
+            INSERT OR IGNORE INTO set_members
+            SELECT member_of.set_name, 'AS' || member_of.asn FROM member_of
+            JOIN mbrs_by_ref ON mbrs_by_ref.set_name = member_of.set_name
+            AND mbrs_by_ref.mntner IN ('ANY', member_of.mntner)
+        """)
+        connection.execute("INSERT INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        connection.commit()
+
+        return counts
+
+    def get_direct_members(self, set_names):
+        members = {set_name: [] for set_name in set_names}
+        set_names = list(members)
+
+        for start in range(0, len(set_names), QUERY_CHUNK_SIZE):
+            chunk = set_names[start:start + QUERY_CHUNK_SIZE]
+            rows = self.connection.execute(
+                f"SELECT set_name, member FROM set_members WHERE set_name IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for set_name, member in rows:
+                members[set_name].append(member)
+
+        return members
+
+    def get_recursive_asns(self, set_name, depth=None):
+        set_name = set_name.upper()
+        asn = parse_asn(set_name)
+        if asn is not None:
+            return {asn}
+
+        asns = set()
+        seen = {set_name}
+        level = [set_name]
+
+        level_count = 0
+        while level and (depth is None or level_count < depth):
+            level_count += 1
+            next_level = []
+            for members in self.get_direct_members(level).values():
+                for member in members:
+                    asn = parse_asn(member)
+                    if asn is not None:
+                        asns.add(asn)
+                    elif member not in seen:
+                        seen.add(member)
+                        next_level.append(member)
+            level = next_level
+
+        return asns
+
+    def get_prefixes(self, asns):
+        prefixes = {4: [], 6: []}
+        asns = list(asns)
+
+        for start in range(0, len(asns), QUERY_CHUNK_SIZE):
+            chunk = asns[start:start + QUERY_CHUNK_SIZE]
+            rows = self.connection.execute(
+                f"SELECT ip_version, prefix FROM route_origins WHERE origin IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for ip_version, prefix in rows:
+                prefixes[ip_version].append(prefix)
+
+        return {"v4": prefixes[4], "v6": prefixes[6]}
@@ -0,0 +1,34 @@
+import pathlib
+import sqlite3
+import threading
+
+
+class SqliteDatabase:
+
+    # Base of the sqlite backed stores, which are used from several threads at once.
+    # sqlite connections must not be shared between threads, so every thread opens its own.
+
+    def __init__(self, path, read_only=False):
+        self.path = str(path)
+        self.read_only = read_only
+        self._local = threading.local()
+
+        if not read_only:
+            pathlib.Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+    def connect(self):
+        if self.read_only:
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.connect()
+            self._local.connection = connection
+        return connection
@@ -2,7 +2,7 @@ import pytest
 
 from wanda.as_filter.as_filter import ASFilter
 from wanda.autonomous_system.autonomous_system import AutonomousSystem
-from wanda.irrd_client import IRRDClient
+from wanda.irrd_client import IRRDClient, PrefetchedIRRData
 
 
 def get_asfilter(**kwargs):
@@ -85,4 +85,43 @@ class TestASFilter:
 
         else:
             assert "v4_prefixes" not in filter_content
-            assert "v6_prefixes" not in filter_content
\ No newline at end of file
+            assert "v6_prefixes" not in filter_content
+
+    def test_prefetched_irr_data(self):
+        irrd_data = PrefetchedIRRData(
+            prefix_lists={"AS-WOBCOM": (set(WOBCOM_PREFIX_LIST_MOCK_V4), set(WOBCOM_PREFIX_LIST_MOCK_V6))},
+            aspath_access_lists={"AS-WOBCOM": [9136, 208395]},
+        )
+        autos = AutonomousSystem(
+            asn=9136,
+            name="WOBCOM",
+            irr_as_set="AS-WOBCOM"
+        )
+
+        filter_content = ASFilter(irrd_data, autos).get_filter_lists(enable_extended_filters=True)
+
+        assert filter_content["origin_asns"] == [9136, 208395]
+        assert filter_content["v4_prefixes"] == WOBCOM_PREFIX_LIST_MOCK_V4
+        assert filter_content["v6_prefixes"] == WOBCOM_PREFIX_LIST_MOCK_V6
+
+    @pytest.mark.parametrize(
+        "prefix_aggregation,expected_filters",
+        [
+            ("collapse", {"v4_prefixes": ["203.0.112.0/24", "203.0.113.0/24"], "v6_prefixes": ["2001:db8::/32"]}),
+            ("ranges", {"v4_route_filters": ["203.0.112.0/23 prefix-length-range /24-/32"], "v6_route_filters": ["2001:db8::/32 orlonger"]}),
+        ]
+    )
+    def test_prefix_aggregation(self, prefix_aggregation, expected_filters):
+        irrd_data = PrefetchedIRRData(
+            prefix_lists={"AS-WOBCOM": ({"203.0.113.0/24", "203.0.112.0/24", "203.0.113.128/25"}, {"2001:db8::/32", "2001:db8:1::/48"})},
+            aspath_access_lists={"AS-WOBCOM": [9136]},
+        )
+        autos = AutonomousSystem(
+            asn=9136,
+            name="WOBCOM",
+            irr_as_set="AS-WOBCOM"
+        )
+
+        filter_content = ASFilter(irrd_data, autos).get_filter_lists(enable_extended_filters=True, prefix_aggregation=prefix_aggregation)
+
+        assert filter_content == {"origin_asns": [9136], **expected_filters}
@@ -0,0 +1,56 @@
+import pytest
+
+from wanda.as_set_graph.as_set_graph import ASSetGraph
+
+
+def build_graph(direct_members):
+    graph = ASSetGraph()
+    for set_name, members in direct_members.items():
+        graph.add_members(set_name, members)
+    graph.expand()
+    return graph
+
+
+@pytest.mark.unit
+class TestASSetGraph:
+
+    def test_nested_sets(self):
+        graph = build_graph({
+            "AS-WOBCOM": ["AS9136", "AS-WOBCOM-DOWNSTREAM"],
+            "AS-WOBCOM-DOWNSTREAM": ["AS208395", "AS-TRANSIT-CONE"],
+            "AS-CUSTOMER": ["AS64500", "AS-TRANSIT-CONE"],
+            "AS-TRANSIT-CONE": ["AS64501", "AS64502"],
+        })
+
+        assert graph.get_origin_asns("AS-WOBCOM") == {9136, 208395, 64501, 64502}
+        assert graph.get_origin_asns("AS-CUSTOMER") == {64500, 64501, 64502}
+        assert graph.get_height("AS-WOBCOM") == 3
+        assert graph.get_height("AS-TRANSIT-CONE") == 1
+        assert graph.cycles == []
+
+    def test_loops(self):
+        graph = build_graph({
+            "AS-A": ["AS1", "AS-B"],
+            "AS-B": ["AS2", "AS-C"],
+            "AS-C": ["AS3", "AS-A", "AS-LEAF"],
+            "AS-LEAF": ["AS4"],
+            "AS-SELF": ["AS5", "AS-SELF"],
+        })
+
+        for set_name in ["AS-A", "AS-B", "AS-C"]:
+            assert graph.get_origin_asns(set_name) == {1, 2, 3, 4}
+        assert graph.get_origin_asns("AS-SELF") == {5}
+        assert sorted(graph.cycles) == [["AS-A", "AS-B", "AS-C"], ["AS-SELF"]]
+
+    def test_unknown_sets(self):
+        graph = ASSetGraph()
+        graph.add_members("AS-WOBCOM", ["AS9136", "AS-WOBCOM-DOWNSTREAM", "AS-OTHER"])
+        graph.add_members("AS-OTHER", ["AS-WOBCOM-DOWNSTREAM"])
+
+        assert graph.get_unknown_sets() == ["AS-WOBCOM-DOWNSTREAM"]
+
+    def test_deep_nesting(self):
+        graph = build_graph({f"AS-LEVEL{i}": [f"AS{i}", f"AS-LEVEL{i + 1}"] for i in range(12)} | {"AS-LEVEL12": ["AS12"]})
+
+        assert graph.get_height("AS-LEVEL0") == 13
+        assert graph.get_origin_asns("AS-LEVEL0") == set(range(13))
@@ -0,0 +1,124 @@
+import asyncio
+import re
+import threading
+import time
+
+import pytest
+
+from wanda.async_irrd_client import AsyncIRRDClient
+from wanda.irrd_cache import IRRDCache
+from wanda.irrd_client import IRRDClient
+
+
+class ConcurrencyProbe:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    def generate_prefix_lists_bulk(self, irr_names):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        time.sleep(0.02)
+
+        with self.lock:
+            self.in_flight -= 1
+
+        return {irr_name: ({f"{irr_name}-v4"}, {f"{irr_name}-v6"}) for irr_name in irr_names}
+
+
+@pytest.mark.unit
+class TestAsyncIRRDClient:
+
+    @pytest.mark.parametrize(
+        "max_in_flight,batch_size,n_sets,expected_calls",
+        [
+            (1, 1, 5, 5),
+            (3, 2, 20, 10),
+            (8, 50, 120, 3),
+        ]
+    )
+    def test_bounded_in_flight(self, mocker, max_in_flight, batch_size, n_sets, expected_calls):
+        irrd_client = IRRDClient(
+            irrd_url="rr.example.com",
+            batch_size=batch_size,
+        )
+        probe = ConcurrencyProbe()
+        mocker.patch.object(irrd_client, 'generate_prefix_lists_bulk', side_effect=probe.generate_prefix_lists_bulk)
+
+        async_irrd_client = AsyncIRRDClient(irrd_client, max_in_flight=max_in_flight)
+        irr_names = [f"AS-SET{i}" for i in range(n_sets)]
+
+        try:
+            prefix_lists = asyncio.run(async_irrd_client.generate_prefix_lists_bulk(irr_names + irr_names[:3]))
+        finally:
+            async_irrd_client.close()
+
+        assert probe.calls == expected_calls
+        assert probe.max_in_flight <= max_in_flight
+        assert set(prefix_lists.keys()) == set(irr_names)
+        assert prefix_lists["AS-SET1"] == ({"AS-SET1-v4"}, {"AS-SET1-v6"})
+
+    def test_failed_batches_are_retried(self, mocker):
+        irrd_client = IRRDClient(irrd_url="rr.example.com", batch_size=4)
+        async_irrd_client = AsyncIRRDClient(irrd_client, max_in_flight=4, max_attempts=3)
+        calls = []
+
+        def generate_prefix_lists_bulk(irr_names):
+            calls.append((list(irr_names), async_irrd_client.limiter.limit))
+            if len(calls) == 1:
+                raise Exception("IRRD unavailable")
+            return {irr_name: ({f"{irr_name}-v4"}, set()) for irr_name in irr_names}
+
+        mocker.patch.object(irrd_client, 'generate_prefix_lists_bulk', side_effect=generate_prefix_lists_bulk)
+        irr_names = [f"AS-SET{i}" for i in range(4)]
+
+        try:
+            prefix_lists = asyncio.run(async_irrd_client.generate_prefix_lists_bulk(irr_names))
+        finally:
+            async_irrd_client.close()
+
+        assert set(prefix_lists.keys()) == set(irr_names)
+        # Both halves of the failed batch are retried under the reduced in-flight limit.
+        assert len(calls) == 3
+        assert sorted(sorted(keys) for keys, _ in calls[1:]) == [["AS-SET0", "AS-SET1"], ["AS-SET2", "AS-SET3"]]
+        assert calls[1][1] == 2
+
+    def test_failing_batch_gives_up(self, mocker):
+        irrd_client = IRRDClient(irrd_url="rr.example.com", batch_size=4)
+        bulk_mock = mocker.patch.object(irrd_client, 'generate_prefix_lists_bulk', side_effect=Exception("IRRD unavailable"))
+        async_irrd_client = AsyncIRRDClient(irrd_client, max_in_flight=4, max_attempts=2)
+
+        try:
+            with pytest.raises(Exception, match="IRRD unavailable"):
+                asyncio.run(async_irrd_client.generate_prefix_lists_bulk(["AS-SET1", "AS-SET2"]))
+        finally:
+            async_irrd_client.close()
+
+        # The batch and both of its halves.
+        assert bulk_mock.call_count == 3
+
+    def test_set_dependencies_are_rate_limited(self, mocker, tmp_path):
+        direct_members = {"AS-SET1": ["AS64500", "AS-SET2"], "AS-SET2": ["AS-SET3"], "AS-SET3": ["AS64501"]}
+        irrd_client = IRRDClient(irrd_url="rr.example.com", cache=IRRDCache(tmp_path / "irrd.sqlite3"), incremental=True)
+        fetch_mock = mocker.patch.object(irrd_client, 'fetch_graphql_data', side_effect=lambda query: {
+            alias: [{"members": direct_members[irr_name]}]
+            for alias, irr_name in re.findall(r'(q\d+): recursiveSetMembers\(setNames: \["([^"]+)"\], depth: 1\)', query)
+        })
+        async_irrd_client = AsyncIRRDClient(irrd_client)
+        acquire = mocker.spy(async_irrd_client.rate_limiter, 'acquire')
+
+        try:
+            asyncio.run(async_irrd_client.cache_set_dependencies(["AS-SET1"]))
+        finally:
+            async_irrd_client.close()
+
+        # Every nesting level is a request of its own, each one passes the rate limiter and is costed.
+        assert fetch_mock.call_count == 3
+        assert acquire.call_count == 3
+        assert irrd_client.get_cache_key("directSetMembers", "AS-SET3") in async_irrd_client.costs.costs
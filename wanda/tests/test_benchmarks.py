@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from wanda.benchmarks.__main__ import compare_results, run_benchmarks
+from wanda.benchmarks.peeringmanager_server import PeeringManagerServer
+from wanda.benchmarks.synthetic_data import SyntheticDataset
+from wanda.peeringmanager_client import PeeringManagerClient
+
+
+@pytest.mark.unit
+class TestBenchmarks:
+
+    def test_dataset_is_deterministic(self, tmp_path):
+        fingerprint = SyntheticDataset("tiny", 1).write(os.path.join(tmp_path, "first"))
+        assert SyntheticDataset("tiny", 1).write(os.path.join(tmp_path, "second")) == fingerprint
+        assert SyntheticDataset("tiny", 2).write(os.path.join(tmp_path, "third")) != fingerprint
+
+    def test_dataset_summary(self):
+        dataset = SyntheticDataset("tiny", 1)
+        summary = dataset.get_summary()
+        lists = dataset.get_lists()
+
+        assert len(lists["/api/devices/routers/"]) == summary["routers"]
+        assert len(lists["/api/peering/internet-exchange-peering-sessions/"]) == summary["ix_sessions"]
+        assert len(lists["/api/peering/direct-peering-sessions/"]) == summary["direct_sessions"]
+        assert 0 < summary["customers"] < summary["autonomous_systems"]
+
+    def test_unknown_scale(self):
+        with pytest.raises(Exception):
+            SyntheticDataset("huge", 1)
+
+    def test_peeringmanager_server_pagination(self):
+        dataset = SyntheticDataset("tiny", 1)
+        with PeeringManagerServer(dataset.get_lists()) as peeringmanager_server:
+            peering_manager_instance = PeeringManagerClient(peeringmanager_server.url, "benchmark", page_size=7)
+            ix_peerings = peering_manager_instance.get_internet_exchange_peerings()
+
+            assert ix_peerings == dataset.ix_sessions
+            assert peeringmanager_server.requests == -(-len(ix_peerings) // 7)
+
+    def test_run_benchmarks(self, tmp_path):
+        cwd = os.getcwd()
+        results = run_benchmarks("tiny", cases=["bgp", "irr_index"], work_dir=str(tmp_path), jobs=1, isolated=False)
+
+        assert os.getcwd() == cwd
+        assert list(results["cases"]) == ["irr_index", "bgp"]
+        assert results["cases"]["bgp"]["return_code"] == 0
+        assert results["cases"]["bgp"]["peeringmanager_requests"] > 0
+
+        rows = compare_results(results, results)
+        assert rows and all(ratio in (1.0, None) for _, _, _, _, ratio in rows)
+
+    def test_unknown_case(self, tmp_path):
+        with pytest.raises(Exception):
+            run_benchmarks("tiny", cases=["unknown"], work_dir=str(tmp_path), isolated=False)
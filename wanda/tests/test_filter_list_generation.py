@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from wanda.async_irrd_client import AsyncIRRDClient
+from wanda.autonomous_system.autonomous_system import AutonomousSystem
+from wanda.filter_list_generation import (
+    generate_filter_lists, generate_filter_lists_locally, main_customer_filter_lists, plan_irr_work_items,
+)
+from wanda.irrd_client import IRRDClient, QUERY_AS_SET_PREFIXES, QUERY_ASN_PREFIXES, QUERY_SET_MEMBERS
+
+AUTONOMOUS_SYSTEMS = [
+    AutonomousSystem(asn=9136, name="WOBCOM", irr_as_set="AS-WOBCOM"),
+    AutonomousSystem(asn=64500, name="WOBCOM Reseller", irr_as_set="AS-WOBCOM AS-RESELLER"),
+    AutonomousSystem(asn=64501, name="Sibling", irr_as_set="RIPE::AS-WOBCOM"),
+    AutonomousSystem(asn=208395, name="WDZ", irr_as_set=""),
+]
+
+
+class ProgressCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def update(self, n=1):
+        self.count += n
+
+
+@pytest.mark.unit
+class TestFilterListGeneration:
+
+    def test_plan_irr_work_items(self):
+        work_items, requested_count = plan_irr_work_items(AUTONOMOUS_SYSTEMS)
+
+        assert requested_count == 8
+        assert work_items[QUERY_AS_SET_PREFIXES] == {
+            "AS-WOBCOM": {9136, 64500, 64501},
+            "AS-RESELLER": {64500},
+        }
+        assert work_items[QUERY_SET_MEMBERS] == {"AS-WOBCOM": {9136, 64500, 64501}}
+        assert work_items[QUERY_ASN_PREFIXES] == {208395: {208395}}
+
+    def test_generate_filter_lists(self, mocker):
+        irrd_client = IRRDClient(
+            irrd_url="rr.example.com",
+            batch_size=1,
+        )
+        prefix_mock = mocker.patch.object(irrd_client, 'generate_prefix_lists_bulk', side_effect=lambda irr_names: {
+            irr_name: ({f"192.0.2.{index}/32"}, set()) for index, irr_name in enumerate(irr_names)
+        })
+        asn_mock = mocker.patch.object(irrd_client, 'generate_prefix_lists_for_asns_bulk', return_value={208395: ({"198.51.100.0/24"}, set())})
+        members_mock = mocker.patch.object(irrd_client, 'generate_input_aspath_access_lists_bulk', return_value={"AS-WOBCOM": [9136, 64500]})
+
+        async_irrd_client = AsyncIRRDClient(irrd_client)
+        progress = ProgressCounter()
+        try:
+            filter_lists = asyncio.run(generate_filter_lists(async_irrd_client, AUTONOMOUS_SYSTEMS, {9136}, progress))
+        finally:
+            async_irrd_client.close()
+
+        assert prefix_mock.call_count == 2
+        assert asn_mock.call_count == 1
+        assert members_mock.call_count == 1
+        assert progress.count == 4
+        assert filter_lists[9136] == {"origin_asns": [9136, 64500], "v4_prefixes": ["192.0.2.0/32"], "v6_prefixes": []}
+        assert filter_lists[64500]["v4_prefixes"] == ["192.0.2.0/32"]
+        assert filter_lists[208395] == {"origin_asns": [208395], "v4_prefixes": ["198.51.100.0/24"], "v6_prefixes": []}
+
+    def test_generate_filter_lists_locally(self, mocker):
+        irrd_client = IRRDClient(
+            irrd_url="rr.example.com",
+        )
+        members_mock = mocker.patch.object(irrd_client, 'get_direct_set_members_bulk', side_effect=lambda irr_names: {
+            irr_name: {
+                "AS-WOBCOM": ["AS9136", "AS-RESELLER"],
+                "AS-RESELLER": ["AS64500", "AS-WOBCOM"],
+            }[irr_name] for irr_name in irr_names
+        })
+        asn_mock = mocker.patch.object(irrd_client, 'generate_prefix_lists_for_asns_bulk', side_effect=lambda asns: {
+            asn: ({f"192.0.2.{index}/32"}, set()) for index, asn in enumerate(sorted(asns))
+        })
+
+        async_irrd_client = AsyncIRRDClient(irrd_client)
+        progress = ProgressCounter()
+        try:
+            filter_lists = asyncio.run(generate_filter_lists_locally(async_irrd_client, AUTONOMOUS_SYSTEMS, {9136}, progress))
+        finally:
+            async_irrd_client.close()
+
+        assert members_mock.call_count == 1
+        assert asn_mock.call_count == 1
+        assert progress.count == 4
+        assert filter_lists[9136] == {"origin_asns": [9136, 64500], "v4_prefixes": ["192.0.2.0/32", "192.0.2.1/32"], "v6_prefixes": []}
+        assert filter_lists[64501] == filter_lists[9136]
+        assert filter_lists[208395]["v4_prefixes"] == ["192.0.2.2/32"]
+
+    def test_unknown_mode(self, mocker):
+        peering_manager_instance = mocker.Mock()
+        irrd_client = mocker.Mock()
+
+        assert main_customer_filter_lists(mocker.Mock(), peering_manager_instance, irrd_client, {"mode": "junoss"}) == 1
+        # Nothing is fetched for a configuration that cannot be generated.
+        assert peering_manager_instance.method_calls == []
+        assert irrd_client.method_calls == []
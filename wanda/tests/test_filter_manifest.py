@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.filter_manifest import FilterGroupsFile, get_manifest_path, read_manifest, write_manifest
+from wanda.output_emitter import dump_yaml, load_yaml
+from wanda.output_state import get_input_hash
+
+FILTER_LISTS = {
+    "AS64500": {"origin_asns": [64500], "v4_prefixes": PrefixSet.from_prefixes(["192.0.2.0/24"], 4)},
+    "AS64501": {"origin_asns": [64501], "v4_prefixes": PrefixSet(4)},
+}
+FILTER_HASHES = {name: get_input_hash(filter_list) for name, filter_list in FILTER_LISTS.items()}
+
+
+@pytest.mark.unit
+class TestFilterManifest:
+
+    @pytest.fixture
+    def filter_file(self, tmp_path):
+        filter_file = str(tmp_path / "filter_groups-edge1.example.net.yml")
+        with open(filter_file, "w") as output_file:
+            output_file.write(dump_yaml(FILTER_LISTS))
+        return filter_file
+
+    def test_manifest(self, filter_file, mocker):
+        write_manifest(filter_file, FILTER_HASHES)
+        manifest = read_manifest(filter_file)
+
+        assert manifest["filter_groups"] == FILTER_HASHES
+        assert "filter_files" not in manifest
+
+        parse = mocker.Mock()
+        filter_groups_file = FilterGroupsFile(filter_file, parse)
+
+        assert filter_groups_file.get_filter_groups() == {"AS64500": None, "AS64501": None}
+        assert filter_groups_file.file_hash == manifest["filter_file_hash"]
+        assert filter_groups_file.content is None
+        parse.assert_not_called()
+
+    def test_touched_file(self, filter_file, mocker):
+        write_manifest(filter_file, FILTER_HASHES)
+        generated_at = read_manifest(filter_file)["generated_at"]
+        os.utime(filter_file, ns=(0, 0))
+
+        parse = mocker.Mock()
+        assert FilterGroupsFile(filter_file, parse).get_filter_groups() == {"AS64500": None, "AS64501": None}
+        parse.assert_not_called()
+
+        # The manifest follows the file, but keeps its generation time while the content stays the same.
+        write_manifest(filter_file, FILTER_HASHES)
+        assert read_manifest(filter_file)["filter_file_stat"][1] == 0
+        assert read_manifest(filter_file)["generated_at"] == generated_at
+
+    def test_changed_file(self, filter_file):
+        write_manifest(filter_file, FILTER_HASHES)
+        with open(filter_file, "w") as output_file:
+            output_file.write(dump_yaml({"AS64502": {"origin_asns": [64502]}}))
+
+        assert FilterGroupsFile(filter_file, load_yaml).get_filter_groups() == {"AS64502": None}
+
+    def test_missing_manifest(self, filter_file, tmp_path):
+        assert FilterGroupsFile(filter_file, load_yaml).get_filter_groups() == {"AS64500": None, "AS64501": None}
+
+        with open(get_manifest_path(filter_file), "w") as manifest_file:
+            manifest_file.write("{")
+        assert read_manifest(filter_file) is None
+
+        json_file = str(tmp_path / "generated-wanda-filters.json")
+        with open(json_file, "w") as output_file:
+            output_file.write("{}")
+        assert FilterGroupsFile(json_file, json.loads).get_filter_groups() == {}
+
+    def test_missing_filter_file(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            FilterGroupsFile(str(tmp_path / "missing.yml"), load_yaml)
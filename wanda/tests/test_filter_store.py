@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.bgp_device_group.bgp_device_group import BGPDeviceGroup
+from wanda.bgp_dg_generation import check_for_consistency
+from wanda.filter_store import FilterStore, write_filter_file
+from wanda.output_emitter import load_yaml
+from wanda.output_state import get_input_hash
+
+FILTER_LIST = {"origin_asns": [64500], "v4_prefixes": PrefixSet.from_prefixes(["192.0.2.0/24"], 4)}
+FILTER_HASH = get_input_hash(FILTER_LIST)
+
+
+@pytest.mark.unit
+class TestFilterStore:
+
+    def test_add(self, tmp_path):
+        filter_store = FilterStore(str(tmp_path / "generated_filters"), "junos")
+        path = filter_store.add(FILTER_HASH, FILTER_LIST)
+
+        assert path == os.path.join(str(tmp_path), "generated_filters", f"{FILTER_HASH}.yml")
+        assert filter_store.pending == {FILTER_HASH: FILTER_LIST}
+
+        for filter_hash in filter_store.pending:
+            write_filter_file(filter_store, filter_hash)
+        with open(path, "r") as filter_file:
+            assert load_yaml(filter_file.read()) == {"origin_asns": [64500], "v4_prefixes": ["192.0.2.0/24"]}
+
+        # Files are named after their content, so they are written only once.
+        filter_store = FilterStore(str(tmp_path / "generated_filters"), "junos")
+        assert filter_store.add(FILTER_HASH, FILTER_LIST) == path
+        assert filter_store.pending == {}
+
+    def test_prune(self, tmp_path):
+        store_dir = tmp_path / "generated_filters"
+        FilterStore(str(store_dir), "rtbrick").write("0" * 64, {"origin_asns": [64501]})
+        (store_dir / "README").write_text("keep")
+
+        filter_store = FilterStore(str(store_dir), "rtbrick")
+        filter_store.add(FILTER_HASH, FILTER_LIST)
+        filter_store.write(FILTER_HASH, FILTER_LIST)
+        filter_store.prune()
+
+        assert sorted(os.listdir(store_dir)) == sorted(["README", f"{FILTER_HASH}.json"])
+
+    def test_consistency(self, tmp_path):
+        bgp_device_group = BGPDeviceGroup(name="CUSTOMER_EXAMPLE_V4", asn=64500, ip_version=4, max_prefixes=10, policy_type="customer")
+        filter_store = FilterStore(str(tmp_path), "junos")
+        path = filter_store.add(FILTER_HASH, FILTER_LIST)
+        filter_store.write(FILTER_HASH, FILTER_LIST)
+
+        assert check_for_consistency([bgp_device_group], {"AS64500": None})
+        assert check_for_consistency([bgp_device_group], {"AS64500": path})
+        assert not check_for_consistency([bgp_device_group], {"AS64501": None})
+
+        os.remove(path)
+        assert not check_for_consistency([bgp_device_group], {"AS64500": path})
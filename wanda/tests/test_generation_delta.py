@@ -0,0 +1,116 @@
+import json
+import os
+
+import pytest
+
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.bgp_device_group.bgp_device_group import BGPDeviceGroup
+from wanda.generation_delta import DeltaState, diff_sorted, get_bgp_groups_snapshot
+from wanda.output_state import get_input_hash
+
+
+def get_filter_groups(filter_lists):
+    return filter_lists, {name: get_input_hash(filter_list) for name, filter_list in filter_lists.items()}
+
+
+def read_delta(delta_dir, hostname):
+    with open(os.path.join(delta_dir, f"{hostname}.json"), "r") as delta_file:
+        return json.load(delta_file)
+
+
+def get_bgp_device_group(neighbors, authentication_key=None):
+    bgp_device_group = BGPDeviceGroup(name="CUSTOMER_EXAMPLE_V4", asn=64500, ip_version=4, max_prefixes=10,
+                                      policy_type="customer", authentication_key=authentication_key)
+    for neighbor in neighbors:
+        bgp_device_group.append_neighbor(neighbor, "192.0.2.254")
+    return bgp_device_group
+
+
+@pytest.mark.unit
+class TestGenerationDelta:
+
+    def test_diff_sorted(self):
+        assert diff_sorted([1, 3, 5, 7], [2, 3, 7, 8, 9]) == ([2, 8, 9], [1, 5])
+        assert diff_sorted([], [1]) == ([1], [])
+        assert diff_sorted(iter([1, 2]), []) == ([], [1, 2])
+
+    def test_filter_groups(self, tmp_path):
+        delta_dir = str(tmp_path)
+        delta_state = DeltaState(delta_dir)
+        delta_state.add_filter_groups("edge1.example.net", *get_filter_groups({
+            "AS64500": {"origin_asns": [64500], "v4_prefixes": PrefixSet.from_prefixes(["192.0.2.0/24", "198.51.100.0/24"], 4)},
+            "AS64501": {"origin_asns": [64501]},
+        }))
+        delta_state.save()
+
+        # Without a previous generation, everything is added.
+        delta = read_delta(delta_dir, "edge1.example.net")
+        assert delta["filter_groups"]["AS64500"] == {
+            "status": "added",
+            "origin_asns": {"added": [64500], "removed": []},
+            "v4_prefixes": {"added": ["192.0.2.0/24", "198.51.100.0/24"], "removed": []},
+        }
+        assert delta["summary"]["prefixes_added"] == 2
+        assert not delta["empty"]
+
+        delta_state = DeltaState(delta_dir)
+        delta_state.add_filter_groups("edge1.example.net", *get_filter_groups({
+            "AS64500": {"origin_asns": [64500], "v4_prefixes": PrefixSet.from_prefixes(["192.0.2.0/24", "203.0.113.0/24"], 4)},
+        }))
+        delta_state.save()
+
+        delta = read_delta(delta_dir, "edge1.example.net")
+        assert delta["filter_groups"] == {
+            "AS64500": {"status": "changed", "v4_prefixes": {"added": ["203.0.113.0/24"], "removed": ["198.51.100.0/24"]}},
+            "AS64501": {"status": "removed", "origin_asns": {"added": [], "removed": [64501]}},
+        }
+        assert delta["summary"]["prefixes_added"] == 1
+        assert delta["summary"]["prefixes_removed"] == 1
+        assert delta["summary"]["filter_groups_removed"] == 1
+
+    def test_unchanged_router(self, tmp_path):
+        delta_dir = str(tmp_path)
+        filter_groups = get_filter_groups({"AS64500": {"origin_asns": [64500]}})
+        for _ in range(2):
+            delta_state = DeltaState(delta_dir)
+            delta_state.add_filter_groups("edge1.example.net", *filter_groups)
+            delta_state.add_filter_groups("edge2.example.net", *filter_groups)
+            delta_state.save()
+
+        assert read_delta(delta_dir, "edge1.example.net")["empty"]
+
+        # Deltas of routers that were not generated again are removed.
+        delta_state = DeltaState(delta_dir)
+        delta_state.add_filter_groups("edge1.example.net", *filter_groups)
+        delta_state.save()
+        assert sorted(os.listdir(delta_dir)) == ["edge1.example.net.json", "generation.sqlite3"]
+
+    def test_bgp_groups(self, tmp_path):
+        delta_dir = str(tmp_path)
+        delta_state = DeltaState(delta_dir)
+        delta_state.add_bgp_groups("edge1.example.net", get_bgp_groups_snapshot([get_bgp_device_group(["192.0.2.1", "192.0.2.2"])]))
+        delta_state.save()
+
+        bgp_device_group = get_bgp_device_group(["192.0.2.2", "192.0.2.3"], authentication_key="secret")
+        bgp_device_group.import_routing_policies = [{"name": "PREFER_LOCAL", "weight": 0}]
+
+        delta_state = DeltaState(delta_dir)
+        delta_state.add_bgp_groups("edge1.example.net", get_bgp_groups_snapshot([bgp_device_group]))
+        delta_state.save()
+
+        delta = read_delta(delta_dir, "edge1.example.net")["bgp_groups"]["CUSTOMER_EXAMPLE_V4"]
+        assert delta["status"] == "changed"
+        assert delta["neighbors"] == {"added": ["192.0.2.3"], "removed": ["192.0.2.1"]}
+        assert delta["import"]["added"] == ["PREFER_LOCAL"]
+        assert delta["import"]["chain"] == bgp_device_group.get_import_policies()
+        assert delta["authentication_key"] == {"changed": True}
+        assert "secret" not in json.dumps(delta)
+
+    def test_disabled(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        delta_state = DeltaState()
+        delta_state.add_filter_groups("edge1.example.net", *get_filter_groups({"AS64500": {"origin_asns": [64500]}}))
+        delta_state.save()
+
+        assert delta_state.deltas == {}
+        assert os.listdir(tmp_path) == []
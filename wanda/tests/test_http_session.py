@@ -0,0 +1,77 @@
+import pickle
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wanda.http_session import PooledSession, RETRY_STATUS_CODES, create_session
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures_left = 0
+
+    def do_GET(self):
+        if KeepAliveHandler.failures_left > 0:
+            KeepAliveHandler.failures_left -= 1
+            status, body = 503, b'{}'
+        else:
+            status, body = 200, b'{"ok": true}'
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.mark.unit
+class TestHTTPSession:
+
+    @pytest.fixture
+    def server_url(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+        server.shutdown()
+        server.server_close()
+
+    def test_session_configuration(self):
+        session = create_session(pool_size=4, retries=2, backoff_factor=0.1)
+        adapter = session.get_adapter("https://rr.example.com/graphql/")
+
+        assert adapter._pool_maxsize == 4
+        assert adapter.max_retries.total == 2
+        assert adapter.max_retries.status_forcelist == RETRY_STATUS_CODES
+        assert "gzip" in session.headers["Accept-Encoding"]
+
+    def test_connection_reuse(self, server_url):
+        pooled_session = PooledSession()
+
+        for _ in range(5):
+            response = pooled_session.session.get(server_url)
+            assert response.json() == {"ok": True}
+
+        assert pooled_session.get_connection_stats() == {"new": 1, "reused": 4}
+
+    def test_retry_on_server_error(self, server_url):
+        KeepAliveHandler.failures_left = 2
+        pooled_session = PooledSession(retries=3, backoff_factor=0)
+
+        response = pooled_session.session.get(server_url)
+
+        assert response.status_code == 200
+        assert KeepAliveHandler.failures_left == 0
+
+    def test_pickle_drops_session(self, server_url):
+        pooled_session = PooledSession(pool_size=3)
+        pooled_session.session.get(server_url)
+
+        restored = pickle.loads(pickle.dumps(pooled_session))
+
+        assert restored.pool_size == 3
+        assert restored.get_connection_stats() == {"new": 0, "reused": 0}
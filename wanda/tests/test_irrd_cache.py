@@ -0,0 +1,161 @@
+import asyncio
+import re
+
+import pytest
+
+from wanda.async_irrd_client import AsyncIRRDClient
+from wanda.irrd_cache import IRRDCache
+from wanda.irrd_client import IRRDClient
+
+
+def fetch_graphql_data(query):
+    data = {}
+    for alias, key in re.findall(r'(q\d+)_v4: (?:asSetPrefixes|asnPrefixes)\((?:setNames|asns): \["([^"]+)"\]', query):
+        data[f"{alias}_v4"] = [{"prefixes": [f"192.0.2.0/24"]}]
+        data[f"{alias}_v6"] = [{"prefixes": [f"2001:db8::/32"]}]
+    return data
+
+
+@pytest.mark.unit
+class TestIRRDCache:
+
+    @pytest.fixture
+    def cache_path(self, tmp_path):
+        return tmp_path / "cache" / "irrd.sqlite3"
+
+    def test_cache_roundtrip(self, cache_path):
+        cache = IRRDCache(cache_path)
+        cache.set_many({"asSetPrefixes|AS-WOBCOM|ipVersion=4,6": {"v4": ["192.0.2.0/24"], "v6": []}})
+
+        assert cache.get_many(["asSetPrefixes|AS-WOBCOM|ipVersion=4,6", "asSetPrefixes|AS-FOO|ipVersion=4,6"]) == {
+            "asSetPrefixes|AS-WOBCOM|ipVersion=4,6": {"v4": ["192.0.2.0/24"], "v6": []}
+        }
+        assert cache.get_stats() == {"hits": 1, "misses": 1}
+
+    def test_cache_shared_between_instances(self, cache_path):
+        IRRDCache(cache_path).set_many({"recursiveSetMembers|AS-WOBCOM|depth=8": ["AS9136"]})
+
+        assert IRRDCache(cache_path).get_many(["recursiveSetMembers|AS-WOBCOM|depth=8"]) == {
+            "recursiveSetMembers|AS-WOBCOM|depth=8": ["AS9136"]
+        }
+
+    @pytest.mark.parametrize(
+        "ttl,refresh,expected_hits",
+        [
+            (3600, False, 1),
+            (-1, False, 0),
+            (3600, True, 0),
+        ]
+    )
+    def test_cache_expiry_and_refresh(self, cache_path, ttl, refresh, expected_hits):
+        IRRDCache(cache_path).set_many({"asnPrefixes|9136|ipVersion=4,6": {"v4": [], "v6": []}})
+
+        cache = IRRDCache(cache_path, ttl=ttl, refresh=refresh)
+        results = cache.get_many(["asnPrefixes|9136|ipVersion=4,6"])
+
+        assert len(results) == expected_hits
+        assert cache.get_stats() == {"hits": expected_hits, "misses": 1 - expected_hits}
+
+    def test_cache_eviction(self, cache_path):
+        cache = IRRDCache(cache_path, max_size_mb=0.0005)
+
+        for i in range(20):
+            cache.set_many({f"asSetPrefixes|AS-SET{i}|ipVersion=4,6": {"v4": [f"10.{i}.{j}.0/24" for j in range(30)], "v6": []}})
+
+        results = cache.get_many([f"asSetPrefixes|AS-SET{i}|ipVersion=4,6" for i in range(20)])
+
+        assert 0 < len(results) < 20
+        assert "asSetPrefixes|AS-SET19|ipVersion=4,6" in results
+
+    def test_client_uses_cache(self, mocker, cache_path):
+        irrd_client = IRRDClient(
+            irrd_url="rr.example.com",
+            cache=IRRDCache(cache_path),
+        )
+        fetch_mock = mocker.patch.object(irrd_client, 'fetch_graphql_data', side_effect=fetch_graphql_data)
+
+        first = irrd_client.generate_prefix_lists_bulk(["AS-WOBCOM", "AS-FOO"])
+        second = irrd_client.generate_prefix_lists_bulk(["AS-WOBCOM", "AS-FOO", "AS-BAR"])
+
+        assert fetch_mock.call_count == 2
+        assert "AS-FOO" not in fetch_mock.call_args.args[0]
+        assert first["AS-WOBCOM"] == second["AS-WOBCOM"] == ({"192.0.2.0/24"}, {"2001:db8::/32"})
+        assert irrd_client.get_cache_stats() == {"hits": 2, "misses": 3}
+
+    def test_cache_per_irrd_host(self, mocker, cache_path):
+        fetch_mocks = []
+        for irrd_url in ["rr.example.com", "rr.example.net", "rr.example.com"]:
+            irrd_client = IRRDClient(irrd_url=irrd_url, cache=IRRDCache(cache_path))
+            fetch_mocks.append(mocker.patch.object(irrd_client, 'fetch_graphql_data', side_effect=fetch_graphql_data))
+            irrd_client.generate_prefix_lists_bulk(["AS-WOBCOM"])
+
+        # Results of one IRRD instance are never used for another one.
+        assert [fetch_mock.call_count for fetch_mock in fetch_mocks] == [1, 1, 0]
+
+    def test_incremental_validation(self, mocker, cache_path):
+        # Like IRRD, the recursive members only contain the leaves, nested sets are only visible with depth 1.
+        direct_members = {"AS-WOBCOM": ["AS9136", "AS-WOBCOM-DOWNSTREAM"], "AS-WOBCOM-DOWNSTREAM": ["AS208395"], "AS-FOO": ["AS64500"]}
+        recursive_members = {"AS-WOBCOM": ["AS9136", "AS208395"], "AS-WOBCOM-DOWNSTREAM": ["AS208395"], "AS-FOO": ["AS64500"]}
+
+        def fetch_members(query):
+            data = {}
+            for alias, irr_name, depth in re.findall(r'(q\d+): recursiveSetMembers\(setNames: \["([^"]+)"\], depth: (\d+)\)', query):
+                data[alias] = [{"members": (direct_members if depth == "1" else recursive_members)[irr_name]}]
+            return data
+
+        def run(serials, journal):
+            irrd_client = IRRDClient(
+                irrd_url="rr.example.com",
+                cache=IRRDCache(cache_path, ttl=3600),
+                incremental=True,
+            )
+            mocker.patch.object(irrd_client, 'get_database_serials', return_value=serials)
+            mocker.patch.object(irrd_client, 'fetch_journal_changes', side_effect=lambda source, first, last: journal[source])
+            irrd_client.validate_cache()
+
+            fetch_mock = mocker.patch.object(
+                irrd_client,
+                'fetch_graphql_data',
+                side_effect=lambda query: {**fetch_graphql_data(query), **fetch_members(query)},
+            )
+            async_irrd_client = AsyncIRRDClient(irrd_client)
+
+            async def generate():
+                await async_irrd_client.generate_prefix_lists_bulk(["AS-WOBCOM", "AS-FOO"])
+                await async_irrd_client.cache_set_dependencies(["AS-WOBCOM", "AS-FOO"])
+                await async_irrd_client.generate_prefix_lists_for_asns_bulk([64501])
+
+            try:
+                asyncio.run(generate())
+            finally:
+                async_irrd_client.close()
+            return [call.args[0] for call in fetch_mock.call_args_list]
+
+        # Prefixes, the direct members of both nesting levels and the ASN prefixes.
+        assert len(run({"RIPE": 100, "ARIN": 5}, {})) == 4
+
+        # Nothing changed, everything is answered from the cache.
+        assert run({"RIPE": 100, "ARIN": 5}, {}) == []
+
+        # A route of a member of AS-WOBCOM changed, only AS-WOBCOM is expanded again.
+        queries = run({"RIPE": 102, "ARIN": 5}, {"RIPE": [(101, "AS208395"), (102, "AS-UNRELATED")]})
+        assert len(queries) == 1
+        assert "AS-WOBCOM" in queries[0] and "AS-FOO" not in queries[0]
+
+        # The members of the nested set changed, AS-WOBCOM and the nested set are fetched again.
+        queries = run({"RIPE": 103, "ARIN": 5}, {"RIPE": [(103, "AS-WOBCOM-DOWNSTREAM")]})
+        assert len(queries) == 2
+        assert 'asSetPrefixes(setNames: ["AS-WOBCOM"]' in queries[0]
+        assert 'recursiveSetMembers(setNames: ["AS-WOBCOM-DOWNSTREAM"], depth: 1)' in queries[1]
+        assert all("AS-FOO" not in query for query in queries)
+
+        # The journal is not available, the cache falls back to the TTL.
+        IRRDCache(cache_path).set_many({"asSetPrefixes|AS-FOO|ipVersion=4,6|rr.example.com": {"v4": [], "v6": []}})
+        assert run({"RIPE": 110, "ARIN": 5}, {}) == []
+
+    def test_changed_keys_without_serial(self):
+        irrd_client = IRRDClient(irrd_url="rr.example.com")
+
+        # A source without journal cannot be validated, even if its serial did not change.
+        assert irrd_client.get_changed_keys({"RADB": None}, {"RADB": None}, {}) is None
+        assert irrd_client.get_changed_keys({"RIPE": 5}, {"RIPE": 5}, {}) == set()
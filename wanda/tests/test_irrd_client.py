@@ -1,9 +1,11 @@
 import ipaddress
+import re
 from subprocess import CalledProcessError
 
 import pytest
 
-from wanda.irrd_client import IRRDClient
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.irrd_client import IRRDClient, parse_nrtm_changes
 
 WDZ_PREFIX_LIST_MOCK_V4 = [
     "198.51.100.0/24"
@@ -147,6 +149,29 @@ AS_PATH_WDZ = [
     "AS208395"
 ]
 
+NRTM_RESPONSE = """%START Version: 3 RIPE 4211-4213
+
+ADD 4211
+
+as-set:         AS-WOBCOM
+members:        AS9136, AS208395
+source:         RIPE
+
+DEL 4212
+
+route:          198.51.100.0/24
+origin:         AS208395
+source:         RIPE
+
+ADD 4213
+
+aut-num:        AS9136
+member-of:      AS-WOBCOM, AS-FOO
+source:         RIPE
+
+%END RIPE
+"""
+
 
 # We mock each response and threat this as a unit test since bgpq4 is considered stable.
 # We might test an additional integration test later on.
@@ -174,12 +199,12 @@ class TestIRRDClient:
         mocker.patch(
             'wanda.irrd_client.IRRDClient.fetch_graphql_data',
             return_value={
-                "v4": [
+                "q0_v4": [
                     {
                         "prefixes": prefix_list_v4
                     }
                 ],
-                "v6": [
+                "q0_v6": [
                     {
                         "prefixes": prefix_list_v6
                     }
@@ -188,6 +213,7 @@ class TestIRRDClient:
         )
 
         prefix_list_4, prefix_list_6 = irrd_instance.generate_prefix_lists(irr_name)
+        assert isinstance(prefix_list_4, PrefixSet) and isinstance(prefix_list_6, PrefixSet)
         assert len(prefix_list_4) == prefix_num_4
         assert len(prefix_list_6) == prefix_num_6
 
@@ -206,7 +232,7 @@ class TestIRRDClient:
         mocker.patch(
             'wanda.irrd_client.IRRDClient.fetch_graphql_data',
             return_value={
-                "recursiveSetMembers": [
+                "q0": [
                     {
                         "members": as_path_output
                     }
@@ -223,3 +249,73 @@ class TestIRRDClient:
     def test_invalid_bgpq4_prefix_lists(self, irrd_instance):
         with pytest.raises(Exception):
             irrd_instance.call_bgpq4_prefix_lists("AS-WOBCOM", 5)
+
+    @pytest.mark.parametrize(
+        "batch_size,irr_names,expected_requests",
+        [
+            (50, ["AS-WOBCOM", "AS208395"], 1),
+            (1, ["AS-WOBCOM", "AS208395"], 2),
+            (2, ["AS-WOBCOM", "AS208395", "AS-WOBCOM", "AS-FOO", "AS-BAR"], 2),
+        ]
+    )
+    def test_prefix_lists_bulk(self, mocker, batch_size, irr_names, expected_requests):
+        irrd_c = IRRDClient(
+            irrd_url="rr.example.com",
+            batch_size=batch_size,
+        )
+
+        def fetch_graphql_data(query):
+            aliases = re.findall(r'(q\d+)_v4: asSetPrefixes\(setNames: \["([^"]+)"\]', query)
+            data = {}
+            for alias, irr_name in aliases:
+                data[f"{alias}_v4"] = [{"prefixes": WOBCOM_PREFIX_LIST_MOCK_V4 if irr_name == "AS-WOBCOM" else WDZ_PREFIX_LIST_MOCK_V4}]
+                data[f"{alias}_v6"] = [{"prefixes": WOBCOM_PREFIX_LIST_MOCK_V6 if irr_name == "AS-WOBCOM" else WDZ_PREFIX_LIST_MOCK_V6}]
+            return data
+
+        fetch_mock = mocker.patch.object(irrd_c, 'fetch_graphql_data', side_effect=fetch_graphql_data)
+
+        prefix_lists = irrd_c.generate_prefix_lists_bulk(irr_names)
+
+        assert fetch_mock.call_count == expected_requests
+        assert set(prefix_lists.keys()) == set(irr_names)
+        assert prefix_lists["AS-WOBCOM"] == (set(WOBCOM_PREFIX_LIST_MOCK_V4), set(WOBCOM_PREFIX_LIST_MOCK_V6))
+        assert prefix_lists["AS208395"] == (set(WDZ_PREFIX_LIST_MOCK_V4), set(WDZ_PREFIX_LIST_MOCK_V6))
+
+    def test_input_as_path_access_lists_bulk(self, mocker, irrd_instance):
+        fetch_mock = mocker.patch(
+            'wanda.irrd_client.IRRDClient.fetch_graphql_data',
+            return_value={
+                "q0": [{"members": AS_PATH_WOBCOM}],
+                "q1": [{"members": AS_PATH_WDZ}],
+                "q2": [],
+            }
+        )
+
+        access_lists = irrd_instance.generate_input_aspath_access_lists_bulk(["AS-WOBCOM", "AS208395", "AS-EMPTY"])
+
+        assert fetch_mock.call_count == 1
+        assert 9136 in access_lists["AS-WOBCOM"]
+        assert access_lists["AS208395"] == [208395]
+        assert access_lists["AS-EMPTY"] == []
+
+    def test_query_keys_are_escaped(self, irrd_instance):
+        fields = irrd_instance.build_query_fields("asSetPrefixes", "q0", 'AS-FOO"], ipVersion: 4) { x } q1: x(setNames: ["AS-BAR')
+
+        assert fields.count("asSetPrefixes(") == 2
+        assert 'setNames: ["AS-FOO\\"], ipVersion: 4) { x } q1: x(setNames: [\\"AS-BAR"], ipVersion: 4)' in fields
+        assert 'asns: ["64501"]' in irrd_instance.build_query_fields("asnPrefixes", "q0", 64501)
+
+    def test_parse_nrtm_changes(self):
+        changes = parse_nrtm_changes(NRTM_RESPONSE.splitlines(keepends=True))
+
+        assert changes == [
+            (4211, "AS-WOBCOM"),
+            (4212, "AS208395"),
+            (4213, "AS9136"),
+            (4213, "AS-WOBCOM"),
+            (4213, "AS-FOO"),
+        ]
+
+    def test_parse_nrtm_error(self):
+        with pytest.raises(Exception):
+            parse_nrtm_changes(["%ERROR:401: Invalid range: serial(s) 1-2 don't exist\n"])
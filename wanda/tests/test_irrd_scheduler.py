@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from wanda.async_irrd_client import AsyncIRRDClient
+from wanda.irrd_client import IRRDClient
+from wanda.irrd_scheduler import AdaptiveLimiter, QueryCosts, RateLimiter, get_result_cost, plan_batches
+
+
+@pytest.mark.unit
+class TestIRRDScheduler:
+
+    @pytest.mark.parametrize(
+        "costs,batch_size,batch_cost_limit,expected",
+        [
+            ({"a": 1, "b": 1, "c": 1}, 2, 100, [(2, ["a", "b"]), (1, ["c"])]),
+            ({"a": 1, "b": 500, "c": 20}, 10, 100, [(500, ["b"]), (21, ["c", "a"])]),
+            ({"a": 60, "b": 50, "c": 40, "d": 20}, 10, 100, [(60, ["a"]), (90, ["b", "c"]), (20, ["d"])]),
+            ({}, 10, 100, []),
+        ]
+    )
+    def test_plan_batches(self, costs, batch_size, batch_cost_limit, expected):
+        assert plan_batches(list(costs), costs, batch_size, batch_cost_limit) == expected
+
+    @pytest.mark.parametrize(
+        "result,expected",
+        [
+            (({"192.0.2.0/24"}, {"2001:db8::/32", "2001:db8:1::/48"}), 3),
+            ([64496, 64497], 2),
+            (["AS-FOO"], 1),
+            (None, 1),
+        ]
+    )
+    def test_result_cost(self, result, expected):
+        assert get_result_cost(result) == expected
+
+    def test_query_costs(self, tmp_path):
+        path = tmp_path / "irrd_costs.json"
+        costs = QueryCosts(path)
+        costs.update("asSetPrefixes|AS-FOO|ipVersion=4,6", ({"192.0.2.0/24"}, set()))
+        costs.save()
+
+        assert QueryCosts(path).get("asSetPrefixes|AS-FOO|ipVersion=4,6") == 1
+        assert QueryCosts(path).get("asSetPrefixes|AS-BAR|ipVersion=4,6") == 1
+        assert QueryCosts().get("anything") == 1
+
+        path.write_text("{")
+        assert QueryCosts(path).costs == {}
+
+    def test_limiter_order(self):
+        limiter = AdaptiveLimiter(max_in_flight=1)
+        order = []
+
+        async def run(name, cost):
+            await limiter.acquire(cost)
+            order.append(name)
+            await asyncio.sleep(0)
+            limiter.release(0)
+
+        async def main():
+            await asyncio.gather(run("small", 1), run("big", 100), run("medium", 10))
+
+        asyncio.run(main())
+        assert order == ["big", "medium", "small"]
+
+    def test_limiter_adapts(self):
+        limiter = AdaptiveLimiter(max_in_flight=8, latency_threshold=1)
+
+        async def main():
+            for _ in range(4):
+                await limiter.acquire()
+            limiter.release(0.1, failed=True)
+            assert limiter.limit == 4
+            limiter.release(5)
+            assert limiter.limit == 2
+            limiter.release(0.1)
+            limiter.release(0.1)
+            assert limiter.limit == 4
+            assert limiter.in_flight == 0
+
+        asyncio.run(main())
+
+    def test_rate_limiter(self):
+        rate_limiter = RateLimiter(max_rps=50)
+
+        async def main():
+            start = time.monotonic()
+            for _ in range(6):
+                await rate_limiter.acquire()
+            return time.monotonic() - start
+
+        assert asyncio.run(main()) >= 0.09
+
+    def test_expensive_sets_first(self, mocker, tmp_path):
+        irrd_client = IRRDClient(irrd_url="rr.example.com", batch_size=1)
+        sizes = {f"AS-SET{i}": i for i in range(6)}
+        calls = []
+
+        def generate_prefix_lists_bulk(irr_names):
+            calls.extend(irr_names)
+            return {irr_name: ({f"192.0.2.{n}/32" for n in range(sizes[irr_name])}, set()) for irr_name in irr_names}
+
+        mocker.patch.object(irrd_client, 'generate_prefix_lists_bulk', side_effect=generate_prefix_lists_bulk)
+
+        for _ in range(2):
+            calls.clear()
+            costs = QueryCosts(tmp_path / "irrd_costs.json")
+            async_irrd_client = AsyncIRRDClient(irrd_client, max_in_flight=1, costs=costs)
+            try:
+                asyncio.run(async_irrd_client.generate_prefix_lists_bulk(list(sizes)))
+            finally:
+                async_irrd_client.close()
+            costs.save()
+
+        assert calls == [f"AS-SET{i}" for i in reversed(range(6))]
@@ -0,0 +1,93 @@
+import io
+
+import pytest
+
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.bgp_device_group.bgp_device_group import BGPDeviceGroup
+from wanda.junos_config import parse_filter_groups, quote, write_bgp_groups, write_filter_groups
+
+FILTER_GROUPS = {
+    "AS64500": {
+        "origin_asns": [64500, 64501],
+        "v4_prefixes": PrefixSet.from_prefixes(["192.0.2.0/24"], 4),
+        "v6_prefixes": PrefixSet(6),
+    },
+    "AS64502": {"origin_asns": [64502]},
+}
+
+
+def write(write_function, document, config_format):
+    output_file = io.StringIO()
+    write_function(document, output_file, config_format)
+    return output_file.getvalue()
+
+
+@pytest.mark.unit
+class TestJunosConfig:
+
+    def test_quote(self):
+        assert quote("AS64500") == "AS64500"
+        assert quote(64500) == "64500"
+        assert quote(".* 64500") == '".* 64500"'
+        assert quote('$9$a"b') == '"$9$a\\"b"'
+
+    def test_filter_groups_text(self):
+        config = write(write_filter_groups, FILTER_GROUPS, "text")
+
+        assert config.startswith("policy-options {\n    as-path-group AS64500 {\n")
+        assert '        as-path AS64501 ".* 64501";\n' in config
+        assert "    prefix-list AS64500_V4 {\n        192.0.2.0/24;\n    }\n" in config
+        assert "    prefix-list AS64500_V6 {\n    }\n" in config
+        assert "                prefix-list-filter AS64500_V4 orlonger;\n" in config
+        assert "    policy-statement POLICY_AS64502_V6 {\n" in config
+        assert "AS64502_V4 orlonger" not in config
+        assert config.endswith("        then {\n            reject;\n        }\n    }\n}\n")
+        assert config.count("{") == config.count("}")
+
+    def test_filter_groups_set(self):
+        config = write(write_filter_groups, {"AS64500": FILTER_GROUPS["AS64500"]}, "set")
+
+        assert config.splitlines() == [
+            'set policy-options as-path-group AS64500 as-path AS64500 ".* 64500"',
+            'set policy-options as-path-group AS64500 as-path AS64501 ".* 64501"',
+            "set policy-options prefix-list AS64500_V4 192.0.2.0/24",
+            "set policy-options policy-statement POLICY_AS64500_V4 term FILTER_LISTS from as-path-group AS64500",
+            "set policy-options policy-statement POLICY_AS64500_V4 term FILTER_LISTS from prefix-list-filter AS64500_V4 orlonger",
+            "set policy-options policy-statement POLICY_AS64500_V4 term FILTER_LISTS then next policy",
+            "set policy-options policy-statement POLICY_AS64500_V4 then reject",
+            # Empty lists are created nonetheless, the policy references them.
+            "set policy-options prefix-list AS64500_V6",
+            "set policy-options policy-statement POLICY_AS64500_V6 term FILTER_LISTS from as-path-group AS64500",
+            "set policy-options policy-statement POLICY_AS64500_V6 term FILTER_LISTS from prefix-list-filter AS64500_V6 orlonger",
+            "set policy-options policy-statement POLICY_AS64500_V6 term FILTER_LISTS then next policy",
+            "set policy-options policy-statement POLICY_AS64500_V6 then reject",
+        ]
+
+    def test_route_filters(self):
+        config = write(write_filter_groups, {"AS64500": {"origin_asns": [64500], "v4_route_filters": ["192.0.2.0/23 prefix-length-range /24-/24"]}}, "set")
+
+        assert "set policy-options route-filter-list AS64500_V4 192.0.2.0/23 prefix-length-range /24-/24\n" in config
+        assert "set policy-options policy-statement POLICY_AS64500_V4 term FILTER_LISTS from route-filter-list AS64500_V4\n" in config
+
+    def test_bgp_groups(self):
+        bgp_device_group = BGPDeviceGroup(name="CUSTOMER_EXAMPLE_V6", asn=64500, ip_version=6, max_prefixes=100, policy_type="customer",
+                                          bfd_infos={"min_interval": 300, "multiplier": 3})
+        bgp_device_group.append_neighbor("2001:db8::1/64", "2001:db8::2/64")
+        transit_group = BGPDeviceGroup(name="UPSTREAM_EXAMPLE_V4", asn=64501, ip_version=4, max_prefixes=None, policy_type="transit")
+
+        config = write(write_bgp_groups, [bgp_device_group, transit_group], "set").splitlines()
+
+        assert config[:4] == [
+            "set protocols bgp group CUSTOMER_EXAMPLE_V6 type external",
+            "set protocols bgp group CUSTOMER_EXAMPLE_V6 import [ FILTER_BOGONS_V6 FILTER_OWN_V6 BOGON_ASN_FILTERING TIER1_FILTERING RPKI_FILTERING POLICY_AS64500_V6 CUSTOMER_IMPORT_V6 ]",
+            "set protocols bgp group CUSTOMER_EXAMPLE_V6 family inet6 unicast prefix-limit maximum 100",
+            "set protocols bgp group CUSTOMER_EXAMPLE_V6 export [ CUSTOMER_EXPORT_V6 ]",
+        ]
+        assert "set protocols bgp group CUSTOMER_EXAMPLE_V6 bfd-liveness-detection minimum-interval 300" in config
+        assert "set protocols bgp group CUSTOMER_EXAMPLE_V6 neighbor 2001:db8::1" in config
+        assert "set protocols bgp group UPSTREAM_EXAMPLE_V4 family inet unicast" in config
+
+    def test_parse_filter_groups(self):
+        for config_format in ["text", "set"]:
+            content = write(write_filter_groups, FILTER_GROUPS, config_format).encode()
+            assert parse_filter_groups(content) == {"AS64500": None, "AS64502": None}
@@ -0,0 +1,99 @@
+import io
+import json
+
+import pytest
+import yaml
+
+from wanda.as_filter.prefix_aggregation import compress_route_filters
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda.bgp_device_group.bgp_device_group import BGPDeviceGroup
+from wanda.output_emitter import BlockEmitter, UnsupportedValue, dump_yaml, load_yaml, to_plain, write_json
+
+FILTER_GROUPS = {
+    "AS64500": {
+        "origin_asns": [64500, 64501],
+        "v4_prefixes": PrefixSet.from_prefixes(["198.51.100.0/24", "192.0.2.0/24"], 4),
+        "v6_prefixes": PrefixSet.from_prefixes(["2001:db8::/32", "::/0"], 6),
+    },
+    "AS9136": {
+        "origin_asns": [9136],
+        "v4_route_filters": compress_route_filters(["192.0.2.0/24", "192.0.2.0/25", "192.0.2.128/25"], 4),
+        "v6_route_filters": [],
+    },
+    "AS64502": {
+        "origin_asns": [64502],
+        "v4_prefixes": PrefixSet(4),
+        "v6_prefixes": PrefixSet(6),
+    },
+}
+
+bgp_device_group = BGPDeviceGroup(
+    name="PEERING_EXAMPLE-IX_A-VERY-LONG-NETWORK-NAME_V4",
+    asn=64500,
+    ip_version=4,
+    max_prefixes=100,
+    authentication_key="secret",
+    import_routing_policies=[{"name": "POLICY-A", "weight": 0}],
+    bfd_infos={"min_interval": 300, "multiplier": 3},
+)
+bgp_device_group.append_neighbor("192.0.2.1", "192.0.2.2")
+
+BGP_DEVICE_GROUPS = {
+    "junos__generated_device_bgp_groups": {
+        group["name"]: group for group in [bgp_device_group.to_junos()]
+    }
+}
+
+
+def reference_yaml(document):
+    return yaml.dump(to_plain(document), default_flow_style=False)
+
+
+@pytest.mark.unit
+class TestOutputEmitter:
+
+    @pytest.mark.parametrize(
+        "document",
+        [
+            FILTER_GROUPS,
+            BGP_DEVICE_GROUPS,
+            {},
+            {"a": {}, "b": [], "c": None, "d": True, "e": [{}], "f": [{"x": {"y": [1]}, "w": 2}]},
+        ]
+    )
+    def test_fast_path(self, document):
+        assert "".join(BlockEmitter().iter_document(document)) == reference_yaml(document)
+
+    @pytest.mark.parametrize(
+        "document",
+        [
+            {"ON": 1},
+            {"a": "yes"},
+            {"a": "#comment"},
+            {"a": "1000"},
+            {"a": 1.5},
+            {"a": "word " * 20},
+            {"a": [[1]]},
+        ]
+    )
+    def test_fallback(self, document):
+        with pytest.raises(UnsupportedValue):
+            "".join(BlockEmitter().iter_document(document))
+        assert dump_yaml(document) == reference_yaml(document)
+
+    def test_aliases(self):
+        origin_asns = [64500]
+        document = {"AS64500": {"origin_asns": origin_asns}, "AS64501": {"origin_asns": origin_asns}}
+
+        assert dump_yaml(document) == reference_yaml(document)
+        assert "*id001" in dump_yaml(document)
+
+    def test_load_yaml(self):
+        assert load_yaml(dump_yaml(FILTER_GROUPS).encode())["AS64500"]["v6_prefixes"] == ["::/0", "2001:db8::/32"]
+
+    @pytest.mark.parametrize("indent", [2, 4])
+    def test_json(self, indent):
+        output = io.StringIO()
+        write_json(FILTER_GROUPS, output, indent)
+
+        assert output.getvalue() == json.dumps(to_plain(FILTER_GROUPS), indent=indent)
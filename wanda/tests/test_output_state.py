@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from wanda.as_filter.prefix_set import PrefixSet
+from wanda import output_state
+from wanda.output_state import OutputState, get_input_hash, write_atomic, write_output
+
+
+@pytest.mark.unit
+class TestOutputState:
+
+    def test_input_hash(self):
+        filter_list = {"origin_asns": [64500], "v4_prefixes": PrefixSet.from_prefixes(["192.0.2.0/24"], 4)}
+        same_filter_list = {"v4_prefixes": PrefixSet.from_prefixes({"192.0.2.0/24"}, 4), "origin_asns": [64500]}
+        other_filter_list = {"origin_asns": [64500], "v4_prefixes": PrefixSet.from_prefixes(["192.0.2.0/25"], 4)}
+
+        assert get_input_hash("junos", filter_list) == get_input_hash("junos", same_filter_list)
+        assert get_input_hash("junos", filter_list) != get_input_hash("junos", other_filter_list)
+        assert get_input_hash("junos", filter_list) != get_input_hash("rtbrick", filter_list)
+        assert get_input_hash({64501, 64500}) == get_input_hash([64500, 64501])
+
+    def test_input_hash_includes_format_version(self, monkeypatch):
+        input_hash = get_input_hash("junos", {"origin_asns": [64500]})
+        monkeypatch.setattr(output_state, "OUTPUT_FORMAT_VERSION", output_state.OUTPUT_FORMAT_VERSION + 1)
+
+        assert get_input_hash("junos", {"origin_asns": [64500]}) != input_hash
+
+    def test_write(self, tmp_path):
+        state_path = tmp_path / "outputs.json"
+        output_path = str(tmp_path / "generated_vars" / "filter_groups-edge1.example.net.yml")
+
+        output_state = OutputState(state_path)
+        assert not output_state.is_current(output_path, "a")
+        output_state.write("edge1.example.net", output_path, "AS64500: {}\n", "a")
+        output_state.write("edge1.example.net", output_path + ".bgp", "{}\n", "a")
+        output_state.save()
+
+        assert output_state.changed_routers == ["edge1.example.net"]
+        with open(output_path, "r") as output_file:
+            assert output_file.read() == "AS64500: {}\n"
+
+        output_state = OutputState(state_path)
+        assert output_state.is_current(output_path, "a")
+        assert not output_state.is_current(output_path, "b")
+
+        # Regenerated with new inputs but the same content, the file is not touched.
+        stat = os.stat(output_path)
+        output_state.write("edge1.example.net", output_path, "AS64500: {}\n", "b")
+        assert output_state.changed_routers == []
+        assert os.stat(output_path).st_mtime_ns == stat.st_mtime_ns
+        assert output_state.is_current(output_path, "b")
+
+        with open(output_path, "a") as output_file:
+            output_file.write("# edited\n")
+        assert not output_state.is_current(output_path, "b")
+
+        output_state.write("edge1.example.net", output_path, "AS64500: {}\n", "b")
+        assert output_state.changed_routers == ["edge1.example.net"]
+        assert not [name for name in os.listdir(tmp_path / "generated_vars") if name.endswith(".tmp")]
+
+    def test_unreadable_state(self, tmp_path):
+        state_path = tmp_path / "outputs.json"
+        state_path.write_text("{")
+
+        assert OutputState(state_path).outputs == {}
+
+    @pytest.mark.parametrize("write", [write_output, write_atomic])
+    def test_failed_write(self, tmp_path, write):
+        output_path = tmp_path / "filter_groups-edge1.example.net.yml"
+        output_path.write_text("AS64500: {}\n")
+
+        def content(output_file):
+            output_file.write("AS64501:")
+            raise ValueError("malformed entry")
+
+        with pytest.raises(ValueError):
+            write(str(output_path), content)
+
+        # The old file is kept and no temp file is left behind.
+        assert output_path.read_text() == "AS64500: {}\n"
+        assert os.listdir(tmp_path) == [output_path.name]
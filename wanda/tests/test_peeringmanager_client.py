@@ -1,8 +1,14 @@
 import ipaddress
+import random
+import threading
 import pytest
 import os
+import time
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 from wanda.peeringmanager_client import PeeringManagerClient
+from wanda.peeringmanager_snapshot import PeeringManagerSnapshot
 
 
 @pytest.mark.integration
@@ -52,3 +58,347 @@ class TestPeeringManagerClient:
     def test_routing_policies(self, peeringmanager_instance):
         routing_policies = peeringmanager_instance.get_routing_policies()
         assert isinstance(routing_policies, list)
+
+
+class FakeResponse:
+
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakePaginatedSession:
+
+    # Serves objects like the Peering Manager API, capping the page size at max_limit.
+
+    def __init__(self, objects, max_limit=1000):
+        self.objects = objects
+        self.max_limit = max_limit
+        self.requests = []
+        self.pool_size = 4
+        self.session = self
+
+    def get(self, url, headers=None, params=None):
+        if params is None:
+            base_url, _, query = url.partition("?")
+            params = dict(parameter.split("=") for parameter in query.split("&"))
+        else:
+            base_url = url
+        limit = min(int(params["limit"]), self.max_limit)
+        offset = int(params["offset"])
+        self.requests.append((limit, offset))
+
+        next_url = None
+        if offset + limit < len(self.objects):
+            next_url = f"{base_url}?limit={limit}&offset={offset + limit}"
+
+        return FakeResponse({
+            "count": len(self.objects),
+            "next": next_url,
+            "results": self.objects[offset:offset + limit],
+        })
+
+
+@pytest.mark.unit
+class TestPeeringManagerClientPagination:
+
+    @pytest.mark.parametrize(
+        "object_count,page_size,max_limit,expected_requests",
+        [
+            (0, 10, 1000, 1),
+            (10, 10, 1000, 1),
+            (23, 5, 1000, 5),
+            (23, 50, 10, 3),
+        ]
+    )
+    def test_make_request_list(self, object_count, page_size, max_limit, expected_requests):
+        objects = [{"id": object_id} for object_id in random.sample(range(1000), object_count)]
+        http_session = FakePaginatedSession(objects, max_limit=max_limit)
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session, page_size=page_size)
+
+        results = pm.make_request_list("/api/devices/routers/")
+
+        assert results == sorted(objects, key=lambda x: x["id"])
+        assert len(http_session.requests) == expected_requests
+        assert http_session.requests[0] == (min(page_size, max_limit), 0)
+
+    def test_objects_added_while_fetching(self):
+        objects = [{"id": object_id} for object_id in range(12)]
+        http_session = FakePaginatedSession(objects)
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session, page_size=5)
+
+        original_get = http_session.get
+
+        def get(url, headers=None, params=None):
+            response = original_get(url, headers=headers, params=params)
+            if len(http_session.requests) == 1:
+                objects.extend({"id": object_id} for object_id in range(12, 20))
+            return response
+
+        http_session.get = get
+
+        results = pm.make_request_list("/api/devices/routers/")
+
+        assert [result["id"] for result in results] == list(range(20))
+
+    def test_requests_are_limited_to_the_pool_size(self):
+        objects = [{"id": object_id} for object_id in range(40)]
+        http_session = FakePaginatedSession(objects)
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session, page_size=5)
+
+        lock = threading.Lock()
+        in_flight = [0, 0]
+        original_get = http_session.get
+
+        def get(url, headers=None, params=None):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight[1], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            return original_get(url, headers=headers, params=params)
+
+        http_session.get = get
+
+        # Several lists are fetched at once, like the generation stages do.
+        with ThreadPool(processes=3) as pool:
+            results = pool.map(lambda url: pm.make_request_list(url), ["/api/a/", "/api/b/", "/api/c/"])
+
+        assert all(len(result) == 40 for result in results)
+        assert 1 < in_flight[1] <= http_session.pool_size
+
+
+class FakeFilteringSession:
+
+    # Serves the objects of every endpoint in one page, applying the Peering Manager filters used by wanda.
+
+    FILTERS = {
+        "router_id": lambda o: o["router"]["id"],
+        "ixp_connection_id": lambda o: o["ixp_connection"]["id"],
+        "id": lambda o: o["id"],
+    }
+
+    def __init__(self, endpoints):
+        self.endpoints = endpoints
+        self.requests = []
+        self.pool_size = 4
+        self.session = self
+
+    def get(self, url, headers=None, params=None):
+        path = url.replace("http://pm.example", "")
+        filters = {key: value for key, value in params.items() if key in self.FILTERS}
+        self.requests.append((path, filters))
+
+        results = [
+            o for o in self.endpoints[path]
+            if all(self.FILTERS[key](o) in values for key, values in filters.items())
+        ]
+        return FakeResponse({"count": len(results), "next": None, "results": results})
+
+
+@pytest.mark.unit
+class TestPeeringManagerClientRouterScope:
+
+    @pytest.fixture
+    def http_session(self):
+        return FakeFilteringSession({
+            "/api/devices/routers/": [{"id": 1, "hostname": "r1.example"}, {"id": 2, "hostname": "r2.example"}],
+            "/api/net/connections/": [{"id": 10, "router": {"id": 1}}, {"id": 20, "router": {"id": 2}}],
+            "/api/peering/internet-exchange-peering-sessions/": [
+                {"id": 100, "ixp_connection": {"id": 10}, "autonomous_system": {"id": 1000}},
+                {"id": 200, "ixp_connection": {"id": 20}, "autonomous_system": {"id": 2000}},
+            ],
+            "/api/peering/direct-peering-sessions/": [
+                {"id": 300, "router": {"id": 1}, "autonomous_system": {"id": 3000}},
+                {"id": 400, "router": {"id": 2}, "autonomous_system": {"id": 4000}},
+            ],
+            "/api/peering/autonomous-systems/": [{"id": asn_id} for asn_id in [1000, 2000, 3000, 4000]],
+        })
+
+    def test_router_scope(self, http_session):
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session)
+        pm.set_router_scope(["r1.example", "unknown.example"])
+
+        assert [c["id"] for c in pm.get_connections()] == [10]
+        assert [s["id"] for s in pm.get_internet_exchange_peerings()] == [100]
+        assert [s["id"] for s in pm.get_direct_peerings()] == [300]
+        assert [a["id"] for a in pm.get_autonomous_systems()] == [1000, 3000]
+        assert ("/api/peering/autonomous-systems/", {"id": [1000, 3000]}) in http_session.requests
+
+    def test_unknown_hosts(self, http_session):
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session)
+        pm.set_router_scope(["unknown.example"])
+
+        assert pm.get_autonomous_systems() == []
+        assert [path for path, _ in http_session.requests] == ["/api/devices/routers/"]
+
+    def test_without_scope(self, http_session):
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session)
+
+        assert len(pm.get_autonomous_systems()) == 4
+        assert http_session.requests == [("/api/peering/autonomous-systems/", {})]
+
+    def test_lists_are_fetched_once(self, http_session):
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session)
+        pm.set_router_scope(["r1.example"])
+
+        # Slow responses let the threads ask for the same list while it is still being fetched.
+        original_get = http_session.get
+
+        def get(url, headers=None, params=None):
+            time.sleep(0.01)
+            return original_get(url, headers=headers, params=params)
+
+        http_session.get = get
+
+        getters = [pm.get_autonomous_systems, pm.get_direct_peerings, pm.get_internet_exchange_peerings,
+                   pm.get_connections] * 4
+        with ThreadPool(processes=len(getters)) as pool:
+            pool.map(lambda getter: getter(), getters)
+
+        paths = [path for path, _ in http_session.requests]
+        assert sorted(paths) == sorted(set(paths))
+
+    def test_empty_lists_are_cached(self, http_session):
+        http_session.endpoints["/api/net/connections/"] = []
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session)
+
+        assert pm.get_connections() == []
+        assert pm.get_connections() == []
+        assert http_session.requests == [("/api/net/connections/", {})]
+
+
+class FakeSyncSession:
+
+    # Serves one endpoint, supporting the brief listing, last_updated__gte and id filters.
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.requests = []
+        self.pool_size = 4
+        self.session = self
+
+    def get(self, url, headers=None, params=None):
+        self.requests.append({key: value for key, value in params.items() if key not in ["limit", "offset"]})
+
+        results = list(self.objects.values())
+        if "last_updated__gte" in params:
+            since = datetime.fromisoformat(params["last_updated__gte"])
+            results = [o for o in results if datetime.fromisoformat(o["last_updated"]) >= since]
+        if "id" in params:
+            results = [o for o in results if o["id"] in params["id"]]
+        if "brief" in params:
+            results = [{"id": o["id"]} for o in results]
+
+        return FakeResponse({"count": len(results), "next": None, "results": results})
+
+
+@pytest.mark.unit
+class TestPeeringManagerClientSnapshot:
+
+    @staticmethod
+    def make_object(object_id, minute, name="router"):
+        return {"id": object_id, "name": name, "last_updated": f"2026-01-01T10:{minute:02d}:00+00:00"}
+
+    def test_incremental_sync(self, tmp_path):
+        objects = {object_id: self.make_object(object_id, 0 if object_id < 5 else 20) for object_id in range(1, 6)}
+        http_session = FakeSyncSession(objects)
+        snapshot_path = tmp_path / "peeringmanager.sqlite3"
+
+        def make_client(refresh=False):
+            return PeeringManagerClient(
+                "http://pm.example", "token", http_session=http_session,
+                snapshot=PeeringManagerSnapshot(snapshot_path, refresh=refresh),
+            )
+
+        assert make_client().get_routers() == sorted(objects.values(), key=lambda o: o["id"])
+        assert http_session.requests == [{}]
+
+        # One object changed, one was deleted, one was created and one appeared with an old timestamp.
+        objects[2] = self.make_object(2, 30, name="renamed")
+        del objects[3]
+        objects[7] = self.make_object(7, 40)
+        objects[6] = self.make_object(6, 0)
+        http_session.requests.clear()
+
+        routers = make_client().get_routers()
+
+        assert routers == sorted(objects.values(), key=lambda o: o["id"])
+        assert http_session.requests == [
+            {"brief": "true"},
+            {"last_updated__gte": "2026-01-01T10:15:00+00:00"},
+            {"id": [6]},
+        ]
+
+        http_session.requests.clear()
+        assert make_client().get_routers() == routers
+        assert http_session.requests[1] == {"last_updated__gte": "2026-01-01T10:35:00+00:00"}
+
+        http_session.requests.clear()
+        assert make_client(refresh=True).get_routers() == routers
+        assert http_session.requests == [{}]
+
+    def test_without_last_updated(self, tmp_path):
+        http_session = FakeSyncSession({1: {"id": 1}})
+        snapshot = PeeringManagerSnapshot(tmp_path / "peeringmanager.sqlite3")
+
+        for _ in range(2):
+            pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session, snapshot=snapshot)
+            assert pm.get_routers() == [{"id": 1}]
+
+        assert http_session.requests == [{}, {}]
+
+    def test_nested_objects_follow_synced_lists(self, tmp_path):
+        def updated(minute):
+            return f"2026-01-01T10:{minute:02d}:00+00:00"
+
+        endpoints = {
+            "/api/devices/routers/": {1: {"id": 1, "hostname": "r1.example", "last_updated": updated(0)}},
+            "/api/net/connections/": {10: {"id": 10, "ipv4_address": "192.0.2.1/24", "router": {"id": 1, "hostname": "r1.example"}, "last_updated": updated(0)}},
+            "/api/peering/autonomous-systems/": {1000: {"id": 1000, "asn": 64500, "ipv4_max_prefixes": 10, "irr_as_set": "AS-EXAMPLE", "last_updated": updated(0)}},
+            "/api/peering/internet-exchange-peering-sessions/": {100: {
+                "id": 100, "last_updated": updated(0),
+                "ixp_connection": {"id": 10, "ipv4_address": "192.0.2.1/24"},
+                "autonomous_system": {"id": 1000, "asn": 64500, "ipv4_max_prefixes": 10},
+            }},
+            "/api/peering/direct-peering-sessions/": {300: {
+                "id": 300, "last_updated": updated(0),
+                "router": {"id": 1, "hostname": "r1.example"},
+                "autonomous_system": {"id": 1000, "asn": 64500, "ipv4_max_prefixes": 10},
+            }},
+            "/api/peering/routing-policies/": {},
+        }
+        sessions = {path: FakeSyncSession(objects) for path, objects in endpoints.items()}
+
+        class EndpointSession:
+            pool_size = 4
+            session = None
+
+            def get(self, url, headers=None, params=None):
+                return sessions[url.replace("http://pm.example", "")].get(url, headers, params)
+
+        http_session = EndpointSession()
+        http_session.session = http_session
+        snapshot = PeeringManagerSnapshot(tmp_path / "peeringmanager.sqlite3")
+        PeeringManagerClient("http://pm.example", "token", http_session=http_session, snapshot=snapshot).get_index()
+
+        # The AS, the connection and the router change, the sessions themselves do not.
+        endpoints["/api/devices/routers/"][1].update(hostname="r1-new.example", last_updated=updated(30))
+        endpoints["/api/net/connections/"][10].update(ipv4_address="192.0.2.2/24", last_updated=updated(30))
+        endpoints["/api/peering/autonomous-systems/"][1000].update(ipv4_max_prefixes=20, last_updated=updated(30))
+
+        pm = PeeringManagerClient("http://pm.example", "token", http_session=http_session, snapshot=snapshot)
+        peering_index = pm.get_index()
+        ix_peering = pm.get_internet_exchange_peerings()[0]
+        direct_peering = pm.get_direct_peerings()[0]
+
+        assert ix_peering["ixp_connection"] == {"id": 10, "ipv4_address": "192.0.2.2/24"}
+        assert ix_peering["autonomous_system"] == {"id": 1000, "asn": 64500, "ipv4_max_prefixes": 20}
+        assert direct_peering["router"] == {"id": 1, "hostname": "r1-new.example"}
+        assert peering_index.get_connection(10)["router"]["hostname"] == "r1-new.example"
@@ -0,0 +1,111 @@
+import pytest
+
+from wanda.bgp_dg_generation import build_bgp_device_groups_for_direct_peerings, build_bgp_device_groups_for_ix_peerings
+from wanda.peeringmanager_index import PeeringManagerIndex
+
+ROUTERS = [
+    {"id": 1000, "hostname": "edge1.example.net"},
+    {"id": 1001, "hostname": "edge2.example.net"},
+]
+
+CONNECTIONS = [
+    {"id": 2000, "router": {"id": 1000}, "ipv4_address": "192.0.2.1/24", "ipv6_address": "2001:db8::1/64",
+     "internet_exchange_point": {"id": 3000, "slug": "ix-one"}},
+    {"id": 2001, "router": {"id": 1000}, "ipv4_address": "198.51.100.1/24", "ipv6_address": "2001:db8:1::1/64",
+     "internet_exchange_point": {"id": 3000, "slug": "ix-one"}},
+    {"id": 2002, "router": None, "ipv4_address": "203.0.113.1/24", "ipv6_address": "2001:db8:2::1/64",
+     "internet_exchange_point": {"id": 3001, "slug": "ix-two"}},
+]
+
+ROUTING_POLICIES = [
+    {"id": 4000, "name": "POLICY-A"},
+    {"id": 4001, "name": "POLICY-B"},
+]
+
+AUTONOMOUS_SYSTEM = {"asn": 64500, "name": "Example Networks", "ipv4_max_prefixes": 10, "ipv6_max_prefixes": 5}
+
+
+def ix_peering(peering_id, connection_id, ip_address):
+    connection = next(c for c in CONNECTIONS if c["id"] == connection_id)
+    return {
+        "id": peering_id,
+        "ixp_connection": connection,
+        "ip_address": ip_address,
+        "status": {"value": "enabled"},
+        "autonomous_system": AUTONOMOUS_SYSTEM,
+        "tags": [],
+        "is_route_server": False,
+        "import_routing_policies": [{"id": 4001}, {"id": 4999}, {"id": 4000}],
+        "export_routing_policies": [],
+    }
+
+
+def direct_peering(peering_id, router, ip_address, local_ip_address):
+    return {
+        "id": peering_id,
+        "router": router,
+        "ip_address": ip_address,
+        "local_ip_address": local_ip_address,
+        "status": {"value": "enabled"},
+        "relationship": {"slug": "customer"},
+        "autonomous_system": AUTONOMOUS_SYSTEM,
+        "tags": [],
+        "import_routing_policies": [],
+        "export_routing_policies": [{"id": 4000}],
+    }
+
+
+@pytest.mark.unit
+class TestPeeringManagerIndex:
+
+    @pytest.fixture
+    def peering_index(self):
+        return PeeringManagerIndex(
+            routers=ROUTERS,
+            connections=CONNECTIONS,
+            ix_peerings=[
+                ix_peering(5000, 2001, "198.51.100.10/24"),
+                ix_peering(5001, 2000, "192.0.2.10/24"),
+                ix_peering(5002, 2000, "2001:db8::10/64"),
+                ix_peering(5003, 2002, "203.0.113.10/24"),
+            ],
+            direct_peerings=[
+                direct_peering(6000, {"id": 1000}, "192.0.2.20/31", "192.0.2.21/31"),
+                direct_peering(6001, None, "192.0.2.22/31", "192.0.2.23/31"),
+                direct_peering(6002, {"id": 1001}, "192.0.2.24/31", "192.0.2.25/31"),
+                direct_peering(6003, {"id": 1000}, "192.0.2.26/31", "192.0.2.27/31"),
+            ],
+            routing_policies=ROUTING_POLICIES,
+        )
+
+    def test_lookups(self, peering_index):
+        router = peering_index.get_router("edge1.example.net")
+
+        assert router["id"] == 1000
+        assert peering_index.get_router("unknown.example.net") is None
+        assert [c["id"] for c in peering_index.get_router_connections(router)] == [2000, 2001]
+        assert [ix["id"] for ix in peering_index.get_ix_peerings(CONNECTIONS[0])] == [5001, 5002]
+        assert [dp["id"] for dp in peering_index.get_direct_peerings(router)] == [6000, 6003]
+        assert [dp["id"] for dp in peering_index.unattached_direct_peerings] == [6001]
+        assert peering_index.get_routing_policies([{"id": 4001}, {"id": 4999}, {"id": 4000}]) == [ROUTING_POLICIES[1], ROUTING_POLICIES[0]]
+
+    def test_ix_peering_groups(self, peering_index):
+        router = peering_index.get_router("edge1.example.net")
+        bgp_device_groups = build_bgp_device_groups_for_ix_peerings(peering_index, router)
+
+        # Sessions on both connections to the same IX share one group per address family.
+        assert [(g.name, g.ix_id) for g in bgp_device_groups] == [
+            ("PEERING_IX-ONE_EXAMPLE-NETWORKS_V4", 3000),
+            ("PEERING_IX-ONE_EXAMPLE-NETWORKS_V6", 3000),
+        ]
+        assert [n["peer"] for n in bgp_device_groups[0].neighbors] == ["192.0.2.10", "198.51.100.10"]
+        assert bgp_device_groups[0].import_routing_policies == [ROUTING_POLICIES[1], ROUTING_POLICIES[0]]
+
+    def test_direct_peering_groups(self, peering_index):
+        router = peering_index.get_router("edge1.example.net")
+        bgp_device_groups = build_bgp_device_groups_for_direct_peerings(peering_index, router)
+
+        assert len(bgp_device_groups) == 1
+        assert bgp_device_groups[0].name == "CUSTOMER_EXAMPLE-NETWORKS_V4"
+        assert [n["peer"] for n in bgp_device_groups[0].neighbors] == ["192.0.2.20", "192.0.2.26"]
+        assert bgp_device_groups[0].export_routing_policies == [ROUTING_POLICIES[0]]
@@ -0,0 +1,73 @@
+import ipaddress
+import random
+
+import pytest
+
+from wanda.as_filter.prefix_aggregation import collapse_prefixes, compress_route_filters
+
+
+def parse_route_filter(route_filter):
+    prefix, match_type, *args = route_filter.split(" ")
+    network = ipaddress.ip_network(prefix)
+    max_length = network.max_prefixlen
+
+    match match_type:
+        case "orlonger":
+            return network, network.prefixlen, max_length
+        case "exact":
+            return network, network.prefixlen, network.prefixlen
+        case "upto":
+            return network, network.prefixlen, int(args[0][1:])
+        case "prefix-length-range":
+            min_length, range_max_length = args[0].split("-")
+            return network, int(min_length[1:]), int(range_max_length[1:])
+
+
+def matches(route, entries):
+    return any(route.subnet_of(network) and min_length <= route.prefixlen <= max_length for network, min_length, max_length in entries)
+
+
+@pytest.mark.unit
+class TestPrefixAggregation:
+
+    @pytest.mark.parametrize(
+        "prefixes,ip_version,expected",
+        [
+            (["203.0.113.0/24", "203.0.113.128/25", "198.51.100.0/24"], 4, ["198.51.100.0/24", "203.0.113.0/24"]),
+            (["2001:db8::a/32", "2001:db8:1::/48", "2001:db9::/32"], 6, ["2001:db8::/32", "2001:db9::/32"]),
+            (["10.0.0.0/8", "9.0.0.0/8"], 4, ["9.0.0.0/8", "10.0.0.0/8"]),
+        ]
+    )
+    def test_collapse_prefixes(self, prefixes, ip_version, expected):
+        assert collapse_prefixes(prefixes, ip_version) == expected
+
+    @pytest.mark.parametrize(
+        "prefixes,ip_version,expected",
+        [
+            (["203.0.112.0/24", "203.0.113.0/24"], 4, ["203.0.112.0/23 prefix-length-range /24-/32"]),
+            (["203.0.112.0/24", "203.0.113.0/24", "203.0.114.0/24", "203.0.115.0/24"], 4, ["203.0.112.0/22 prefix-length-range /24-/32"]),
+            (["203.0.112.0/24", "203.0.114.0/24"], 4, ["203.0.112.0/24 orlonger", "203.0.114.0/24 orlonger"]),
+            (["203.0.112.0/23", "203.0.114.0/24", "203.0.115.0/24"], 4, ["203.0.112.0/23 orlonger", "203.0.114.0/23 prefix-length-range /24-/32"]),
+            (["192.0.2.1/32"], 4, ["192.0.2.1/32 orlonger"]),
+            (["2001:db8::/48", "2001:db8:1::/48"], 6, ["2001:db8::/47 prefix-length-range /48-/128"]),
+        ]
+    )
+    def test_compress_route_filters(self, prefixes, ip_version, expected):
+        assert compress_route_filters(prefixes, ip_version) == expected
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_compress_route_filters_matches_same_routes(self, seed):
+        rng = random.Random(seed)
+        universe = ipaddress.ip_network("10.0.0.0/20")
+        prefixes = [
+            str(rng.choice(list(universe.subnets(new_prefix=length))))
+            for length in rng.choices(range(20, 27), k=60)
+        ]
+
+        original = [(ipaddress.ip_network(p), ipaddress.ip_network(p).prefixlen, 32) for p in prefixes]
+        compressed = [parse_route_filter(f) for f in compress_route_filters(prefixes, 4)]
+
+        assert len(compressed) <= len(set(prefixes))
+        for length in range(18, 29):
+            for route in ipaddress.ip_network("10.0.0.0/19").subnets(new_prefix=length) if length >= 19 else [ipaddress.ip_network(f"10.0.0.0/{length}")]:
+                assert matches(route, original) == matches(route, compressed)
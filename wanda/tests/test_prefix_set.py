@@ -0,0 +1,60 @@
+import ipaddress
+import random
+
+import pytest
+
+from wanda.as_filter.prefix_set import PrefixSet
+
+
+@pytest.mark.unit
+class TestPrefixSet:
+
+    @pytest.mark.parametrize(
+        "prefixes,ip_version,expected",
+        [
+            (["9.0.0.0/8", "10.0.0.0/8", "100.64.0.0/10", "10.0.0.0/16"], 4, ["9.0.0.0/8", "10.0.0.0/8", "10.0.0.0/16", "100.64.0.0/10"]),
+            (["203.0.113.0/24", "203.0.113.0/24"], 4, ["203.0.113.0/24"]),
+            (["2001:db8::a/32", "2001:db8:1::/48", "2001:db8::/32"], 6, ["2001:db8::/32", "2001:db8::a/32", "2001:db8:1::/48"]),
+            (["::/0", "ffff::/16", "2001:db8::1/128"], 6, ["::/0", "2001:db8::1/128", "ffff::/16"]),
+            ([], 6, []),
+        ]
+    )
+    def test_numeric_order(self, prefixes, ip_version, expected):
+        prefix_set = PrefixSet.from_prefixes(prefixes, ip_version)
+
+        assert list(prefix_set) == expected
+        assert len(prefix_set) == len(expected)
+
+    @pytest.mark.parametrize("ip_version", [4, 6])
+    def test_random_round_trip(self, ip_version):
+        rng = random.Random(ip_version)
+        max_length = 32 if ip_version == 4 else 128
+        addresses = [
+            ipaddress.ip_address(rng.getrandbits(max_length) if ip_version == 6 else rng.getrandbits(32))
+            for _ in range(500)
+        ]
+        prefixes = {f"{address}/{rng.randint(0, max_length)}" for address in addresses}
+
+        prefix_set = PrefixSet.from_prefixes(prefixes, ip_version)
+
+        assert list(prefix_set) == sorted(prefixes, key=lambda p: (int(ipaddress.ip_address(p.split("/")[0])), int(p.split("/")[1])))
+        assert prefix_set == prefixes
+        assert PrefixSet.from_bytes(prefix_set.to_bytes(), ip_version) == prefix_set
+
+    def test_union(self):
+        first = PrefixSet.from_prefixes(["203.0.113.0/24", "198.51.100.0/24"], 4)
+        second = {"192.0.2.0/24", "203.0.113.0/24"}
+
+        union = PrefixSet.union([first, second], 4)
+
+        assert union == ["192.0.2.0/24", "198.51.100.0/24", "203.0.113.0/24"]
+        assert PrefixSet.union([first], 4) is first
+        assert len(PrefixSet.union([], 4)) == 0
+
+    def test_equality(self):
+        prefix_set = PrefixSet.from_prefixes(["2001:db8::/32"], 6)
+
+        assert prefix_set == PrefixSet.from_prefixes({"2001:db8::/32"}, 6)
+        assert prefix_set == {"2001:db8::/32"}
+        assert prefix_set != PrefixSet.from_prefixes(["2001:db8::/48"], 6)
+        assert prefix_set != "2001:db8::/32"
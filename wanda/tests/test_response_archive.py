@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from wanda.http_session import PooledSession
+from wanda.irrd_client import IRRDClient
+from wanda.response_archive import ResponseArchive
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    request_count = 0
+
+    def respond(self, data):
+        EchoHandler.request_count += 1
+        body = gzip.compress(json.dumps(data).encode())
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond({"path": self.path})
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["query"]
+        self.respond({"data": {"q0_v4": [{"prefixes": ["192.0.2.0/24"]}], "q0_v6": [], "query_length": len(query)}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.mark.unit
+class TestResponseArchive:
+
+    @pytest.fixture
+    def server_url(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+        server.shutdown()
+        server.server_close()
+
+    def test_record_and_replay(self, tmp_path, server_url):
+        recording = PooledSession(archive=ResponseArchive(tmp_path, "record"))
+        recorded = [
+            recording.session.get(f"{server_url}/api/devices/routers/", params={"limit": 10, "offset": offset}).json()
+            for offset in [0, 10]
+        ]
+        recorded_post = recording.session.post(f"{server_url}/graphql/", json={"query": "{ a }"}).json()
+
+        assert len([name for name in os.listdir(tmp_path) if name.endswith(".gz")]) == 3
+        request_count = EchoHandler.request_count
+
+        replaying = PooledSession(archive=ResponseArchive(tmp_path, "replay"))
+        replayed = [
+            replaying.session.get(f"{server_url}/api/devices/routers/", params={"limit": 10, "offset": offset}).json()
+            for offset in [0, 10]
+        ]
+
+        assert replayed == recorded
+        assert replaying.session.post(f"{server_url}/graphql/", json={"query": "{ a }"}).json() == recorded_post
+        assert EchoHandler.request_count == request_count
+        assert replaying.get_connection_stats() == {"new": 0, "reused": 0}
+
+        with pytest.raises(Exception, match="No recorded response"):
+            replaying.session.post(f"{server_url}/graphql/", json={"query": "{ b }"})
+
+    def test_irrd_client_replay(self, tmp_path, server_url):
+        irrd_url = server_url.replace("http://", "")
+
+        recording_client = IRRDClient(irrd_url, http_session=PooledSession(archive=ResponseArchive(tmp_path, "record")))
+        recording_client.irrdURL = f"{server_url}/graphql/"
+        recorded = recording_client.generate_prefix_lists_bulk(["AS-FOO"])
+
+        replay_client = IRRDClient(irrd_url, http_session=PooledSession(archive=ResponseArchive(tmp_path, "replay")))
+        replay_client.irrdURL = f"{server_url}/graphql/"
+
+        assert replay_client.generate_prefix_lists_bulk(["AS-FOO"]) == recorded
+
+    def test_metadata(self, tmp_path):
+        ResponseArchive(tmp_path, "record").write_metadata({"irrd_url": "rr.example.com"})
+
+        assert ResponseArchive(tmp_path, "replay").read_metadata() == {"irrd_url": "rr.example.com"}
+
+    def test_missing_archive(self, tmp_path):
+        with pytest.raises(Exception):
+            ResponseArchive(tmp_path / "missing", "replay")
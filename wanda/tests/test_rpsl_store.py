@@ -0,0 +1,169 @@
+import gzip
+
+import pytest
+
+from wanda.local_irrd_client import LocalIRRDClient
+from wanda.rpsl_store import RPSLStore, parse_rpsl_objects
+
+RPSL_DUMP = """\
+% This is a dump of the TEST database
+
+as-set:         AS-WOBCOM
+descr:          Customers # trailing comment
+members:        AS9136, AS-FOO,
+                AS-BAR
++               AS64496
+mbrs-by-ref:    MNT-FOO
+mnt-by:         MNT-WOBCOM
+source:         TEST
+
+as-set:         as-foo
+members:        AS64500, AS-WOBCOM
+source:         TEST
+
+as-set:         AS-BAR
+members:        AS-BAZ
+source:         TEST
+
+as-set:         AS-BAZ
+members:        AS64510
+source:         TEST
+
+inetnum:        192.0.2.0 - 192.0.2.255
+netname:        IGNORED
+
+aut-num:        AS64501
+member-of:      AS-WOBCOM
+mnt-by:         MNT-FOO
+source:         TEST
+
+aut-num:        AS64502
+member-of:      AS-WOBCOM
+mnt-by:         MNT-OTHER
+source:         TEST
+
+route:          192.0.2.0/24
+origin:         AS9136
+source:         TEST
+
+route:          198.51.100.0/24
+origin:         as64500
+source:         TEST
+
+route:          198.51.100.0/24
+origin:         AS64500
+source:         OTHER
+
+route6:         2001:db8::/32
+origin:         AS9136
+source:         TEST
+
+route:          203.0.113.0/24
+origin:         AS64510
+source:         TEST
+
+route:          203.0.113.128/25
+origin:         AS64501
+source:         TEST
+"""
+
+
+@pytest.fixture
+def rpsl_dump(tmp_path):
+    dump_path = tmp_path / "test.db.gz"
+    with gzip.open(dump_path, "wt") as dump_file:
+        dump_file.write(RPSL_DUMP)
+    return dump_path
+
+
+@pytest.fixture
+def rpsl_store(tmp_path, rpsl_dump):
+    store = RPSLStore(tmp_path / "cache" / "irr_dumps.sqlite3")
+    store.load([rpsl_dump])
+    return store
+
+
+@pytest.mark.unit
+class TestRPSLStore:
+
+    def test_parse_rpsl_objects(self):
+        objects = list(parse_rpsl_objects(RPSL_DUMP.splitlines(keepends=True)))
+
+        assert [object_class for object_class, _ in objects].count("inetnum") == 0
+        as_set = objects[0][1]
+        assert as_set["as-set"] == ["AS-WOBCOM"]
+        assert as_set["members"] == ["AS9136, AS-FOO, AS-BAR AS64496"]
+        assert as_set["descr"] == ["Customers"]
+        assert objects[-1] == ("route", {"route": ["203.0.113.128/25"], "origin": ["AS64501"], "source": ["TEST"]})
+
+    def test_direct_members(self, rpsl_store):
+        members = rpsl_store.get_direct_members(["AS-WOBCOM", "AS-FOO", "AS-UNKNOWN"])
+
+        # AS64502 is maintained by a maintainer that is not accepted by mbrs-by-ref.
+        assert sorted(members["AS-WOBCOM"]) == ["AS-BAR", "AS-FOO", "AS64496", "AS64501", "AS9136"]
+        assert sorted(members["AS-FOO"]) == ["AS-WOBCOM", "AS64500"]
+        assert members["AS-UNKNOWN"] == []
+
+    @pytest.mark.parametrize(
+        "set_name,depth,expected",
+        [
+            ("AS-WOBCOM", None, {9136, 64496, 64500, 64501, 64510}),
+            ("AS-WOBCOM", 1, {9136, 64496, 64501}),
+            ("AS-WOBCOM", 2, {9136, 64496, 64500, 64501}),
+            ("as-foo", None, {9136, 64496, 64500, 64501, 64510}),
+            ("AS208395", None, {208395}),
+            ("AS-UNKNOWN", None, set()),
+        ]
+    )
+    def test_recursive_asns(self, rpsl_store, set_name, depth, expected):
+        assert rpsl_store.get_recursive_asns(set_name, depth) == expected
+
+    def test_prefixes(self, rpsl_store):
+        prefixes = rpsl_store.get_prefixes([9136, 64500])
+
+        assert sorted(prefixes["v4"]) == ["192.0.2.0/24", "198.51.100.0/24"]
+        assert prefixes["v6"] == ["2001:db8::/32"]
+
+    def test_load_reuses_store(self, mocker, tmp_path, rpsl_dump, rpsl_store):
+        build_spy = mocker.spy(RPSLStore, 'build')
+
+        RPSLStore(rpsl_store.path).load([tmp_path])
+        assert build_spy.call_count == 0
+
+        with gzip.open(rpsl_dump, "wt") as dump_file:
+            dump_file.write(RPSL_DUMP.replace("AS64510", "AS64511"))
+        store = RPSLStore(rpsl_store.path)
+        store.load([rpsl_dump])
+
+        assert build_spy.call_count == 1
+        assert store.get_recursive_asns("AS-BAZ") == {64511}
+
+    def test_missing_dump(self, tmp_path):
+        with pytest.raises(Exception):
+            RPSLStore(tmp_path / "irr_dumps.sqlite3").load([tmp_path / "missing.db.gz"])
+
+
+@pytest.mark.unit
+class TestLocalIRRDClient:
+
+    def test_bulk_queries(self, rpsl_store):
+        irrd_client = LocalIRRDClient(rpsl_store)
+
+        prefix_lists = irrd_client.generate_prefix_lists_bulk(["AS-WOBCOM", "AS-BAZ"])
+        assert prefix_lists["AS-WOBCOM"] == (
+            {"192.0.2.0/24", "198.51.100.0/24", "203.0.113.0/24", "203.0.113.128/25"},
+            {"2001:db8::/32"},
+        )
+        assert prefix_lists["AS-BAZ"] == ({"203.0.113.0/24"}, set())
+
+        assert irrd_client.generate_prefix_lists_for_asns_bulk([9136])[9136] == ({"192.0.2.0/24"}, {"2001:db8::/32"})
+        assert sorted(irrd_client.generate_input_aspath_access_list(9136, "AS-BAR")) == [64510]
+        assert irrd_client.get_direct_set_members_bulk(["as-bar"]) == {"as-bar": ["AS-BAZ"]}
+
+    def test_no_network(self, rpsl_store):
+        irrd_client = LocalIRRDClient(rpsl_store)
+
+        with pytest.raises(Exception):
+            irrd_client.fetch_graphql_data("{ databaseStatus { source } }")
+        assert irrd_client.get_connection_stats() == {"new": 0, "reused": 0}
+        assert irrd_client.get_cache_stats() is None
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from wanda.worker_pool import run_jobs
+
+
+def scale(factor, job):
+    if job < 0:
+        raise Exception(f"Negative job {job}")
+    return job * factor, os.getpid()
+
+
+@pytest.mark.unit
+class TestWorkerPool:
+
+    @pytest.mark.parametrize("processes", [1, 2, 8])
+    def test_run_jobs(self, processes):
+        jobs = [3, -1, 5, 7, -2, 11]
+        results = list(run_jobs(scale, jobs, 2, processes))
+
+        # Results keep the order of the jobs, failing jobs do not stop the others.
+        assert [job for job, _, _ in results] == jobs
+        assert [result[0] for _, result, error in results if not error] == [6, 10, 14, 22]
+        assert [str(error) for _, _, error in results if error] == ["Negative job -1", "Negative job -2"]
+
+    def test_inline(self):
+        # A single process runs the jobs without starting a pool.
+        ((_, (_, pid), _),) = run_jobs(scale, [1], 2, 4)
+        assert pid == os.getpid()
+
+        assert list(run_jobs(scale, [], 2, 4)) == []
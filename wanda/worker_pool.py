@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+
+DEFAULT_JOBS = os.cpu_count() or 1
+
+# Set in every worker process by init_worker.
+worker_func = None
+worker_context = None
+
+
+def init_worker(func, context):
+    global worker_func, worker_context
+    worker_func = func
+    worker_context = context
+
+
+def run_job(job):
+    # A failing job is reported back instead of taking the pool down, so the other jobs still finish.
+    # Only the result goes back to the parent, it still has the job.
+    try:
+        return worker_func(worker_context, job), None
+    except Exception as e:
+        return None, e
+
+
+def run_jobs(func, jobs, context, processes=DEFAULT_JOBS):
+    # Yields (job, result, error) for every job in the order of the jobs.
+    # func(context, job) runs on a process pool. The context is handed to every worker once, forked workers inherit it
+    # without pickling, so large data belongs into the context and jobs should only reference it.
+    processes = min(max(int(processes), 1), len(jobs))
+
+    if processes <= 1:
+        init_worker(func, context)
+        for job in jobs:
+            yield job, *run_job(job)
+        return
+
+    with multiprocessing.Pool(processes=processes, initializer=init_worker, initargs=(func, context)) as pool:
+        for job, (result, error) in zip(jobs, pool.imap(run_job, jobs)):
+            yield job, result, error